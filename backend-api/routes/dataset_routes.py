@@ -3,9 +3,10 @@ Dataset Management API Routes
 Admin endpoints for uploading, managing, and versioning ML training datasets
 """
 
-from flask import Blueprint, request, jsonify, send_file
+from flask import Blueprint, request, jsonify, send_file, Response, stream_with_context
 from werkzeug.utils import secure_filename
 import os
+import json
 import tempfile
 import shutil
 from pathlib import Path
@@ -24,6 +25,25 @@ def allowed_file(filename: str) -> bool:
     """Check if file extension is allowed"""
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def upload_metadata() -> dict:
+    """Collect the optional per-upload metadata fields from the form"""
+    return {
+        key: request.form.get(key)
+        for key in ('region', 'season', 'severity', 'crop_type', 'notes')
+        if key in request.form
+    }
+
+def save_uploads(temp_dir: str) -> List[str]:
+    """Save the uploaded image files to temp_dir"""
+    temp_files = []
+    for file in request.files.getlist('files'):
+        if file and allowed_file(file.filename):
+            filename = secure_filename(file.filename)
+            filepath = os.path.join(temp_dir, filename)
+            file.save(filepath)
+            temp_files.append(filepath)
+    return temp_files
+
 @dataset_bp.route('/upload', methods=['POST'])
 @token_required
 def upload_images(current_user):
@@ -51,32 +71,14 @@ def upload_images(current_user):
         return jsonify({"error": "class_name is required"}), 400
     
     # Get optional metadata
-    metadata = {}
-    if 'region' in request.form:
-        metadata['region'] = request.form.get('region')
-    if 'season' in request.form:
-        metadata['season'] = request.form.get('season')
-    if 'severity' in request.form:
-        metadata['severity'] = request.form.get('severity')
-    if 'crop_type' in request.form:
-        metadata['crop_type'] = request.form.get('crop_type')
-    if 'notes' in request.form:
-        metadata['notes'] = request.form.get('notes')
-    
-    files = request.files.getlist('files')
+    metadata = upload_metadata()
     
     # Create temp directory for uploads
     temp_dir = tempfile.mkdtemp()
-    temp_files = []
     
     try:
         # Save uploaded files to temp directory
-        for file in files:
-            if file and allowed_file(file.filename):
-                filename = secure_filename(file.filename)
-                filepath = os.path.join(temp_dir, filename)
-                file.save(filepath)
-                temp_files.append(filepath)
+        temp_files = save_uploads(temp_dir)
         
         if not temp_files:
             return jsonify({"error": "No valid image files provided"}), 400
@@ -104,6 +106,51 @@ def upload_images(current_user):
         # Cleanup temp directory
         shutil.rmtree(temp_dir, ignore_errors=True)
 
+@dataset_bp.route('/upload/stream', methods=['POST'])
+@token_required
+def upload_images_stream(current_user):
+    """
+    Upload images to staging, streaming each image's result as it finishes
+    
+    Expects the same form fields as /upload
+    
+    Returns:
+    - NDJSON stream: one line per image (status added/rejected/duplicate),
+      then a summary line
+    """
+    if current_user.get('role') != 'admin':
+        return jsonify({"error": "Admin access required"}), 403
+    
+    if 'files' not in request.files:
+        return jsonify({"error": "No files provided"}), 400
+    
+    class_name = request.form.get('class_name')
+    if not class_name:
+        return jsonify({"error": "class_name is required"}), 400
+    
+    metadata = upload_metadata()
+    temp_dir = tempfile.mkdtemp()
+    temp_files = save_uploads(temp_dir)
+    
+    if not temp_files:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        return jsonify({"error": "No valid image files provided"}), 400
+    
+    def generate():
+        counts = {"added": 0, "rejected": 0, "duplicate": 0}
+        try:
+            for result in dataset_manager.ingest_images(temp_files, class_name, metadata):
+                counts[result["status"]] += 1
+                result["path"] = os.path.basename(result["path"])
+                yield json.dumps(result) + "\n"
+            yield json.dumps({"summary": {"total_attempted": len(temp_files), **counts}}) + "\n"
+        except Exception as e:
+            yield json.dumps({"error": f"Failed to process images: {str(e)}"}) + "\n"
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
 @dataset_bp.route('/staging/summary', methods=['GET'])
 @token_required
 def get_staging_summary(current_user):
@@ -149,6 +196,34 @@ def commit_staging(current_user):
             "version": version_info
         }), 200
         
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@dataset_bp.route('/blobs/gc', methods=['POST'])
+@token_required
+def garbage_collect_blobs(current_user):
+    """
+    Delete image blobs no staged or versioned image links to
+    
+    Optional:
+    - dry_run: Only report what would be removed
+    - grace_seconds: Keep blobs modified more recently (default 3600)
+    """
+    if current_user.get('role') != 'admin':
+        return jsonify({"error": "Admin access required"}), 403
+    
+    try:
+        data = request.get_json() or {}
+        results = dataset_manager.garbage_collect_blobs(
+            grace_seconds=int(data.get('grace_seconds', 3600)),
+            dry_run=bool(data.get('dry_run', False))
+        )
+        return jsonify({
+            "success": True,
+            "gc": results
+        }), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -183,6 +258,9 @@ def export_manifest(current_user):
     
     Optional:
     - version: Specific version to export (exports latest if not provided)
+    - split: Only export one split (train, val or test)
+    - base_version: Export only the images added or removed since this version
+    - format: json (default) or jsonl (one line per image)
     
     Returns:
     - Manifest file with image paths and class mappings
@@ -193,20 +271,25 @@ def export_manifest(current_user):
     try:
         data = request.get_json() or {}
         version = data.get('version')
+        manifest_format = data.get('format', 'json')
+        if manifest_format not in ('json', 'jsonl'):
+            return jsonify({"error": "format must be json or jsonl"}), 400
         
         # Create temp manifest file
-        temp_manifest = tempfile.mktemp(suffix='.json')
+        temp_manifest = tempfile.mktemp(suffix=f'.{manifest_format}')
         
         manifest_path = dataset_manager.export_training_manifest(
             output_path=temp_manifest,
-            version=version
+            version=version,
+            split=data.get('split'),
+            base_version=data.get('base_version')
         )
         
         return send_file(
             manifest_path,
-            mimetype='application/json',
+            mimetype='application/x-ndjson' if manifest_format == 'jsonl' else 'application/json',
             as_attachment=True,
-            download_name='training_manifest.json'
+            download_name=f'training_manifest.{manifest_format}'
         )
         
     except ValueError as e:
@@ -387,6 +387,30 @@ def cancel_training(current_user, experiment_id):
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@ml_admin_bp.route('/training/resume/<experiment_id>', methods=['POST'])
+@token_required
+def resume_training(current_user, experiment_id):
+    """
+    Re-queue a cancelled or failed training job to continue from its latest checkpoint
+    """
+    if current_user.get('role') != 'admin':
+        return jsonify({"error": "Admin access required"}), 403
+    
+    try:
+        success = orchestrator.resume_training(experiment_id)
+        
+        if success:
+            experiment = orchestrator.get_experiment_status(experiment_id)
+            return jsonify({
+                "success": True,
+                "resume_from": experiment.get("resume_from"),
+                "message": f"Training re-queued for {experiment_id}"
+            }), 200
+        else:
+            return jsonify({"error": "Failed to resume training"}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
 @ml_admin_bp.route('/training/compare', methods=['POST'])
 @token_required
 def compare_experiments(current_user):
@@ -420,6 +444,50 @@ def compare_experiments(current_user):
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@ml_admin_bp.route('/training/evaluate', methods=['POST'])
+@token_required
+def evaluate_experiments(current_user):
+    """
+    Champion/challenger evaluation of experiment models on one decode of the test set
+    
+    Expects:
+    - experiment_ids: List of experiment IDs
+    - dataset_path / manifest_path: Test data (default: latest dataset version)
+    - include_active_model: Add the active model as champion (default true)
+    - parallel: Evaluate the models in parallel processes (default false)
+    - batch_size: Prediction batch size (default 32)
+    
+    Returns:
+    - Side-by-side metrics and latency report
+    """
+    if current_user.get('role') != 'admin':
+        return jsonify({"error": "Admin access required"}), 403
+    
+    try:
+        data = request.get_json() or {}
+        experiment_ids = data.get('experiment_ids', [])
+        
+        if not experiment_ids:
+            return jsonify({"error": "experiment_ids required"}), 400
+        
+        report = orchestrator.evaluate_experiments(
+            experiment_ids,
+            dataset_path=data.get('dataset_path'),
+            manifest_path=data.get('manifest_path'),
+            include_active_model=data.get('include_active_model', True),
+            parallel=data.get('parallel', False),
+            batch_size=data.get('batch_size', 32)
+        )
+        
+        return jsonify({
+            "success": True,
+            "report": report
+        }), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
 @ml_admin_bp.route('/training/best-model', methods=['GET'])
 @token_required
 def get_best_model(current_user):
@@ -517,6 +585,48 @@ def create_quick_experiment(current_user):
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@ml_admin_bp.route('/training/incremental-experiment', methods=['POST'])
+@token_required
+def create_incremental_experiment(current_user):
+    """
+    Create and schedule an incremental warm-start experiment from the active model
+    
+    Expects:
+    - target_version: Dataset version to train up to (default latest)
+    - base_version: Version the active model was trained on (default from registry)
+    - replay_ratio: Replayed old images per new image (default 0.5)
+    - learning_rate: Learning rate (default 0.0001)
+    - max_epochs: Max epochs (default 5)
+    
+    Returns:
+    - Experiment ID
+    """
+    if current_user.get('role') != 'admin':
+        return jsonify({"error": "Admin access required"}), 403
+    
+    try:
+        data = request.get_json() or {}
+        
+        experiment_id = orchestrator.create_incremental_experiment(
+            target_version=data.get('target_version'),
+            base_version=data.get('base_version'),
+            replay_ratio=data.get('replay_ratio', 0.5),
+            learning_rate=data.get('learning_rate', 1e-4),
+            max_epochs=data.get('max_epochs', 5),
+            notes=data.get('notes')
+        )
+        
+        return jsonify({
+            "success": True,
+            "experiment_id": experiment_id,
+            "experiment": orchestrator.get_experiment_status(experiment_id),
+            "message": "Incremental experiment created and scheduled"
+        }), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
 # Register blueprint
 def register_ml_admin_routes(app):
     """Register ML admin routes with Flask app"""
@@ -7,6 +7,7 @@ Handles training job scheduling, experiment tracking, and model versioning
 import json
 import os
 import shutil
+import socket
 import subprocess
 from datetime import datetime
 from pathlib import Path
@@ -15,6 +16,21 @@ from enum import Enum
 import threading
 import time
 
+
+def _pid_alive(pid: int) -> bool:
+    """Check whether a process exists on this host"""
+    if os.name == "nt":
+        # os.kill() would terminate it; assume it is still running
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
 class TrainingStatus(Enum):
     PENDING = "pending"
     RUNNING = "running"
@@ -43,6 +59,10 @@ class RetrainingOrchestrator:
         # Training queue
         self.training_queue = []
         self.current_training = None
+        self._processes = {}
+        
+        # Jobs left RUNNING by a previous process were interrupted
+        self._recover_interrupted()
     
     def _load_experiments(self) -> Dict:
         """Load experiment history"""
@@ -56,6 +76,99 @@ class RetrainingOrchestrator:
         with open(self.experiments_file, 'w') as f:
             json.dump(self.experiments, f, indent=2)
     
+    def _latest_checkpoint(self, experiment_id: str) -> Optional[str]:
+        """Get the newest complete training checkpoint of an experiment"""
+        checkpoint_dir = self.experiments_dir / experiment_id / "checkpoints"
+        if not checkpoint_dir.exists():
+            return None
+        
+        # train.py writes <stage>-<epoch> directories; state.json marks them complete
+        checkpoints = [
+            d for d in checkpoint_dir.iterdir()
+            if not d.name.startswith('.') and (d / "state.json").exists()
+        ]
+        if not checkpoints:
+            return None
+        return str(max(checkpoints, key=lambda d: d.stat().st_mtime))
+    
+    def _resolve_dataset_path(self, config: Dict) -> Path:
+        """
+        Get the disease_images/ tree train.py reads for a config
+        An explicit "dataset_path" wins; otherwise dataset_version names a
+        committed DatasetManager version under dataset/versions
+        """
+        if config.get("dataset_path"):
+            dataset_path = Path(config["dataset_path"])
+        else:
+            dataset_path = self.base_path / "dataset" / "versions" / config["dataset_version"]
+            if not dataset_path.is_dir():
+                raise ValueError(f"Dataset version {config['dataset_version']} not found")
+        
+        # DatasetManager versions are flat <class>/ directories, which only the
+        # incremental (manifest) mode can train on
+        if not (dataset_path / "disease_images").is_dir():
+            raise ValueError(
+                f"{dataset_path} has no disease_images/<disease>/<species> tree; "
+                "set dataset_path in the config or use an incremental experiment"
+            )
+        return dataset_path.absolute()
+    
+    def _requeue(self, experiment: Dict):
+        """Return an experiment to the queue so it resumes from its checkpoint"""
+        experiment["status"] = TrainingStatus.PENDING.value
+        experiment["resume_count"] = experiment.get("resume_count", 0) + 1
+        experiment["resume_from"] = self._latest_checkpoint(experiment["experiment_id"])
+        experiment["completed_at"] = None
+        experiment["error"] = None
+        experiment.pop("owner", None)
+        
+        if experiment["experiment_id"] not in self.training_queue:
+            self.training_queue.append(experiment["experiment_id"])
+            priorities = {e["experiment_id"]: e["priority"] for e in self.experiments["experiments"]}
+            self.training_queue.sort(key=lambda x: priorities.get(x, 999), reverse=True)
+    
+    def _owner_alive(self, experiment: Dict) -> bool:
+        """Check whether the orchestrator or train process running an experiment still exists"""
+        owner = experiment.get("owner")
+        if not owner:
+            # Started before owners were recorded
+            return False
+        if owner["host"] != socket.gethostname():
+            # Only the owning host can tell; leave the job to it
+            return True
+        return any(_pid_alive(pid) for pid in (owner["pid"], owner.get("training_pid")) if pid)
+    
+    def _recover_interrupted(self):
+        """Re-queue experiments whose orchestrator and training process are gone"""
+        recovered = [
+            e for e in self.experiments["experiments"]
+            if e["status"] == TrainingStatus.RUNNING.value and not self._owner_alive(e)
+        ]
+        for experiment in recovered:
+            self._requeue(experiment)
+            print(f"Re-queued interrupted experiment {experiment['experiment_id']} "
+                  f"(checkpoint: {experiment['resume_from'] or 'none'})")
+        
+        if recovered:
+            self._save_experiments()
+    
+    def resume_training(self, experiment_id: str) -> bool:
+        """
+        Re-queue a cancelled or failed experiment
+        Training continues from its latest checkpoint
+        Returns True if re-queued
+        """
+        experiment = self._get_experiment(experiment_id)
+        if not experiment:
+            return False
+        
+        if experiment["status"] not in (TrainingStatus.CANCELLED.value, TrainingStatus.FAILED.value):
+            return False
+        
+        self._requeue(experiment)
+        self._save_experiments()
+        return True
+    
     def create_training_config(
         self,
         config_name: str,
@@ -169,6 +282,8 @@ class RetrainingOrchestrator:
         # Update status
         experiment["status"] = TrainingStatus.RUNNING.value
         experiment["started_at"] = datetime.now().isoformat()
+        # Lets another orchestrator tell a live job from an interrupted one
+        experiment["owner"] = {"host": socket.gethostname(), "pid": os.getpid(), "training_pid": None}
         self._save_experiments()
         
         # Start training in background thread
@@ -207,6 +322,37 @@ class RetrainingOrchestrator:
                     "config": config
                 }, f, indent=2)
             
+            # train.py reads the dataset from --dataset_path, never from the config
+            hyperparameters = config.get("hyperparameters", {})
+            incremental = hyperparameters.get("mode") == "incremental"
+            dataset_path = None if incremental else self._resolve_dataset_path(config)
+            
+            # Bring the preprocessed image cache up to date with the dataset
+            # train.py reads; the cache is looked up by image path, so it
+            # must sync that same directory
+            image_cache_dir = self.base_path / "cache" / "images"
+            cache_synced = False
+            if dataset_path is not None:
+                sync = subprocess.run(
+                    [
+                        "python",
+                        str(self.base_path / "image_cache.py"),
+                        "sync",
+                        "--dataset_path", str(dataset_path),
+                        "--cache", str(image_cache_dir)
+                    ],
+                    capture_output=True,
+                    text=True
+                )
+                cache_synced = sync.returncode == 0
+                if not cache_synced:
+                    # A stale or partial cache must not be trained on; train
+                    # from the dataset files instead
+                    with open(exp_dir / "stderr.log", 'a') as f:
+                        f.write(f"[image_cache sync exited with {sync.returncode}]\n{sync.stderr}")
+                    experiment["image_cache_error"] = sync.stderr[-1000:]
+                    print(f"Image cache sync failed for {experiment_id}; training without the cache")
+            
             # Build training command
             train_script = self.base_path / "train.py"
             
@@ -215,31 +361,76 @@ class RetrainingOrchestrator:
                 str(train_script),
                 "--config", str(config_file),
                 "--output_dir", str(exp_dir),
+                "--dataset_path", str(dataset_path),
                 "--max_epochs", str(experiment["max_epochs"]),
                 "--early_stopping_patience", str(experiment["early_stopping_patience"])
             ]
+            if cache_synced:
+                experiment.pop("image_cache_error", None)
+                cmd.extend(["--image_cache_dir", str(image_cache_dir)])
             
             if experiment["gpu_required"]:
                 cmd.extend(["--gpu", "true"])
             
-            # Run training
-            print(f"Starting training for {experiment_id}...")
+            # The CPU profile is opt-in, and so is bfloat16 under it, since
+            # it changes the numerics; mixed_precision is "auto", "bfloat16" or "off"
+            if hyperparameters.get("cpu_profile", False):
+                cmd.extend([
+                    "--cpu_profile",
+                    "--mixed_precision", hyperparameters.get("mixed_precision", "off")
+                ])
+            
+            env = None
+            cwd = None
+            if incremental:
+                # Warm-start the serving model on the version delta + replay sample
+                cmd = ["python", str((self.base_path / "train_modular_model.py").absolute())]
+                env = dict(os.environ)
+                env.update({
+                    "MODEL_TYPE": config["architecture"],
+                    "INCREMENTAL_MANIFEST": str(Path(hyperparameters["manifest"]).absolute()),
+                    "BASE_MODEL_PATH": str(Path(hyperparameters["base_model_path"]).absolute()),
+                    "INCREMENTAL_EPOCHS": str(experiment["max_epochs"]),
+                    "INCREMENTAL_LR": str(hyperparameters.get("learning_rate", 1e-4)),
+                    "MODEL_OUTPUT_PATH": str((exp_dir / "best_model.h5").absolute()),
+                    # Same checkpoint and metrics locations as train.py
+                    "CHECKPOINT_DIR": str((exp_dir / "checkpoints").absolute()),
+                    "METRICS_OUTPUT_PATH": str((exp_dir / "metrics.json").absolute())
+                })
+                cwd = str(self.base_path)
+            
+            # Run training; train.py resumes from the latest checkpoint
+            # in exp_dir/checkpoints, so restarts don't lose finished epochs
+            if experiment.get("resume_from"):
+                print(f"Resuming training for {experiment_id} from {experiment['resume_from']}...")
+            else:
+                print(f"Starting training for {experiment_id}...")
             process = subprocess.Popen(
                 cmd,
                 stdout=subprocess.PIPE,
                 stderr=subprocess.PIPE,
-                text=True
+                text=True,
+                env=env,
+                cwd=cwd
             )
+            self._processes[experiment_id] = process
+            experiment["owner"]["training_pid"] = process.pid
+            self._save_experiments()
             
             stdout, stderr = process.communicate()
             
-            # Save logs
-            with open(exp_dir / "stdout.log", 'w') as f:
+            # Save logs (appended, so earlier attempts are kept)
+            with open(exp_dir / "stdout.log", 'a') as f:
                 f.write(stdout)
-            with open(exp_dir / "stderr.log", 'w') as f:
+            with open(exp_dir / "stderr.log", 'a') as f:
                 f.write(stderr)
             
-            if process.returncode == 0:
+            experiment["latest_checkpoint"] = self._latest_checkpoint(experiment_id)
+            
+            if experiment["status"] == TrainingStatus.CANCELLED.value:
+                # Terminated by cancel_training(); resume_training() continues it
+                print(f"Training cancelled for {experiment_id}")
+            elif process.returncode == 0:
                 # Training successful
                 experiment["status"] = TrainingStatus.COMPLETED.value
                 experiment["completed_at"] = datetime.now().isoformat()
@@ -270,6 +461,7 @@ class RetrainingOrchestrator:
             print(f"Training error for {experiment_id}: {str(e)}")
         
         finally:
+            self._processes.pop(experiment_id, None)
             self._save_experiments()
             self.current_training = None
     
@@ -313,9 +505,14 @@ class RetrainingOrchestrator:
             return True
         
         if experiment["status"] == TrainingStatus.RUNNING.value:
-            # In production, would kill training process
             experiment["status"] = TrainingStatus.CANCELLED.value
+            experiment["completed_at"] = datetime.now().isoformat()
             self._save_experiments()
+            
+            # Checkpoints written so far are kept for resume_training()
+            process = self._processes.get(experiment_id)
+            if process is not None and process.poll() is None:
+                process.terminate()
             return True
         
         return False
@@ -325,7 +522,12 @@ class RetrainingOrchestrator:
         experiment_ids: List[str],
         metric: str = "val_accuracy"
     ) -> Dict:
-        """Compare metrics across experiments"""
+        """
+        Compare metrics across experiments
+        Metrics with bootstrap confidence intervals (e.g. test_accuracy) also
+        report whether the leader's interval clears the runner-up's, i.e.
+        whether the difference is more than test-set noise
+        """
         comparison = {
             "metric": metric,
             "experiments": []
@@ -338,6 +540,7 @@ class RetrainingOrchestrator:
                     "experiment_id": exp_id,
                     "status": exp["status"],
                     "metric_value": exp["metrics"].get(metric),
+                    "metric_ci": exp["metrics"].get(f"{metric}_ci"),
                     "config": exp["config_name"],
                     "completed_at": exp["completed_at"]
                 })
@@ -348,8 +551,103 @@ class RetrainingOrchestrator:
             reverse=True
         )
         
+        ranked = comparison["experiments"]
+        if len(ranked) >= 2 and ranked[0]["metric_ci"] and ranked[1]["metric_ci"]:
+            comparison["leader_significant"] = ranked[0]["metric_ci"][0] > ranked[1]["metric_ci"][1]
+        else:
+            comparison["leader_significant"] = None
+        
         return comparison
     
+    def evaluate_experiments(
+        self,
+        experiment_ids: List[str],
+        dataset_path: Optional[str] = None,
+        manifest_path: Optional[str] = None,
+        include_active_model: bool = True,
+        parallel: bool = False,
+        batch_size: int = 32
+    ) -> Dict:
+        """
+        Champion/challenger evaluation of experiment models on one shared test set
+        The test split is decoded once and every model (plus the active model
+        as champion) is run over the same batches, so the metrics are directly
+        comparable; each experiment gets the result recorded under "evaluations"
+        Without dataset_path or manifest_path, the test split of the latest
+        dataset version is exported from DatasetManager
+        Returns the comparison report
+        """
+        candidates = {}
+        for exp_id in experiment_ids:
+            exp = self._get_experiment(exp_id)
+            if not exp:
+                raise ValueError(f"Experiment {exp_id} not found")
+            if not exp.get("model_path"):
+                raise ValueError(f"Experiment {exp_id} has no trained model")
+            candidates[exp_id] = exp["model_path"]
+        
+        if include_active_model:
+            from services.model_performance_tracker import ModelPerformanceTracker
+            active_model = ModelPerformanceTracker().get_active_model()
+            if active_model:
+                candidates["champion"] = active_model["path"]
+        
+        if len(candidates) < 2:
+            raise ValueError("At least two models are needed for a comparison")
+        
+        comparison_id = f"cmp_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        comparisons_dir = self.experiments_dir / "comparisons"
+        comparisons_dir.mkdir(exist_ok=True)
+        report_file = comparisons_dir / f"{comparison_id}.json"
+        
+        if not dataset_path and not manifest_path:
+            from services.dataset_manager import DatasetManager
+            manifest_path = DatasetManager(str(self.base_path / "dataset")).export_training_manifest(
+                str(comparisons_dir / f"{comparison_id}_test_manifest.jsonl"),
+                split="test"
+            )
+        
+        cmd = [
+            "python",
+            str(self.base_path / "compare_models.py"),
+            "--batch_size", str(batch_size),
+            "--output", str(report_file)
+        ]
+        cmd += ["--manifest", str(manifest_path)] if manifest_path else ["--dataset_path", str(dataset_path)]
+        for name, path in candidates.items():
+            cmd += ["--model", f"{name}={path}"]
+        if parallel:
+            cmd.append("--parallel")
+        
+        result = subprocess.run(cmd, capture_output=True, text=True)
+        if result.returncode != 0 or not report_file.exists():
+            raise RuntimeError(f"Model comparison failed: {result.stderr[-1000:]}")
+        
+        with open(report_file, 'r') as f:
+            report = json.load(f)
+        report["comparison_id"] = comparison_id
+        report["report_path"] = str(report_file)
+        
+        for exp_id in experiment_ids:
+            model_result = report["models"][exp_id]
+            self._get_experiment(exp_id).setdefault("evaluations", []).append({
+                "comparison_id": comparison_id,
+                "report_path": str(report_file),
+                "evaluated_at": report["created_at"],
+                "rank": report["ranking"].index(exp_id) + 1,
+                "compared_with": [name for name in candidates if name != exp_id],
+                "metrics": {
+                    task: {k: v for k, v in metrics.items()
+                           if k not in ("classification_report", "confusion_matrix")}
+                    for task, metrics in model_result.get("metrics", {}).items()
+                },
+                "latency": model_result.get("latency"),
+                "error": model_result.get("error")
+            })
+        self._save_experiments()
+        
+        return report
+    
     def get_best_model(self, metric: str = "val_accuracy") -> Optional[Dict]:
         """Get the best performing model based on metric"""
         completed = [
@@ -376,7 +674,7 @@ class RetrainingOrchestrator:
         Check if model should be retrained based on criteria
         Returns recommendation
         """
-        from backend-api.services.model_performance_tracker import ModelPerformanceTracker
+        from services.model_performance_tracker import ModelPerformanceTracker
         
         tracker = ModelPerformanceTracker()
         
@@ -456,6 +754,69 @@ class RetrainingOrchestrator:
         
         return experiment_id
 
+    def create_incremental_experiment(
+        self,
+        target_version: Optional[str] = None,
+        base_version: Optional[str] = None,
+        replay_ratio: float = 0.5,
+        learning_rate: float = 1e-4,
+        max_epochs: int = 5,
+        notes: Optional[str] = None
+    ) -> str:
+        """
+        Create and schedule an incremental warm-start experiment
+        Starts from the active registered model and trains on the images added
+        since base_version (default: the active model's training dataset) plus
+        a replay sample of older data
+        Returns experiment_id
+        """
+        from services.model_performance_tracker import ModelPerformanceTracker
+        from services.dataset_manager import DatasetManager
+        
+        active_model = ModelPerformanceTracker().get_active_model()
+        if not active_model:
+            raise ValueError("No active model to warm-start from")
+        
+        base_version = base_version or active_model["training_dataset"]
+        config_name = f"incremental_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        
+        dataset_manager = DatasetManager(str(self.base_path / "dataset"))
+        delta = dataset_manager.export_incremental_manifest(
+            str(self.config_dir / f"{config_name}_manifest.json"),
+            base_version=base_version,
+            target_version=target_version,
+            replay_ratio=replay_ratio
+        )
+        if delta["delta_images"] == 0:
+            raise ValueError(f"No new images since {base_version}")
+        
+        self.create_training_config(
+            config_name=config_name,
+            architecture=active_model["architecture"],
+            hyperparameters={
+                "mode": "incremental",
+                "batch_size": 32,
+                "learning_rate": learning_rate,
+                "replay_ratio": replay_ratio,
+                "manifest": delta["manifest_path"],
+                "base_model_path": active_model["path"]
+            },
+            dataset_version=delta["version"],
+            notes=notes
+        )
+        
+        return self.schedule_training(
+            config_name=config_name,
+            max_epochs=max_epochs,
+            metadata={
+                "mode": "incremental",
+                "parent_model_id": active_model["model_id"],
+                "base_version": base_version,
+                "delta_images": delta["delta_images"],
+                "replay_images": delta["replay_images"]
+            }
+        )
+
 # Singleton instance
 _orchestrator = None
 
@@ -0,0 +1,367 @@
+"""
+Unit Tests for the Dataset Manager service
+
+Run with: pytest tests/test_dataset_manager.py -v
+"""
+
+import json
+import os
+import sys
+
+import numpy as np
+import pytest
+from PIL import Image, ImageFilter
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from services.dataset_manager import HASH_VERSION, DatasetManager, HammingHashIndex
+
+
+def make_images(directory, count, seed=0, size=320):
+    """Write distinct, sharp test images and return their paths"""
+    directory.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    paths = []
+    for i in range(count):
+        pixels = rng.integers(0, 256, (size // 8, size // 8, 3), dtype=np.uint8)
+        path = directory / f"img_{seed}_{i:03d}.jpg"
+        Image.fromarray(pixels).resize((size, size), Image.NEAREST).save(path, quality=95)
+        paths.append(str(path))
+    return paths
+
+
+@pytest.fixture
+def legacy_dataset(tmp_path):
+    """Dataset written by the JSON-metadata DatasetManager, before splits existed"""
+    base = tmp_path / "dataset"
+    versions = base / "versions"
+    make_images(versions / "v1" / "blight", 3, seed=1)
+    make_images(versions / "v1" / "healthy", 2, seed=2)
+    make_images(versions / "v2" / "blight", 4, seed=3)
+
+    metadata = {
+        "created_at": "2024-01-01T00:00:00",
+        "versions": [
+            {
+                "name": "v1",
+                "created_at": "2024-01-01T00:00:00",
+                "classes": {
+                    "blight": {"image_count": 3, "path": str(versions / "v1" / "blight")},
+                    "healthy": {"image_count": 2, "path": str(versions / "v1" / "healthy")}
+                },
+                "total_images": 5
+            },
+            {
+                "name": "v2",
+                "created_at": "2024-01-02T00:00:00",
+                "classes": {"blight": {"image_count": 2, "path": str(versions / "v2" / "blight")}},
+                "total_images": 2
+            },
+            # Same name committed again into the same directory
+            {
+                "name": "v2",
+                "created_at": "2024-01-03T00:00:00",
+                "classes": {"blight": {"image_count": 4, "path": str(versions / "v2" / "blight")}},
+                "total_images": 4
+            }
+        ],
+        "classes": {
+            "blight": {"total_images": 9, "versions": ["v1", "v2", "v2"]},
+            "healthy": {"total_images": 2, "versions": ["v1"]}
+        },
+        "total_images": 11,
+        "last_updated": "2024-01-03T00:00:00",
+        "image_hashes": {"ffff0000ffff0000": str(versions / "v1" / "blight" / "img_1_000.jpg")}
+    }
+    with open(base / "dataset_metadata.json", 'w') as f:
+        json.dump(metadata, f)
+    return base
+
+
+class TestJsonMigration:
+    """Test migrating dataset_metadata.json into the SQLite store"""
+
+    def test_migrates_baseline_metadata(self, legacy_dataset):
+        """Versions without splits and with reused names migrate"""
+        manager = DatasetManager(str(legacy_dataset))
+
+        versions = manager.metadata["versions"]
+        assert [v["name"] for v in versions] == ["v1", "v2"]
+        assert versions[1]["total_images"] == 4
+        assert manager.metadata["classes"]["blight"]["total_images"] == 7
+        assert manager.metadata["total_images"] == 9
+        for version in versions:
+            assert sum(version["splits"].values()) == version["total_images"]
+
+        assert not (legacy_dataset / "dataset_metadata.json").exists()
+        assert (legacy_dataset / "dataset_metadata.json.migrated").exists()
+
+    def test_migration_runs_once(self, legacy_dataset):
+        """A second manager reuses the migrated store"""
+        DatasetManager(str(legacy_dataset))
+        manager = DatasetManager(str(legacy_dataset))
+        assert len(manager.metadata["versions"]) == 2
+
+    def test_migrated_versions_export(self, legacy_dataset, tmp_path):
+        """Images of migrated versions are read from the store"""
+        manager = DatasetManager(str(legacy_dataset))
+        manifest_path = manager.export_training_manifest(str(tmp_path / "v1.json"), version="v1")
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        assert len(manifest["images"]) == 5
+        assert {c["name"] for c in manifest["classes"]} == {"blight", "healthy"}
+
+
+class TestImageAnalysis:
+    """Test blur detection and perceptual hash versions"""
+
+    def test_blur_threshold(self, tmp_path):
+        """Sharp images pass at any size; blurred ones are rejected"""
+        for size in (320, 2048):
+            sharp = make_images(tmp_path / str(size), 1, seed=9, size=size)[0]
+            assert DatasetManager.analyse_image(sharp)["valid"]
+
+            blurred = str(tmp_path / f"blurred_{size}.jpg")
+            Image.open(sharp).filter(ImageFilter.GaussianBlur(size * 0.01)).save(blurred, quality=95)
+            analysis = DatasetManager.analyse_image(blurred)
+            assert analysis["metrics"]["is_blurry"]
+            assert analysis["reason"] == "Image is too blurry"
+
+    def test_rehashes_legacy_hashes(self, legacy_dataset):
+        """Hashes migrated from the JSON metadata are recomputed"""
+        manager = DatasetManager(str(legacy_dataset))
+        image_path = str(legacy_dataset / "versions" / "v1" / "blight" / "img_1_000.jpg")
+
+        assert manager.store.get_meta("hash_version") == HASH_VERSION
+        assert manager.detect_duplicate(DatasetManager.calculate_image_hash(image_path), 0) == image_path
+
+    def test_keeps_hashes_of_missing_files(self, legacy_dataset):
+        """A hash whose image is gone can't be recomputed and is kept"""
+        (legacy_dataset / "versions" / "v1" / "blight" / "img_1_000.jpg").unlink()
+        manager = DatasetManager(str(legacy_dataset))
+        assert manager.detect_duplicate("ffff0000ffff0000", 0) is not None
+
+
+class TestSplitAssignments:
+    """Test train/val/test assignments kept in the metadata store"""
+
+    def test_commit_records_splits(self, tmp_path):
+        """Per-version split counts match the committed image rows"""
+        manager = DatasetManager(str(tmp_path / "dataset"))
+        manager.add_images_to_staging(make_images(tmp_path / "src", 12, seed=4), "blight", {})
+        version = manager.commit_staging_to_dataset("v1")
+        assert version["total_images"] == 12
+
+        rows = manager.store.conn.execute(
+            "SELECT split, COUNT(*) AS n FROM images WHERE version_id IS NOT NULL GROUP BY split"
+        ).fetchall()
+        assert {row["split"]: row["n"] for row in rows} == {k: v for k, v in version["splits"].items() if v}
+        assert not (manager.versions_dir / "split_index.json").exists()
+
+    def test_assignments_never_move(self, tmp_path):
+        """Changing the split fractions keeps existing assignments"""
+        manager = DatasetManager(str(tmp_path / "dataset"), train_split=1.0, val_split=0.0)
+        with manager.store.transaction() as conn:
+            assert manager.store.split_for(conn, "blight/a.jpg", manager.assign_split("blight/a.jpg")) == "train"
+
+        manager = DatasetManager(str(tmp_path / "dataset"), train_split=0.0, val_split=0.0)
+        with manager.store.transaction() as conn:
+            assert manager.store.split_for(conn, "blight/a.jpg", manager.assign_split("blight/a.jpg")) == "train"
+            assert manager.store.split_for(conn, "blight/b.jpg", manager.assign_split("blight/b.jpg")) == "test"
+
+    def test_migrates_split_index_file(self, tmp_path):
+        """versions/split_index.json is imported once"""
+        versions_dir = tmp_path / "dataset" / "versions"
+        versions_dir.mkdir(parents=True)
+        with open(versions_dir / "split_index.json", 'w') as f:
+            json.dump({"blight/a.jpg": "val"}, f)
+
+        manager = DatasetManager(str(tmp_path / "dataset"))
+        with manager.store.transaction() as conn:
+            assert manager.store.split_for(conn, "blight/a.jpg", "train") == "val"
+        assert not (versions_dir / "split_index.json").exists()
+
+
+class TestCommitStaging:
+    """Test committing staging to a version"""
+
+    @pytest.fixture
+    def staged(self, tmp_path):
+        manager = DatasetManager(str(tmp_path / "dataset"))
+        manager.add_images_to_staging(make_images(tmp_path / "src", 6, seed=5), "blight", {})
+        return manager
+
+    def staged_rows(self, manager):
+        return manager.store.conn.execute(
+            "SELECT COUNT(*) AS n FROM images WHERE version_id IS NULL"
+        ).fetchone()["n"]
+
+    def test_commit_moves_staging(self, staged):
+        """Images move into the version and their rows follow"""
+        version = staged.commit_staging_to_dataset("v1")
+        assert version["total_images"] == 6
+        assert not list(staged.staging_dir.iterdir())
+        assert self.staged_rows(staged) == 0
+
+    def test_reused_version_name(self, staged, tmp_path):
+        """A reused name is rejected before anything moves"""
+        staged.commit_staging_to_dataset("v1")
+        staged.add_images_to_staging(make_images(tmp_path / "more", 3, seed=6), "blight", {})
+
+        with pytest.raises(ValueError):
+            staged.commit_staging_to_dataset("v1")
+        assert len(list((staged.staging_dir / "blight").glob("*.jpg"))) == 3
+        assert len(list((staged.versions_dir / "v1" / "blight").glob("*.jpg"))) == 6
+
+    def test_failed_commit_rolls_back(self, staged, monkeypatch):
+        """A failing metadata write leaves staging and the store unchanged"""
+        def fail(conn, version_stats):
+            raise RuntimeError("disk full")
+
+        monkeypatch.setattr(staged.store, "insert_version", fail)
+        with pytest.raises(RuntimeError):
+            staged.commit_staging_to_dataset("v1")
+
+        assert len(list((staged.staging_dir / "blight").glob("*.jpg"))) == 6
+        assert not (staged.versions_dir / "v1").exists()
+        assert staged.store.version_names() == []
+        assert self.staged_rows(staged) == 6
+
+        monkeypatch.undo()
+        assert staged.commit_staging_to_dataset("v1")["total_images"] == 6
+
+
+class TestBlobGarbageCollection:
+    """Test collecting content-addressed blobs"""
+
+    def test_keeps_copied_blobs(self, tmp_path, monkeypatch):
+        """Blobs staged by copy (no hardlinks) stay while a row references them"""
+        def no_hardlinks(src, dst):
+            raise OSError("hardlinks not supported")
+
+        monkeypatch.setattr(os, "link", no_hardlinks)
+        manager = DatasetManager(str(tmp_path / "dataset"))
+        manager.add_images_to_staging(make_images(tmp_path / "src", 3, seed=7), "blight", {})
+        manager.commit_staging_to_dataset("v1")
+
+        assert manager.garbage_collect_blobs(grace_seconds=0)["removed"] == 0
+
+        manager.store.conn.execute("UPDATE images SET blob = NULL")
+        assert manager.garbage_collect_blobs(grace_seconds=0)["removed"] == 3
+
+    def test_removes_unlinked_blobs(self, tmp_path):
+        """A blob goes once neither a file nor a row uses it"""
+        manager = DatasetManager(str(tmp_path / "dataset"))
+        manager.add_images_to_staging(make_images(tmp_path / "src", 2, seed=8), "blight", {})
+        assert manager.garbage_collect_blobs(grace_seconds=0)["removed"] == 0
+
+        for image in (manager.staging_dir / "blight").glob("*.jpg"):
+            image.unlink()
+        manager.store.conn.execute("DELETE FROM images")
+        assert manager.garbage_collect_blobs(grace_seconds=0)["removed"] == 2
+
+
+class TestHammingHashIndex:
+    """Test the multi-index perceptual hash lookup"""
+
+    @staticmethod
+    def brute_force(entries, value, threshold):
+        matches = [(bin(value ^ h).count("1"), key) for h, key in entries]
+        matches = [m for m in matches if m[0] <= threshold]
+        return min(matches)[0] if matches else None
+
+    def test_matches_brute_force(self, monkeypatch):
+        """Lookups agree with a linear scan, before and after merging added hashes"""
+        monkeypatch.setattr(HammingHashIndex, "MERGE_THRESHOLD", 64)
+        rng = np.random.default_rng(11)
+        entries = [(int(h), key) for key, h in enumerate(rng.integers(0, 2 ** 64, 500, dtype=np.uint64))]
+        index = HammingHashIndex(entries[:400])
+        index.add_many(entries[400:450])
+        assert index.pending
+        index.add_many(entries[450:])
+        assert not index.pending
+        assert len(index) == 500
+
+        for key in range(0, 500, 7):
+            value = entries[key][0]
+            for bits in ((), (3,), (1, 40), (0, 21, 42, 63), (5, 6, 7, 8, 9), tuple(range(0, 60, 10))):
+                query = value
+                for bit in bits:
+                    query ^= 1 << bit
+                match = index.nearest(query, 5)
+                expected = self.brute_force(entries, query, 5)
+                assert (match[1] if match else None) == expected
+                if len(bits) <= 5:
+                    assert match is not None
+
+    def test_detects_reencoded_duplicates(self, tmp_path):
+        """A re-encoded copy of a staged image is flagged as a duplicate"""
+        manager = DatasetManager(str(tmp_path / "dataset"))
+        originals = make_images(tmp_path / "src", 4, seed=12)
+        manager.add_images_to_staging(originals, "blight", {})
+
+        copies = []
+        for path in originals:
+            copy = str(tmp_path / ("copy_" + os.path.basename(path)))
+            Image.open(path).save(copy, quality=80)
+            copies.append(copy)
+        results = manager.add_images_to_staging(copies, "blight", {})
+        assert len(results["duplicates"]) == 4
+        assert not results["added"]
+
+
+class TestManifestDiff:
+    """Test exporting version manifests and diffs between versions"""
+
+    @pytest.fixture
+    def versioned(self, tmp_path):
+        manager = DatasetManager(str(tmp_path / "dataset"))
+        commits = (("v1", "blight", 3), ("v2", "healthy", 2), ("v3", "blight", 4))
+        for seed, (name, class_name, count) in enumerate(commits, start=20):
+            manager.add_images_to_staging(make_images(tmp_path / name, count, seed=seed), class_name, {})
+            manager.commit_staging_to_dataset(name)
+        return manager
+
+    @staticmethod
+    def read_jsonl(path):
+        with open(path) as f:
+            lines = [json.loads(line) for line in f]
+        assert lines[-1] == {"end": True, "images": len(lines) - 2}
+        return lines[0], lines[1:-1]
+
+    def test_forward_diff(self, versioned, tmp_path):
+        """Moving forward lists the images of the later versions as added"""
+        header, images = self.read_jsonl(
+            versioned.export_training_manifest(str(tmp_path / "diff.jsonl"), version="v3", base_version="v1")
+        )
+        assert header["mode"] == "diff"
+        assert header["new_classes"] == ["healthy"]
+        assert [c["name"] for c in header["classes"]] == ["blight", "healthy"]
+        assert len(images) == 6
+        assert {image["change"] for image in images} == {"added"}
+        assert {image["class"] for image in images} == {"blight", "healthy"}
+
+    def test_backward_and_empty_diff(self, versioned, tmp_path):
+        """Moving back lists the same images as removed; a version against itself is empty"""
+        _, removed = self.read_jsonl(
+            versioned.export_training_manifest(str(tmp_path / "back.jsonl"), version="v1", base_version="v3")
+        )
+        assert len(removed) == 6
+        assert {image["change"] for image in removed} == {"removed"}
+
+        _, same = self.read_jsonl(
+            versioned.export_training_manifest(str(tmp_path / "same.jsonl"), version="v2", base_version="v2")
+        )
+        assert same == []
+
+    def test_json_matches_jsonl(self, versioned, tmp_path):
+        """Both formats carry the same header and images"""
+        header, images = self.read_jsonl(
+            versioned.export_training_manifest(str(tmp_path / "v3.jsonl"), version="v3")
+        )
+        with open(versioned.export_training_manifest(str(tmp_path / "v3.json"), version="v3")) as f:
+            manifest = json.load(f)
+        assert manifest.pop("images") == images
+        assert {k: v for k, v in header.items() if k != "format"} == manifest
+        assert len(images) == 4
@@ -0,0 +1,73 @@
+"""
+Unit Tests for the ML Retraining Orchestrator service
+
+Run with: pytest tests/test_ml_retraining_orchestrator.py -v
+"""
+
+import json
+import os
+import socket
+import subprocess
+import sys
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from services.ml_retraining_orchestrator import RetrainingOrchestrator, TrainingStatus
+
+
+def dead_pid():
+    """PID of a process that has already exited"""
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+
+def write_running(base, owners):
+    """Write an experiments file with one RUNNING experiment per owner"""
+    experiments_dir = base / "experiments"
+    experiments_dir.mkdir(parents=True)
+    experiments = [
+        {
+            "experiment_id": f"exp_{i:04d}",
+            "status": TrainingStatus.RUNNING.value,
+            "priority": 5,
+            "owner": owner
+        }
+        for i, owner in enumerate(owners, start=1)
+    ]
+    for experiment in experiments:
+        if experiment["owner"] is None:
+            del experiment["owner"]
+    with open(experiments_dir / "experiments.json", 'w') as f:
+        json.dump({"experiments": experiments, "next_id": len(experiments) + 1}, f)
+
+
+class TestInterruptedRecovery:
+    """Test re-queueing of experiments left RUNNING"""
+
+    def test_recovers_only_jobs_whose_owner_is_gone(self, tmp_path):
+        """Live jobs of another orchestrator are left running"""
+        host = socket.gethostname()
+        write_running(tmp_path, [
+            {"host": host, "pid": os.getpid(), "training_pid": None},
+            {"host": host, "pid": dead_pid(), "training_pid": None},
+            {"host": host, "pid": dead_pid(), "training_pid": os.getpid()},
+            {"host": "other-" + host, "pid": dead_pid(), "training_pid": None},
+            None
+        ])
+
+        orchestrator = RetrainingOrchestrator(str(tmp_path))
+
+        statuses = {e["experiment_id"]: e["status"] for e in orchestrator.experiments["experiments"]}
+        assert statuses == {
+            "exp_0001": TrainingStatus.RUNNING.value,
+            "exp_0002": TrainingStatus.PENDING.value,
+            "exp_0003": TrainingStatus.RUNNING.value,
+            "exp_0004": TrainingStatus.RUNNING.value,
+            "exp_0005": TrainingStatus.PENDING.value
+        }
+        assert orchestrator.training_queue == ["exp_0002", "exp_0005"]
+
+        recovered = orchestrator._get_experiment("exp_0002")
+        assert "owner" not in recovered
@@ -0,0 +1,393 @@
+"""
+Synthetic-data training-step benchmark.
+
+Generates a deterministic synthetic dataset on disk (no network, no real
+images) and times a fixed number of training steps for PlantHealthModel and
+every train_modular_model.py architecture, each in a fresh process.
+Backbones are randomly initialised, so no pretrained weights are needed.
+Step time, images per second and peak memory are written as JSON, and
+--compare flags regressions against a stored baseline.
+
+Usage:
+    # Record a baseline
+    python benchmark.py --output benchmark_baseline.json
+
+    # After an upgrade: exits with status 1 on a regression
+    python benchmark.py --compare benchmark_baseline.json --output benchmark.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from importlib import metadata
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import cv2
+import numpy as np
+
+
+ARCHITECTURES = ('PlantHealthModel', 'MobileNetV2', 'EfficientNetB0', 'ResNet50')
+SPEC_FILE = "synthetic.json"
+
+
+def _synthetic_image(seed: int, index: int, image_size: Tuple[int, int], tint: np.ndarray) -> np.ndarray:
+    """Smooth random colour field with a class-dependent tint"""
+    rng = np.random.default_rng([seed, index])
+    height, width = image_size
+    coarse = rng.integers(0, 256, (8, 8, 3), dtype=np.uint8)
+    image = cv2.resize(coarse, (width, height), interpolation=cv2.INTER_CUBIC).astype(np.float32)
+    image += rng.normal(0, 8, image.shape).astype(np.float32)
+    return np.clip(0.7 * image + 0.3 * tint, 0, 255).astype(np.uint8)
+
+
+def generate_synthetic_dataset(
+    dataset_dir: str,
+    num_images: int = 512,
+    image_size: Tuple[int, int] = (224, 224),
+    num_diseases: int = 12,
+    num_species: int = 50,
+    seed: int = 0
+) -> Dict:
+    """
+    Write a deterministic synthetic dataset in the DataLoader layout.
+
+    The same arguments always produce the same files. An existing dataset
+    generated with the same arguments is reused.
+
+    Args:
+        dataset_dir: Output directory (disease_images/<disease>/<species>/)
+        num_images: Number of images
+        image_size: Image size (height, width)
+        num_diseases: Disease classes (image i has disease i % num_diseases)
+        num_species: Species classes (image i has species i % num_species)
+        seed: Random seed
+
+    Returns:
+        Dataset spec
+    """
+    dataset_dir = Path(dataset_dir)
+    spec = {
+        "num_images": num_images,
+        "image_size": list(image_size),
+        "num_diseases": num_diseases,
+        "num_species": num_species,
+        "seed": seed
+    }
+    spec_file = dataset_dir / SPEC_FILE
+
+    if spec_file.exists():
+        with open(spec_file, 'r') as f:
+            existing = json.load(f)
+        if existing == spec:
+            print(f"[BENCH] Reusing synthetic dataset in {dataset_dir}")
+            return spec
+        shutil.rmtree(dataset_dir / "disease_images", ignore_errors=True)
+        (dataset_dir / "split_index.json").unlink(missing_ok=True)
+        spec_file.unlink()
+    elif (dataset_dir / "disease_images").exists():
+        raise ValueError(f"{dataset_dir} holds a dataset that was not generated by this benchmark")
+
+    tints = np.random.default_rng(seed).integers(0, 256, (num_diseases, 3)).astype(np.float32)
+
+    def write(index):
+        disease, species = index % num_diseases, index % num_species
+        image_dir = dataset_dir / "disease_images" / f"disease_{disease:02d}" / f"species_{species:02d}"
+        image_dir.mkdir(parents=True, exist_ok=True)
+        image = _synthetic_image(seed, index, image_size, tints[disease])
+        cv2.imwrite(str(image_dir / f"img_{index:06d}.jpg"), cv2.cvtColor(image, cv2.COLOR_RGB2BGR),
+                    [cv2.IMWRITE_JPEG_QUALITY, 90])
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+        list(executor.map(write, range(num_images)))
+
+    # The spec marks the dataset complete, so it is written last
+    with open(spec_file, 'w') as f:
+        json.dump(spec, f, indent=2)
+    print(f"[BENCH] Generated {num_images} synthetic images in {dataset_dir} "
+          f"({time.perf_counter() - start:.1f}s)")
+    return spec
+
+
+def _run_architecture(
+    architecture: str,
+    dataset_dir: str,
+    image_size: Tuple[int, int],
+    batch_size: int,
+    steps: int,
+    warmup_steps: int,
+    cpu_profile: bool
+) -> Dict:
+    """Time training steps of one architecture (runs in its own process)"""
+    if cpu_profile:
+        from cpu_profile import configure_cpu_training
+        configure_cpu_training()
+
+    import tensorflow as tf
+    from data_loader import DataLoader
+    from profiling import ThroughputProfiler
+
+    loader = DataLoader(dataset_dir, image_size=image_size)
+    loader.prepare_data()
+    dataset = loader.get_tf_dataset("train", batch_size=batch_size).repeat()
+    input_shape = (*image_size, 3)
+
+    start = time.perf_counter()
+    if architecture == 'PlantHealthModel':
+        from model import PlantHealthModel
+
+        handler = PlantHealthModel(input_shape=input_shape)
+        handler.disease_classes = len(loader.disease_classes)
+        handler.species_classes = len(loader.species_classes)
+        model = handler.build_model(pretrained=False)
+    else:
+        from tensorflow import keras
+        from train_modular_model import build_model
+
+        model = build_model(architecture, input_shape=input_shape,
+                            num_classes=len(loader.disease_classes), weights=None)
+        model.compile(optimizer=keras.optimizers.Adam(), loss='sparse_categorical_crossentropy',
+                      metrics=['accuracy'])
+        # Modular models rescale 0-255 pixels themselves and use sparse labels
+        dataset = dataset.map(
+            lambda images, labels: (images * 255.0, tf.argmax(labels['disease_diagnosis'], axis=-1)),
+            num_parallel_calls=tf.data.AUTOTUNE
+        )
+    build_seconds = time.perf_counter() - start
+
+    # Warm-up traces the training graph and fills the input pipeline
+    model.fit(dataset, steps_per_epoch=warmup_steps, epochs=1, verbose=0)
+
+    # The profiler leaves the first step of the epoch out of its stats
+    profiler = ThroughputProfiler(batch_size=batch_size)
+    model.fit(profiler.instrument(dataset), steps_per_epoch=steps + 1, epochs=1, verbose=0,
+              callbacks=[profiler])
+    stats = profiler.epochs[-1]
+
+    return {
+        "architecture": architecture,
+        "parameters": int(model.count_params()),
+        "trainable_parameters": int(sum(np.prod(w.shape) for w in model.trainable_weights)),
+        "build_seconds": round(build_seconds, 3),
+        "steps": stats["steps"] - 1,
+        "mean_step_ms": stats["mean_step_ms"],
+        "p95_step_ms": stats["p95_step_ms"],
+        "images_per_sec": stats["images_per_sec"],
+        "peak_memory_mb": stats["peak_memory_mb"],
+        "data_wait_fraction": stats["data_wait_fraction"]
+    }
+
+
+def run_benchmark(
+    dataset_dir: str,
+    architectures: List[str] = ARCHITECTURES,
+    num_images: int = 512,
+    image_size: Tuple[int, int] = (224, 224),
+    batch_size: int = 16,
+    steps: int = 20,
+    warmup_steps: int = 2,
+    cpu_profile: bool = False
+) -> Dict:
+    """
+    Benchmark training steps for each architecture on the synthetic dataset.
+
+    Each architecture runs in a fresh process, so peak memory and thread
+    pools are not shared between runs.
+
+    Args:
+        dataset_dir: Synthetic dataset directory (generated if needed)
+        architectures: Architectures to run
+        num_images: Synthetic dataset size
+        image_size: Image and model input size (height, width)
+        batch_size: Images per training step
+        steps: Timed training steps per architecture
+        warmup_steps: Untimed steps before timing
+        cpu_profile: Apply the CPU training profile (cpu_profile.py)
+
+    Returns:
+        Report with the environment, configuration and per-architecture results
+    """
+    dataset = generate_synthetic_dataset(dataset_dir, num_images, image_size)
+
+    results = {}
+    for architecture in architectures:
+        print(f"[BENCH] {architecture}: {steps} steps of {batch_size} images...")
+        output = subprocess.run(
+            [
+                sys.executable, os.path.abspath(__file__),
+                "--run", architecture,
+                "--dataset_dir", str(dataset_dir),
+                "--image_size", str(image_size[0]), str(image_size[1]),
+                "--batch_size", str(batch_size),
+                "--steps", str(steps),
+                "--warmup_steps", str(warmup_steps),
+                *(["--cpu_profile"] if cpu_profile else [])
+            ],
+            capture_output=True,
+            text=True
+        )
+        if output.returncode == 0:
+            results[architecture] = json.loads(output.stdout.strip().splitlines()[-1])
+        else:
+            results[architecture] = {"architecture": architecture, "error": output.stderr[-1000:]}
+
+    try:
+        tf_version = metadata.version("tensorflow")
+    except metadata.PackageNotFoundError:
+        tf_version = None
+
+    report = {
+        "created_at": datetime.now().isoformat(),
+        "environment": {
+            "tensorflow": tf_version,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count()
+        },
+        "config": {
+            "dataset": dataset,
+            "batch_size": batch_size,
+            "steps": steps,
+            "warmup_steps": warmup_steps,
+            "cpu_profile": cpu_profile
+        },
+        "results": results
+    }
+    print_results(report)
+    return report
+
+
+def compare_to_baseline(
+    report: Dict,
+    baseline: Dict,
+    tolerance: float = 0.10,
+    memory_tolerance: float = 0.20
+) -> Dict:
+    """
+    Flag regressions against a baseline report.
+
+    Args:
+        report: Current benchmark report
+        baseline: Baseline report from the same configuration
+        tolerance: Allowed throughput drop (fraction)
+        memory_tolerance: Allowed peak memory growth (fraction)
+
+    Returns:
+        Dictionary with per-architecture changes and the regressions found
+    """
+    for key in ("dataset", "batch_size", "steps"):
+        if report["config"][key] != baseline["config"][key]:
+            raise ValueError(f"Baseline was run with a different {key}: "
+                             f"{baseline['config'][key]} vs {report['config'][key]}")
+
+    comparison = {
+        "tolerance": tolerance,
+        "memory_tolerance": memory_tolerance,
+        "environment_changed": report["environment"] != baseline["environment"],
+        "architectures": {},
+        "regressions": []
+    }
+
+    for architecture, current in report["results"].items():
+        base = baseline["results"].get(architecture)
+        if not base:
+            continue
+        # A benchmark that fails is a failure even if it already failed in
+        # the baseline; otherwise a broken architecture is never reported
+        if "error" in current:
+            also = " (also in the baseline)" if "error" in base else ""
+            comparison["regressions"].append(f"{architecture}: benchmark failed{also}")
+            continue
+        if "error" in base:
+            continue
+
+        throughput_change = current["images_per_sec"] / base["images_per_sec"] - 1
+        memory_change = current["peak_memory_mb"] / base["peak_memory_mb"] - 1
+        comparison["architectures"][architecture] = {
+            "images_per_sec": [base["images_per_sec"], current["images_per_sec"]],
+            "throughput_change": round(throughput_change, 4),
+            "peak_memory_mb": [base["peak_memory_mb"], current["peak_memory_mb"]],
+            "memory_change": round(memory_change, 4)
+        }
+        if throughput_change < -tolerance:
+            comparison["regressions"].append(
+                f"{architecture}: throughput {throughput_change:+.1%} "
+                f"({base['images_per_sec']} -> {current['images_per_sec']} images/s)"
+            )
+        if memory_change > memory_tolerance:
+            comparison["regressions"].append(
+                f"{architecture}: peak memory {memory_change:+.1%} "
+                f"({base['peak_memory_mb']} -> {current['peak_memory_mb']} MB)"
+            )
+
+    for architecture, change in comparison["architectures"].items():
+        print(f"[BENCH] {architecture:<18} throughput {change['throughput_change']:+.1%}, "
+              f"peak memory {change['memory_change']:+.1%}")
+    if comparison["environment_changed"]:
+        print("[BENCH] Environment differs from the baseline (TensorFlow, Python or host)")
+    for regression in comparison["regressions"]:
+        print(f"[BENCH] REGRESSION {regression}")
+    if not comparison["regressions"]:
+        print("[BENCH] No regressions")
+
+    return comparison
+
+
+def print_results(report: Dict):
+    """Print the per-architecture results"""
+    print(f"[BENCH] {'Architecture':<18} {'ms/step':>9} {'p95 ms':>9} {'Images/s':>9} {'Peak MB':>9}")
+    for architecture, result in report["results"].items():
+        if "error" in result:
+            print(f"[BENCH] {architecture:<18} failed: {result['error'].strip().splitlines()[-1:]}")
+            continue
+        print(f"[BENCH] {architecture:<18} {result['mean_step_ms']:>9} {result['p95_step_ms']:>9} "
+              f"{result['images_per_sec']:>9} {result['peak_memory_mb']:>9}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Synthetic-data training-step benchmark")
+    parser.add_argument("--dataset_dir", default="./benchmark_data", help="Synthetic dataset directory")
+    parser.add_argument("--architectures", nargs="+", default=list(ARCHITECTURES), choices=ARCHITECTURES)
+    parser.add_argument("--num_images", type=int, default=512)
+    parser.add_argument("--image_size", type=int, nargs=2, default=[224, 224], metavar=("HEIGHT", "WIDTH"))
+    parser.add_argument("--batch_size", type=int, default=16)
+    parser.add_argument("--steps", type=int, default=20)
+    parser.add_argument("--warmup_steps", type=int, default=2)
+    parser.add_argument("--cpu_profile", action="store_true", help="Apply the CPU training profile")
+    parser.add_argument("--output", help="Write the report JSON here")
+    parser.add_argument("--compare", help="Baseline report to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Allowed throughput drop")
+    parser.add_argument("--memory_tolerance", type=float, default=0.20, help="Allowed peak memory growth")
+    parser.add_argument("--run", choices=ARCHITECTURES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        result = _run_architecture(args.run, args.dataset_dir, tuple(args.image_size), args.batch_size,
+                                   args.steps, args.warmup_steps, args.cpu_profile)
+        print(json.dumps(result))
+        sys.exit(0)
+
+    report = run_benchmark(args.dataset_dir, args.architectures, args.num_images, tuple(args.image_size),
+                           args.batch_size, args.steps, args.warmup_steps, args.cpu_profile)
+
+    comparison = None
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            comparison = compare_to_baseline(report, json.load(f), args.tolerance, args.memory_tolerance)
+        report["comparison"] = comparison
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"[BENCH] Report saved to {args.output}")
+
+    if comparison and comparison["regressions"]:
+        sys.exit(1)
@@ -0,0 +1,285 @@
+"""
+Resumable full-state training checkpoints.
+
+A checkpoint holds everything needed to continue a run as if it had never
+stopped: model weights, optimizer state (slots, iteration count, learning
+rate), the epoch reached, the state of EarlyStopping / ReduceLROnPlateau /
+ModelCheckpoint, the history so far and the run seed. Checkpoints are
+written to a temporary directory and renamed into place, so a crash mid-write
+never leaves a corrupt "latest" checkpoint.
+"""
+
+import json
+import os
+import shutil
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+import tensorflow as tf
+from tensorflow import keras
+from tensorflow.keras.callbacks import EarlyStopping, ModelCheckpoint, ReduceLROnPlateau
+
+
+# Callback attributes that make up their resumable state
+CALLBACK_STATE = {
+    EarlyStopping: ('wait', 'stopped_epoch', 'best', 'best_epoch'),
+    ReduceLROnPlateau: ('wait', 'cooldown_counter', 'best'),
+    ModelCheckpoint: ('best',)
+}
+
+
+def _to_json(value):
+    if isinstance(value, (np.floating, np.integer)):
+        return value.item()
+    return value
+
+
+class TrainingCheckpointManager:
+    """
+    Writes, lists, prunes and restores full-state checkpoints.
+
+    Layout:
+    checkpoint_dir/
+      train-0004/
+        model.index, model.data-*     # tf.train.Checkpoint of model + optimizer
+        best_weights.npz              # EarlyStopping best weights (if any)
+        state.json                    # epoch, callback state, history, seed, fingerprint
+      fine_tune-0002/
+      ...
+
+    Directories starting with '.' are in-progress or superseded writes and
+    are never read.
+    """
+
+    STATE_FILE = "state.json"
+
+    def __init__(self, checkpoint_dir: str, max_to_keep: int = 3):
+        """
+        Initialize the checkpoint manager.
+
+        Args:
+            checkpoint_dir: Directory holding the checkpoints
+            max_to_keep: Checkpoints retained per training stage
+        """
+        self.checkpoint_dir = Path(checkpoint_dir)
+        self.checkpoint_dir.mkdir(parents=True, exist_ok=True)
+        self.max_to_keep = max_to_keep
+
+    def list_checkpoints(self, stage: str) -> List[Path]:
+        """List complete checkpoints of a stage, oldest first"""
+        checkpoints = [
+            path for path in self.checkpoint_dir.glob(f"{stage}-*")
+            if (path / self.STATE_FILE).exists()
+        ]
+        return sorted(checkpoints, key=lambda path: int(path.name.rsplit('-', 1)[1]))
+
+    def latest(self, stage: str) -> Optional[Path]:
+        """Get the newest complete checkpoint of a stage"""
+        checkpoints = self.list_checkpoints(stage)
+        return checkpoints[-1] if checkpoints else None
+
+    def save(
+        self,
+        model: keras.Model,
+        stage: str,
+        epoch: int,
+        state: Dict,
+        best_weights: Optional[List[np.ndarray]] = None
+    ) -> Path:
+        """
+        Atomically write a checkpoint and prune old ones.
+
+        Args:
+            model: Compiled model to save with its optimizer
+            stage: Training stage name ('train', 'fine_tune')
+            epoch: Number of completed epochs
+            state: JSON-serialisable training state
+            best_weights: EarlyStopping best weights to keep (optional)
+
+        Returns:
+            Path to the checkpoint
+        """
+        final_dir = self.checkpoint_dir / f"{stage}-{epoch:04d}"
+        tmp_dir = self.checkpoint_dir / f".{final_dir.name}.tmp"
+        if tmp_dir.exists():
+            shutil.rmtree(tmp_dir)
+        tmp_dir.mkdir()
+
+        tf.train.Checkpoint(model=model, optimizer=model.optimizer).write(str(tmp_dir / "model"))
+        if best_weights is not None:
+            np.savez(tmp_dir / "best_weights.npz", *best_weights)
+
+        # state.json marks the checkpoint complete, so it is written last
+        with open(tmp_dir / self.STATE_FILE, 'w') as f:
+            json.dump({"stage": stage, "epoch": epoch, **state}, f, indent=2, default=_to_json)
+
+        # A checkpoint for the same epoch (e.g. the end-of-training one) is
+        # moved aside rather than deleted until the new one is in place
+        old_dir = None
+        if final_dir.exists():
+            old_dir = self.checkpoint_dir / f".{final_dir.name}.old"
+            if old_dir.exists():
+                shutil.rmtree(old_dir)
+            os.replace(final_dir, old_dir)
+        os.replace(tmp_dir, final_dir)
+        if old_dir is not None:
+            shutil.rmtree(old_dir)
+
+        for stale in self.list_checkpoints(stage)[:-self.max_to_keep]:
+            shutil.rmtree(stale)
+
+        return final_dir
+
+    def clear(self, stage: str):
+        """Delete every checkpoint of a stage"""
+        for checkpoint in self.list_checkpoints(stage):
+            shutil.rmtree(checkpoint)
+
+    def load_state(self, checkpoint: Path) -> Dict:
+        """Read the training state of a checkpoint"""
+        with open(Path(checkpoint) / self.STATE_FILE, 'r') as f:
+            return json.load(f)
+
+    def load_best_weights(self, checkpoint: Path) -> Optional[List[np.ndarray]]:
+        """Read the EarlyStopping best weights of a checkpoint, if saved"""
+        weights_file = Path(checkpoint) / "best_weights.npz"
+        if not weights_file.exists():
+            return None
+        with np.load(weights_file) as data:
+            return [data[f"arr_{i}"] for i in range(len(data.files))]
+
+    def restore(self, model: keras.Model, checkpoint: Path) -> Dict:
+        """
+        Restore model weights and optimizer state from a checkpoint.
+
+        The model must be compiled with the same architecture and optimizer
+        type as when the checkpoint was written.
+
+        Args:
+            model: Compiled model to restore into
+            checkpoint: Checkpoint directory
+
+        Returns:
+            Training state of the checkpoint
+        """
+        # Create optimizer slots up front so they are restored immediately
+        # rather than on first use
+        with model.distribute_strategy.scope():
+            model.optimizer.build(model.trainable_variables)
+        tf.train.Checkpoint(model=model, optimizer=model.optimizer).read(
+            str(Path(checkpoint) / "model")
+        ).expect_partial()
+        return self.load_state(checkpoint)
+
+
+class ResumableCheckpoint(keras.callbacks.Callback):
+    """
+    Saves full-state checkpoints during fit() and restores callback state on resume.
+
+    Must be the last callback so it runs after EarlyStopping and
+    ReduceLROnPlateau have updated their state (and after EarlyStopping has
+    restored the best weights at the end of training).
+    """
+
+    def __init__(
+        self,
+        manager: TrainingCheckpointManager,
+        stage: str,
+        tracked_callbacks: List[keras.callbacks.Callback],
+        every_n_epochs: int = 1,
+        seed: Optional[int] = None,
+        resume_from: Optional[Path] = None,
+        fingerprint: Optional[str] = None
+    ):
+        """
+        Initialize the checkpoint callback.
+
+        Args:
+            manager: Checkpoint manager to write through
+            stage: Training stage name
+            tracked_callbacks: Callbacks whose state is saved and restored
+            every_n_epochs: Checkpoint interval in epochs
+            seed: Run seed; every epoch reseeds from seed + epoch so a resumed
+                epoch draws the same random numbers as an uninterrupted one
+            resume_from: Checkpoint to restore callback state from
+            fingerprint: Data and settings the run was started with, so a
+                checkpoint is never resumed by a different run
+        """
+        super().__init__()
+        self.manager = manager
+        self.stage = stage
+        self.tracked_callbacks = tracked_callbacks
+        self.every_n_epochs = max(1, every_n_epochs)
+        self.seed = seed
+        self.resume_from = resume_from
+        self.fingerprint = fingerprint
+        self.epochs_done = 0
+        self.history = {}
+
+    def on_train_begin(self, logs=None):
+        if self.resume_from is None:
+            return
+
+        # Runs after the tracked callbacks reset themselves in their own
+        # on_train_begin
+        state = self.manager.load_state(self.resume_from)
+        self.epochs_done = state["epoch"]
+        self.history = state.get("history", {})
+
+        for callback in self.tracked_callbacks:
+            saved = state.get("callbacks", {}).get(type(callback).__name__, {})
+            for attr, value in saved.items():
+                setattr(callback, attr, value)
+            if isinstance(callback, EarlyStopping):
+                callback.best_weights = self.manager.load_best_weights(self.resume_from)
+
+    def on_epoch_begin(self, epoch, logs=None):
+        if self.seed is not None:
+            keras.utils.set_random_seed(self.seed + epoch)
+
+    def on_epoch_end(self, epoch, logs=None):
+        self.epochs_done = epoch + 1
+        for key, value in (logs or {}).items():
+            self.history.setdefault(key, []).append(float(value))
+
+        if self.epochs_done % self.every_n_epochs == 0:
+            self._save(completed=False)
+
+    def on_train_end(self, logs=None):
+        self._save(completed=True)
+
+    def _save(self, completed: bool):
+        callback_state = {}
+        best_weights = None
+        for callback in self.tracked_callbacks:
+            callback_state[type(callback).__name__] = {
+                attr: _to_json(getattr(callback, attr))
+                for attr in CALLBACK_STATE.get(type(callback), ())
+                if hasattr(callback, attr)
+            }
+            if isinstance(callback, EarlyStopping):
+                best_weights = callback.best_weights
+
+        try:
+            learning_rate = float(keras.backend.get_value(self.model.optimizer.learning_rate))
+        except (TypeError, ValueError):
+            # Learning rate schedules are restored with the optimizer
+            learning_rate = None
+
+        path = self.manager.save(
+            self.model,
+            self.stage,
+            self.epochs_done,
+            {
+                "completed": completed,
+                "seed": self.seed,
+                "fingerprint": self.fingerprint,
+                "learning_rate": learning_rate,
+                "callbacks": callback_state,
+                "history": self.history
+            },
+            best_weights=best_weights
+        )
+        if completed:
+            print(f"[CHECKPOINT] Final {self.stage} state saved to {path}")
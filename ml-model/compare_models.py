@@ -0,0 +1,378 @@
+"""
+Champion/challenger evaluation of several models on one decode of a test set.
+
+The test images are decoded once into a shared-memory uint8 buffer; every
+candidate model then reads the same batches, either one after another in
+this process or concurrently with one process per model. The report puts
+each model's metrics (the same streaming accumulators as ModelEvaluator)
+and inference latency side by side.
+
+Usage:
+    python compare_models.py --dataset_path ./data \\
+        --model champion=trained_models/best_model.h5 \\
+        --model challenger=experiments/exp_0007/best_model.h5 \\
+        --parallel --output comparison.json
+
+    # Test split of a DatasetManager manifest (single-output models)
+    python compare_models.py --manifest test_manifest.json --model ...
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+from multiprocessing import shared_memory
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from data_loader import DataLoader, decode_image_uint8
+from evaluate import TASKS, StreamingClassificationMetrics, bootstrap_confidence_intervals
+from manifest import manifest_images
+
+
+class TestSet:
+    """
+    Test images decoded once into shared memory, with their labels.
+
+    Labels map a name to class indices per image: the model output names
+    ('disease_diagnosis', 'species_identification') for DataLoader datasets,
+    'class_id' for manifests.
+    """
+
+    def __init__(
+        self,
+        image_paths: List[str],
+        labels: Dict[str, List[int]],
+        image_size: Tuple[int, int] = (224, 224),
+        num_workers: Optional[int] = None
+    ):
+        """
+        Decode the test images.
+
+        Args:
+            image_paths: Paths of the test images
+            labels: Class indices per image for each label name
+            image_size: Size to decode to (height, width)
+            num_workers: Decode threads (defaults to the CPU count)
+        """
+        shape = (len(image_paths), *image_size, 3)
+        self.shm = shared_memory.SharedMemory(create=True, size=max(int(np.prod(shape)), 1))
+        images = np.ndarray(shape, dtype=np.uint8, buffer=self.shm.buf)
+        self.failures = []
+
+        def decode(index):
+            try:
+                images[index] = decode_image_uint8(image_paths[index], image_size)
+                return True
+            except Exception as e:
+                self.failures.append({"path": image_paths[index], "error": str(e)})
+                return False
+
+        start = time.perf_counter()
+        # cv2 releases the GIL while decoding, so threads decode in parallel
+        with ThreadPoolExecutor(max_workers=num_workers or os.cpu_count()) as executor:
+            loaded = np.fromiter(executor.map(decode, range(len(image_paths))), dtype=bool,
+                                 count=len(image_paths))
+        self.decode_seconds = time.perf_counter() - start
+
+        # Pack the decoded images at the front of the buffer
+        if not loaded.all():
+            images[:loaded.sum()] = images[loaded]
+        self.images = images[:loaded.sum()]
+        self.labels = {name: np.asarray(values, dtype=np.int64)[loaded] for name, values in labels.items()}
+
+        print(f"[COMPARE] Decoded {len(self.images)} test images in {self.decode_seconds:.1f}s"
+              f"{f' ({len(self.failures)} failed)' if self.failures else ''}")
+
+    def __len__(self) -> int:
+        return len(self.images)
+
+    def close(self):
+        """Release the shared buffer"""
+        self.images = None
+        self.shm.close()
+        self.shm.unlink()
+
+
+def load_test_set(
+    dataset_path: Optional[str] = None,
+    manifest: Optional[str] = None,
+    split: str = "test",
+    image_size: Tuple[int, int] = (224, 224)
+) -> TestSet:
+    """
+    Decode a test split from a DataLoader dataset or a DatasetManager manifest.
+
+    Args:
+        dataset_path: Dataset root with disease_images/<disease>/<species>/
+        manifest: Manifest .json or .jsonl (DatasetManager.export_training_manifest)
+        split: Split to evaluate on
+        image_size: Size to decode to (height, width)
+
+    Returns:
+        Decoded TestSet
+    """
+    if manifest:
+        _, images = manifest_images(manifest, split)
+        return TestSet(
+            [i["path"] for i in images],
+            {"class_id": [i["class_id"] for i in images]},
+            image_size
+        )
+
+    if not dataset_path:
+        raise ValueError("dataset_path or manifest is required")
+    loader = DataLoader(dataset_path, image_size=image_size)
+    loader.prepare_data()
+    image_paths, disease_indices, species_indices = loader.list_image_files(split)
+    return TestSet(
+        image_paths,
+        {"disease_diagnosis": disease_indices, "species_identification": species_indices},
+        image_size
+    )
+
+
+def _expects_raw_pixels(layer) -> bool:
+    """Whether a model rescales 0-255 pixels itself (train_modular_model.py models)"""
+    from tensorflow import keras
+
+    if isinstance(layer, keras.layers.Rescaling):
+        return True
+    return any(_expects_raw_pixels(sub) for sub in getattr(layer, "layers", []))
+
+
+def _evaluate_model(
+    model_path: str,
+    images: np.ndarray,
+    labels: Dict[str, np.ndarray],
+    batch_size: int,
+    bootstrap_resamples: int = 1000
+) -> Dict:
+    """Run one model over every test batch, accumulating metrics and latency"""
+    import tensorflow as tf
+    from tensorflow import keras
+
+    start = time.perf_counter()
+    model = keras.models.load_model(model_path, compile=False)
+    load_seconds = time.perf_counter() - start
+
+    raw_pixels = _expects_raw_pixels(model)
+    input_size = tuple(model.input_shape[1:3])
+    output_names = model.output_names
+
+    # Outputs are matched to labels by name; a single-output model takes
+    # the only label set
+    label_names = {name: name for name in output_names if name in labels}
+    if not label_names and len(output_names) == 1 and len(labels) == 1:
+        label_names[output_names[0]] = next(iter(labels))
+    if not label_names:
+        raise ValueError(f"No labels for outputs {output_names} (labels: {list(labels)})")
+
+    accumulators = {}
+    batch_times = []
+    for offset in range(0, len(images), batch_size):
+        batch = images[offset:offset + batch_size].astype(np.float32)
+        if batch.shape[1:3] != input_size:
+            batch = tf.image.resize(batch, input_size).numpy()
+        if not raw_pixels:
+            batch /= 255.0
+
+        batch_start = time.perf_counter()
+        predictions = model.predict_on_batch(batch)
+        batch_times.append((time.perf_counter() - batch_start, len(batch)))
+
+        if not isinstance(predictions, (list, tuple)):
+            predictions = [predictions]
+        for name, y_pred_proba in zip(output_names, predictions):
+            if name not in label_names:
+                continue
+            if name not in accumulators:
+                accumulators[name] = StreamingClassificationMetrics(y_pred_proba.shape[-1])
+            y_true = labels[label_names[name]][offset:offset + batch_size]
+            if y_true.max(initial=0) >= y_pred_proba.shape[-1]:
+                raise ValueError(f"Labels exceed the {y_pred_proba.shape[-1]} classes of output {name}")
+            accumulators[name].update(y_true, y_pred_proba)
+
+    # The first batch traces the prediction graph
+    steady = batch_times[1:] or batch_times
+    batch_ms = np.array([seconds for seconds, _ in steady]) * 1000
+    seconds = sum(s for s, _ in steady)
+    count = sum(n for _, n in steady)
+
+    metrics = {}
+    for name, accumulator in accumulators.items():
+        metrics[TASKS.get(name, (name,))[0]] = task_metrics = accumulator.result()
+        if bootstrap_resamples:
+            task_metrics["confidence_intervals"] = bootstrap_confidence_intervals(
+                accumulator.confusion, bootstrap_resamples, num_workers=1
+            )
+
+    return {
+        "model_path": str(model_path),
+        "metrics": metrics,
+        "latency": {
+            "load_seconds": round(load_seconds, 3),
+            "mean_batch_ms": round(float(batch_ms.mean()), 2),
+            "p50_batch_ms": round(float(np.percentile(batch_ms, 50)), 2),
+            "p95_batch_ms": round(float(np.percentile(batch_ms, 95)), 2),
+            "ms_per_image": round(1000 * seconds / count, 3) if count else None,
+            "images_per_sec": round(count / seconds, 2) if seconds else None
+        }
+    }
+
+
+# Shared test images, attached once per worker process
+_test_images = None
+_test_images_shm = None
+
+
+def _attach_test_set(shm_name: str, shape: Tuple[int, ...], threads: int):
+    """Attach a worker process to the decoded test set and size its thread pools"""
+    global _test_images, _test_images_shm
+    import tensorflow as tf
+
+    # Models share the CPU, so each gets its slice of the cores
+    tf.config.threading.set_intra_op_parallelism_threads(threads)
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+    _test_images_shm = shared_memory.SharedMemory(name=shm_name)
+    _test_images = np.ndarray(shape, dtype=np.uint8, buffer=_test_images_shm.buf)
+
+
+def _evaluate_shared(
+    model_path: str,
+    labels: Dict[str, np.ndarray],
+    batch_size: int,
+    bootstrap_resamples: int
+) -> Dict:
+    """Evaluate a model in a worker process on the shared test images"""
+    return _evaluate_model(model_path, _test_images, labels, batch_size, bootstrap_resamples)
+
+
+def compare_models(
+    candidates: Dict[str, str],
+    test_set: TestSet,
+    batch_size: int = 32,
+    parallel: bool = False,
+    rank_by: str = "accuracy",
+    bootstrap_resamples: int = 1000
+) -> Dict:
+    """
+    Evaluate candidate models on the same decoded test set.
+
+    Args:
+        candidates: Model name -> model file
+        test_set: Decoded test set
+        batch_size: Images per prediction batch
+        parallel: One process per model instead of one model after another;
+            faster overall, but latencies are measured under contention
+        rank_by: Metric of the first task used to rank the models
+        bootstrap_resamples: Resamples for the 95% confidence intervals of
+            accuracy, macro F1 and per-class recall (0 to skip); overlapping
+            intervals mean the difference may be noise
+
+    Returns:
+        Report with metrics and latency per model and the ranking
+    """
+    results = {}
+    if parallel and len(candidates) > 1:
+        threads = max((os.cpu_count() or 1) // len(candidates), 1)
+        # Spawned workers start a fresh TensorFlow runtime each
+        with ProcessPoolExecutor(
+            max_workers=len(candidates),
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_attach_test_set,
+            initargs=(test_set.shm.name, test_set.images.shape, threads)
+        ) as executor:
+            futures = {
+                name: executor.submit(_evaluate_shared, path, test_set.labels, batch_size,
+                                      bootstrap_resamples)
+                for name, path in candidates.items()
+            }
+            for name, future in futures.items():
+                try:
+                    results[name] = future.result()
+                except Exception as e:
+                    results[name] = {"model_path": candidates[name], "error": str(e)}
+    else:
+        for name, path in candidates.items():
+            try:
+                results[name] = _evaluate_model(path, test_set.images, test_set.labels, batch_size,
+                                                bootstrap_resamples)
+            except Exception as e:
+                results[name] = {"model_path": path, "error": str(e)}
+
+    def score(name):
+        metrics = results[name].get("metrics")
+        if not metrics:
+            return -1
+        value = next(iter(metrics.values())).get(rank_by)
+        return value if value is not None else -1
+
+    report = {
+        "created_at": datetime.now().isoformat(),
+        "mode": "parallel" if parallel and len(candidates) > 1 else "sequential",
+        "test_samples": len(test_set),
+        "decode_seconds": round(test_set.decode_seconds, 3),
+        "decode_failures": len(test_set.failures),
+        "batch_size": batch_size,
+        "rank_by": rank_by,
+        "ranking": sorted(results, key=score, reverse=True),
+        "models": results
+    }
+    print_report(report)
+    return report
+
+
+def print_report(report: Dict):
+    """Print the side-by-side comparison"""
+    print(f"[COMPARE] {report['test_samples']} test images, {report['mode']} evaluation")
+    print(f"[COMPARE] {'Model':<20} {'Task':<10} {'Accuracy':>9} {'95% CI':>17} {'F1':>7} "
+          f"{'ROC-AUC':>8} {'ms/image':>9} {'Images/s':>9}")
+    for name in report["ranking"]:
+        result = report["models"][name]
+        if "error" in result:
+            print(f"[COMPARE] {name:<20} failed: {result['error']}")
+            continue
+        latency = result["latency"]
+        for task, metrics in result["metrics"].items():
+            auc = f"{metrics['roc_auc']:.4f}" if metrics["roc_auc"] is not None else "n/a"
+            intervals = metrics.get("confidence_intervals")
+            ci = "[{:.4f}, {:.4f}]".format(*intervals["accuracy"]) if intervals else "n/a"
+            print(f"[COMPARE] {name:<20} {task:<10} {metrics['accuracy']:>9.4f} {ci:>17} "
+                  f"{metrics['f1_score']:>7.4f} {auc:>8} "
+                  f"{latency['ms_per_image']:>9} {latency['images_per_sec']:>9}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare models on one decode of a test set")
+    parser.add_argument("--dataset_path", help="Dataset root (DataLoader layout)")
+    parser.add_argument("--manifest", help="DatasetManager manifest (.json or .jsonl)")
+    parser.add_argument("--split", default="test")
+    parser.add_argument("--model", action="append", required=True, metavar="NAME=PATH",
+                        help="Candidate model (repeat for each model)")
+    parser.add_argument("--batch_size", type=int, default=32)
+    parser.add_argument("--image_size", type=int, default=224)
+    parser.add_argument("--parallel", action="store_true", help="One process per model")
+    parser.add_argument("--rank_by", default="accuracy")
+    parser.add_argument("--bootstrap_resamples", type=int, default=1000,
+                        help="Resamples for confidence intervals (0 to skip)")
+    parser.add_argument("--output", help="Write the report JSON here")
+    args = parser.parse_args()
+
+    candidates = dict(spec.split("=", 1) for spec in args.model)
+    test_set = load_test_set(args.dataset_path, args.manifest, args.split,
+                             (args.image_size, args.image_size))
+    try:
+        report = compare_models(candidates, test_set, args.batch_size, args.parallel, args.rank_by,
+                                args.bootstrap_resamples)
+    finally:
+        test_set.close()
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"[COMPARE] Report saved to {args.output}")
@@ -0,0 +1,252 @@
+"""
+CPU training profile.
+
+Tunes TensorFlow threading and oneDNN for the detected CPU and optionally
+enables bfloat16 mixed precision on CPUs with native bf16 support
+(AVX512_BF16 / AMX). Must run before the model is built; thread pool sizes
+are fixed once the TensorFlow runtime has started, and the oneDNN/OpenMP
+variables are read when TensorFlow is imported, so set_cpu_environment()
+(which does not import TensorFlow) should run before that import.
+
+Usage:
+    python cpu_profile.py --benchmark
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from typing import Dict, Optional
+
+
+BF16_FLAGS = ('avx512_bf16', 'amx_bf16')
+
+
+def detect_cpu() -> Dict:
+    """
+    Detect CPU topology and instruction-set flags.
+
+    Returns:
+        Dictionary with logical/physical core counts, sockets and flags
+    """
+    logical = os.cpu_count() or 1
+    info = {
+        "logical_cores": logical,
+        "physical_cores": logical,
+        "sockets": 1,
+        "flags": []
+    }
+
+    try:
+        with open('/proc/cpuinfo', 'r') as f:
+            cpuinfo = f.read()
+    except OSError:
+        return info
+
+    cores = set()
+    sockets = set()
+    physical_id = core_id = None
+    for line in cpuinfo.splitlines():
+        key, _, value = line.partition(':')
+        key = key.strip()
+        value = value.strip()
+        if key == 'physical id':
+            physical_id = value
+            sockets.add(value)
+        elif key == 'core id':
+            core_id = value
+        elif key == 'flags' and not info["flags"]:
+            info["flags"] = value.split()
+        elif not line.strip() and core_id is not None:
+            cores.add((physical_id, core_id))
+            physical_id = core_id = None
+    if core_id is not None:
+        cores.add((physical_id, core_id))
+
+    if cores:
+        info["physical_cores"] = len(cores)
+    if sockets:
+        info["sockets"] = len(sockets)
+
+    return info
+
+
+def supports_bfloat16(cpu_info: Dict) -> bool:
+    """Check whether the CPU has native bfloat16 instructions"""
+    return any(flag in cpu_info["flags"] for flag in BF16_FLAGS)
+
+
+def set_cpu_environment(intra_op_threads: Optional[int] = None) -> Dict:
+    """
+    Export the oneDNN/OpenMP settings of the CPU profile.
+
+    Only takes full effect before TensorFlow is imported; variables already
+    set in the environment are kept.
+
+    Args:
+        intra_op_threads: OpenMP threads (defaults to physical cores)
+
+    Returns:
+        The effective settings
+    """
+    intra_op_threads = intra_op_threads or detect_cpu()["physical_cores"]
+    os.environ.setdefault("TF_ENABLE_ONEDNN_OPTS", "1")
+    os.environ.setdefault("OMP_NUM_THREADS", str(intra_op_threads))
+    os.environ.setdefault("KMP_BLOCKTIME", "1")
+    os.environ.setdefault("KMP_AFFINITY", "granularity=fine,compact,1,0")
+    return {
+        "onednn_opts": os.environ["TF_ENABLE_ONEDNN_OPTS"],
+        "omp_num_threads": os.environ["OMP_NUM_THREADS"],
+        "kmp_blocktime": os.environ["KMP_BLOCKTIME"],
+        "kmp_affinity": os.environ["KMP_AFFINITY"]
+    }
+
+
+def configure_cpu_training(
+    intra_op_threads: Optional[int] = None,
+    inter_op_threads: Optional[int] = None,
+    mixed_precision: str = "auto"
+) -> Dict:
+    """
+    Apply the CPU training profile.
+
+    Args:
+        intra_op_threads: Threads per op (defaults to physical cores)
+        inter_op_threads: Ops run concurrently (defaults to sockets, min 2)
+        mixed_precision: 'auto' (bf16 if supported), 'bfloat16' or 'off'
+
+    Returns:
+        Effective configuration
+    """
+    import tensorflow as tf
+
+    cpu_info = detect_cpu()
+    intra_op_threads = intra_op_threads or cpu_info["physical_cores"]
+    inter_op_threads = inter_op_threads or max(cpu_info["sockets"], 2)
+
+    # No-op for variables set_cpu_environment() exported before the import
+    environment = set_cpu_environment(intra_op_threads)
+
+    threading_applied = True
+    try:
+        tf.config.threading.set_intra_op_parallelism_threads(intra_op_threads)
+        tf.config.threading.set_inter_op_parallelism_threads(inter_op_threads)
+    except RuntimeError:
+        # The runtime has already started; thread pools can't change anymore
+        threading_applied = False
+
+    bf16_supported = supports_bfloat16(cpu_info)
+    if mixed_precision == "bfloat16" or (mixed_precision == "auto" and bf16_supported):
+        tf.keras.mixed_precision.set_global_policy("mixed_bfloat16")
+
+    config = {
+        "cpu": {k: v for k, v in cpu_info.items() if k != "flags"},
+        "bf16_supported": bf16_supported,
+        "intra_op_threads": tf.config.threading.get_intra_op_parallelism_threads(),
+        "inter_op_threads": tf.config.threading.get_inter_op_parallelism_threads(),
+        "threading_applied": threading_applied,
+        **environment,
+        "precision_policy": tf.keras.mixed_precision.global_policy().name
+    }
+
+    print(f"[CPU] {cpu_info['physical_cores']} physical / {cpu_info['logical_cores']} "
+          f"logical cores, {cpu_info['sockets']} socket(s)")
+    print(f"[CPU] intra_op={config['intra_op_threads']} inter_op={config['inter_op_threads']}"
+          f"{'' if threading_applied else ' (runtime already started, not applied)'}")
+    print(f"[CPU] oneDNN={config['onednn_opts']} precision={config['precision_policy']} "
+          f"(bf16 {'supported' if bf16_supported else 'not supported'})")
+
+    return config
+
+
+def _run_benchmark(tuned: bool, num_images: int, batch_size: int, steps: int) -> Dict:
+    """Measure training images per second on a fixed synthetic dataset"""
+    import numpy as np
+
+    if tuned:
+        set_cpu_environment()
+    import tensorflow as tf
+
+    config = configure_cpu_training() if tuned else {}
+
+    from model import PlantHealthModel
+
+    rng = np.random.default_rng(0)
+    images = rng.random((num_images, 224, 224, 3), dtype=np.float32)
+    disease = np.eye(12, dtype=np.float32)[rng.integers(0, 12, num_images)]
+    species = np.eye(50, dtype=np.float32)[rng.integers(0, 50, num_images)]
+
+    model = PlantHealthModel().build_model(pretrained=False)
+    dataset = tf.data.Dataset.from_tensor_slices((
+        images,
+        {'disease_diagnosis': disease, 'species_identification': species}
+    )).repeat().batch(batch_size).prefetch(tf.data.AUTOTUNE)
+
+    # Warm-up step traces the graph
+    model.fit(dataset, steps_per_epoch=1, epochs=1, verbose=0)
+
+    start = time.perf_counter()
+    model.fit(dataset, steps_per_epoch=steps, epochs=1, verbose=0)
+    seconds = time.perf_counter() - start
+
+    return {
+        "profile": "cpu_tuned" if tuned else "default",
+        "images_per_sec": round(steps * batch_size / seconds, 2),
+        "config": config
+    }
+
+
+def benchmark(num_images: int = 64, batch_size: int = 16, steps: int = 8) -> Dict:
+    """
+    Compare images per second with and without the CPU profile.
+
+    Each run uses a fresh process because thread pools are fixed once
+    TensorFlow starts.
+
+    Returns:
+        Dictionary with both measurements and the speedup
+    """
+    results = {}
+    for profile in ("default", "cpu_tuned"):
+        output = subprocess.run(
+            [
+                sys.executable, os.path.abspath(__file__),
+                "--run", profile,
+                "--num_images", str(num_images),
+                "--batch_size", str(batch_size),
+                "--steps", str(steps)
+            ],
+            capture_output=True,
+            text=True,
+            check=True
+        ).stdout
+        results[profile] = json.loads(output.strip().splitlines()[-1])
+
+    default_ips = results["default"]["images_per_sec"]
+    tuned_ips = results["cpu_tuned"]["images_per_sec"]
+    results["speedup"] = round(tuned_ips / default_ips, 2) if default_ips else None
+
+    print(f"[CPU] Default profile: {default_ips} images/s")
+    print(f"[CPU] CPU profile:     {tuned_ips} images/s ({results['speedup']}x)")
+
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="CPU training profile")
+    parser.add_argument("--benchmark", action="store_true", help="Run the before/after benchmark")
+    parser.add_argument("--run", choices=["default", "cpu_tuned"], help=argparse.SUPPRESS)
+    parser.add_argument("--num_images", type=int, default=64)
+    parser.add_argument("--batch_size", type=int, default=16)
+    parser.add_argument("--steps", type=int, default=8)
+    args = parser.parse_args()
+
+    if args.run:
+        result = _run_benchmark(args.run == "cpu_tuned", args.num_images, args.batch_size, args.steps)
+        print(json.dumps(result))
+    elif args.benchmark:
+        benchmark(args.num_images, args.batch_size, args.steps)
+    else:
+        configure_cpu_training()
@@ -1,4 +1,10 @@
 import os
+import json
+import hashlib
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
 import numpy as np
 from pathlib import Path
 from typing import Tuple, List, Dict
@@ -7,6 +13,94 @@ from tensorflow.keras.preprocessing.image import ImageDataGenerator
 from PIL import Image
 import cv2
 
+from augmentation import augment_dataset
+from dataset_index import DatasetIndex
+
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+SPLITS = ('train', 'val', 'test')
+
+
+def assign_split(key: str, train_split: float, val_split: float) -> str:
+    """
+    Deterministically assign an image to a split from a hash of its key.
+    
+    The assignment depends only on the key, so existing images keep their
+    split as the dataset grows.
+    
+    Args:
+        key: Stable identifier for the image (relative path)
+        train_split: Fraction for training data
+        val_split: Fraction for validation data
+        
+    Returns:
+        One of 'train', 'val', 'test'
+    """
+    bucket = int(hashlib.sha1(key.encode('utf-8')).hexdigest()[:15], 16) / 16 ** 15
+    if bucket < train_split:
+        return 'train'
+    if bucket < train_split + val_split:
+        return 'val'
+    return 'test'
+
+
+def decode_image_uint8(image_path: str, image_size: Tuple[int, int] = None) -> np.ndarray:
+    """
+    Decode an image file to an RGB uint8 array.
+    
+    Args:
+        image_path: Path to the image file
+        image_size: Size to resize to (height, width), or None to keep as-is
+        
+    Returns:
+        Image as uint8 numpy array of shape (H, W, 3)
+    """
+    image = cv2.imread(str(image_path))
+    if image is None:
+        # Try with PIL as fallback
+        image = np.array(Image.open(image_path).convert('RGB'))
+    else:
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    
+    if image_size is not None:
+        image = cv2.resize(image, image_size)
+    
+    return image
+
+
+# Shared output buffer, attached once per worker process
+_shared_images = None
+_shared_images_shm = None
+
+
+def _attach_shared_images(shm_name: str, shape: Tuple[int, ...]):
+    """Attach a worker process to the parent's shared image buffer."""
+    global _shared_images, _shared_images_shm
+    # One decode thread per process; parallelism comes from the pool
+    cv2.setNumThreads(1)
+    _shared_images_shm = shared_memory.SharedMemory(name=shm_name)
+    _shared_images = np.ndarray(shape, dtype=np.float32, buffer=_shared_images_shm.buf)
+
+
+def _decode_chunk_into_shared(
+    offset: int,
+    image_paths: List[str],
+    image_size: Tuple[int, int]
+) -> Tuple[int, List[Tuple[int, str]]]:
+    """
+    Decode a chunk of images into the shared buffer starting at offset.
+    
+    Returns:
+        Tuple of (images processed, [(index, error) for failed images])
+    """
+    failures = []
+    for index, image_path in enumerate(image_paths, start=offset):
+        try:
+            _shared_images[index] = decode_image_uint8(image_path, image_size) / np.float32(255.0)
+        except Exception as e:
+            failures.append((index, str(e)))
+    return len(image_paths), failures
+
 
 class DataLoader:
     """
@@ -26,7 +120,8 @@ class DataLoader:
         image_size: Tuple[int, int] = (224, 224),
         train_split: float = 0.7,
         val_split: float = 0.15,
-        test_split: float = 0.15
+        test_split: float = 0.15,
+        image_cache=None
     ):
         """
         Initialize the data loader.
@@ -37,9 +132,11 @@ class DataLoader:
             train_split: Fraction for training data
             val_split: Fraction for validation data
             test_split: Fraction for test data
+            image_cache: Optional ImageCache to read preprocessed pixels from
         """
         self.dataset_path = Path(dataset_path)
         self.image_size = image_size
+        self.image_cache = image_cache
         self.train_split = train_split
         self.val_split = val_split
         self.test_split = test_split
@@ -54,6 +151,23 @@ class DataLoader:
         self.class_to_idx = {}
         self.idx_to_class = {}
         
+        # Persisted split assignments, so images never change split. This
+        # file is authoritative for disease_images/ datasets read here;
+        # DatasetManager versions keep theirs in the metadata store
+        # (split_assignments table), which manifest exports carry
+        self.split_index_file = self.dataset_path / "split_index.json"
+        self.split_index = None
+        
+        # Persisted listing of disease_images/, revalidated by directory mtime
+        self.dataset_index = DatasetIndex(
+            self.dataset_path / "disease_images",
+            self.dataset_path / "dataset_index.json",
+            IMAGE_EXTENSIONS
+        )
+        
+        # Images that failed to decode during the last load
+        self.load_failures = []
+        
     def prepare_data(self):
         """
         Prepare and organize the dataset.
@@ -86,21 +200,15 @@ class DataLoader:
             return
         
         # Discover disease classes
-        disease_dirs = [d for d in disease_path.iterdir() if d.is_dir()]
-        self.disease_classes = sorted([d.name for d in disease_dirs])
+        self.dataset_index.refresh()
+        self.disease_classes = self.dataset_index.disease_classes()
         
         print(f"[DATA] Found {len(self.disease_classes)} disease classes:")
         for i, disease in enumerate(self.disease_classes):
             print(f"  {i}: {disease}")
         
         # Discover species classes
-        species_set = set()
-        for disease_dir in disease_dirs:
-            species_dirs = [d for d in disease_dir.iterdir() if d.is_dir()]
-            for species_dir in species_dirs:
-                species_set.add(species_dir.name)
-        
-        self.species_classes = sorted(list(species_set))
+        self.species_classes = self.dataset_index.species_classes()
         print(f"[DATA] Found {len(self.species_classes)} species classes:")
         for i, species in enumerate(self.species_classes):
             print(f"  {i}: {species}")
@@ -123,33 +231,287 @@ class DataLoader:
             resize: Whether to resize to model input size
             
         Returns:
-            Image as numpy array
+            Image as numpy array, or None if it can't be decoded (recorded
+            in self.load_failures)
         """
         try:
-            image = cv2.imread(str(image_path))
-            if image is None:
-                # Try with PIL as fallback
-                image = np.array(Image.open(image_path))
-                if len(image.shape) == 2:  # Grayscale
-                    image = np.stack([image] * 3, axis=-1)
-            else:
-                image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+            if resize and self.image_cache is not None:
+                cached = self.image_cache.get_for_path(image_path)
+                if cached is not None:
+                    return cached.astype(np.float32) / 255.0
             
-            if resize:
-                image = cv2.resize(image, self.image_size)
+            image = decode_image_uint8(
+                image_path,
+                self.image_size if resize else None
+            )
             
             # Normalize to [0, 1]
             image = image.astype(np.float32) / 255.0
             
             return image
         except Exception as e:
-            print(f"[ERROR] Failed to load {image_path}: {e}")
+            self.load_failures.append({"path": image_path, "error": str(e)})
             return None
     
+    def _load_split_index(self) -> Dict:
+        """Load persisted split assignments from disk"""
+        if self.split_index_file.exists():
+            with open(self.split_index_file, 'r') as f:
+                index = json.load(f)
+            
+            fractions = [self.train_split, self.val_split, self.test_split]
+            if index.get("fractions") != fractions:
+                print(f"[WARNING] Split index was created with fractions "
+                      f"{index.get('fractions')}; keeping existing assignments")
+            return index
+        
+        return {
+            "fractions": [self.train_split, self.val_split, self.test_split],
+            "assignments": {}
+        }
+    
+    def _save_split_index(self):
+        """
+        Save split assignments to disk.
+        
+        Other processes (distributed workers, concurrent runs) may have
+        saved assignments since this one loaded the index; those are kept
+        and win over ours. Each save writes its own temporary file, so
+        concurrent saves never write into the same file.
+        """
+        if self.split_index_file.exists():
+            with open(self.split_index_file, 'r') as f:
+                saved = json.load(f)["assignments"]
+            self.split_index["assignments"].update(saved)
+        
+        fd, tmp_file = tempfile.mkstemp(
+            dir=self.split_index_file.parent, prefix=self.split_index_file.name, suffix='.tmp'
+        )
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(self.split_index, f)
+            os.replace(tmp_file, self.split_index_file)
+        except BaseException:
+            os.unlink(tmp_file)
+            raise
+    
+    def get_split(self, relative_path: str) -> str:
+        """
+        Get the split an image belongs to, assigning it on first sight.
+        
+        Args:
+            relative_path: Image path relative to disease_images/
+            
+        Returns:
+            One of 'train', 'val', 'test'
+        """
+        if self.split_index is None:
+            self.split_index = self._load_split_index()
+        
+        assignments = self.split_index["assignments"]
+        if relative_path not in assignments:
+            assignments[relative_path] = assign_split(
+                relative_path, self.train_split, self.val_split
+            )
+        return assignments[relative_path]
+    
+    def list_image_files(self, split: str = None) -> Tuple[List[str], List[int], List[int]]:
+        """
+        List the images of a split together with their labels.
+        
+        Images come from the dataset index refreshed by prepare_data();
+        no directory is listed and no image is opened.
+        
+        Args:
+            split: One of 'train', 'val', 'test', or None for every image
+            
+        Returns:
+            Tuple of (image_paths, disease_indices, species_indices)
+        """
+        if split is not None and split not in SPLITS:
+            raise ValueError(f"split must be one of {SPLITS}, got {split!r}")
+        
+        if self.split_index is None:
+            self.split_index = self._load_split_index()
+        known_images = len(self.split_index["assignments"])
+        
+        image_paths = []
+        disease_indices = []
+        species_indices = []
+        
+        disease_path = self.dataset_path / "disease_images"
+        
+        for disease in self.dataset_index.disease_classes():
+            disease_idx = self.disease_to_idx[disease]
+            
+            for species in self.dataset_index.species_dirs(disease):
+                species_idx = self.species_to_idx[species]
+                
+                # Get the split's images in species directory
+                image_files = [name for name, _, _ in self.dataset_index.images(disease, species)]
+                if split is not None:
+                    image_files = [
+                        name for name in image_files
+                        if self.get_split(f"{disease}/{species}/{name}") == split
+                    ]
+                
+                print(f"[DATA] Found {len(image_files)} {split or 'total'} images for "
+                      f"{disease}/{species}")
+                
+                image_paths.extend(str(disease_path / disease / species / name) for name in image_files)
+                disease_indices.extend([disease_idx] * len(image_files))
+                species_indices.extend([species_idx] * len(image_files))
+        
+        if len(self.split_index["assignments"]) != known_images:
+            self._save_split_index()
+        
+        return image_paths, disease_indices, species_indices
+    
+    def _decode_image(self, image_path: tf.Tensor) -> tf.Tensor:
+        """
+        Decode and resize a single image inside a tf.data pipeline.
+        
+        Args:
+            image_path: Scalar string tensor with the image path
+            
+        Returns:
+            uint8 image tensor of shape (height, width, 3)
+        """
+        if self.image_cache is not None:
+            image = tf.numpy_function(
+                self._read_cached_image, [image_path], tf.uint8
+            )
+            image.set_shape((*self.image_size, 3))
+            return image
+        
+        image = tf.io.read_file(image_path)
+        image = tf.io.decode_image(image, channels=3, expand_animations=False)
+        image = tf.image.resize(image, self.image_size)
+        return tf.cast(tf.round(image), tf.uint8)
+    
+    def _read_cached_image(self, image_path: bytes) -> np.ndarray:
+        """
+        Read preprocessed pixels from the image cache, decoding on a miss.
+        
+        Args:
+            image_path: Image path as passed through tf.numpy_function
+            
+        Returns:
+            uint8 image array of shape (height, width, 3)
+        """
+        image_path = image_path.decode()
+        cached = self.image_cache.get_for_path(image_path)
+        if cached is not None:
+            return cached
+        return decode_image_uint8(image_path, self.image_size)
+    
+    def get_tf_dataset(
+        self,
+        split: str = "train",
+        batch_size: int = 32,
+        shuffle: bool = True,
+        cache_dir: str = None,
+        shuffle_buffer: int = 1000,
+        augment: bool = False,
+        num_shards: int = 1,
+        shard_index: int = 0
+    ) -> tf.data.Dataset:
+        """
+        Build a streaming tf.data pipeline for a dataset split.
+        
+        Files are listed once; decoding and resizing run in parallel and
+        batches are prefetched, so memory stays flat regardless of dataset
+        size. Decoded images can optionally be cached to disk as uint8,
+        in a cache file named after the split's file list and labels.
+        
+        Args:
+            split: One of 'train', 'val', 'test'
+            batch_size: Number of images per batch
+            shuffle: Whether to shuffle examples every epoch
+            cache_dir: Directory for the on-disk decode cache (disabled if None)
+            shuffle_buffer: Shuffle buffer size when reading from the cache
+            augment: Apply batched random augmentation in the pipeline
+            num_shards: Number of workers the split is divided between
+            shard_index: This worker's shard; each worker only lists and
+                decodes its own files
+            
+        Returns:
+            Dataset yielding (images, {'disease_diagnosis', 'species_identification'})
+        """
+        if not self.disease_classes:
+            raise ValueError("Call prepare_data() first")
+        
+        image_paths, disease_indices, species_indices = self.list_image_files(split)
+        if num_shards > 1:
+            image_paths = image_paths[shard_index::num_shards]
+            disease_indices = disease_indices[shard_index::num_shards]
+            species_indices = species_indices[shard_index::num_shards]
+            print(f"[DATA] Streaming {len(image_paths)} images for {split} "
+                  f"(shard {shard_index + 1}/{num_shards})")
+        else:
+            print(f"[DATA] Streaming {len(image_paths)} images for {split}")
+        
+        num_diseases = len(self.disease_classes)
+        num_species = len(self.species_classes)
+        
+        dataset = tf.data.Dataset.from_tensor_slices((
+            tf.constant(image_paths, dtype=tf.string),
+            tf.constant(disease_indices, dtype=tf.int32),
+            tf.constant(species_indices, dtype=tf.int32)
+        ))
+        
+        # Shuffling paths is cheap; only shuffle decoded images when they
+        # come back from the cache
+        if shuffle and not cache_dir:
+            dataset = dataset.shuffle(max(len(image_paths), 1), reshuffle_each_iteration=True)
+        
+        dataset = dataset.map(
+            lambda path, d, s: (self._decode_image(path), d, s),
+            num_parallel_calls=tf.data.AUTOTUNE
+        )
+        
+        if cache_dir:
+            cache_path = Path(cache_dir)
+            cache_path.mkdir(parents=True, exist_ok=True)
+            height, width = self.image_size
+            # tf.data reuses any cache file with a matching name, so the name
+            # changes whenever the listed files or their labels do
+            listing = hashlib.sha1()
+            for entry in zip(image_paths, disease_indices, species_indices):
+                listing.update(("\0".join(map(str, entry)) + "\n").encode('utf-8'))
+            cache_name = f"{split}_{height}x{width}"
+            if num_shards > 1:
+                cache_name += f"_shard{shard_index}of{num_shards}"
+            cache_name += f"_{listing.hexdigest()[:16]}"
+            dataset = dataset.cache(str(cache_path / cache_name))
+            if shuffle:
+                dataset = dataset.shuffle(shuffle_buffer, reshuffle_each_iteration=True)
+        
+        dataset = dataset.map(
+            lambda image, d, s: (
+                tf.cast(image, tf.float32) / 255.0,
+                {
+                    'disease_diagnosis': tf.one_hot(d, num_diseases),
+                    'species_identification': tf.one_hot(s, num_species)
+                }
+            ),
+            num_parallel_calls=tf.data.AUTOTUNE
+        )
+        
+        dataset = dataset.batch(batch_size)
+        
+        # Augmentation runs in the input pipeline, overlapping with training,
+        # so it never becomes part of the model graph
+        if augment:
+            dataset = augment_dataset(dataset)
+        
+        return dataset.prefetch(tf.data.AUTOTUNE)
+    
     def load_dataset(
         self,
         split: str = "train",
-        augment: bool = False
+        augment: bool = False,
+        num_workers: int = 1
     ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
         """
         Load a dataset split.
@@ -157,6 +519,9 @@ class DataLoader:
         Args:
             split: One of 'train', 'val', 'test'
             augment: Whether to apply data augmentation
+            num_workers: Decoding processes; above 1 (or -1 for every core)
+                decodes in parallel. Either way, images that fail to
+                decode are skipped and recorded in self.load_failures
             
         Returns:
             Tuple of (images, disease_labels, species_labels)
@@ -167,42 +532,35 @@ class DataLoader:
         
         print(f"[DATA] Loading {split} dataset...")
         
-        images = []
-        disease_labels = []
-        species_labels = []
+        image_files, disease_idx, species_idx = self.list_image_files(split)
         
-        disease_path = self.dataset_path / "disease_images"
+        if num_workers == -1:
+            num_workers = os.cpu_count() or 1
         
-        for disease_dir in disease_path.iterdir():
-            if not disease_dir.is_dir():
-                continue
+        self.load_failures = []
+        if num_workers > 1:
+            images, loaded = self._load_images_parallel(image_files, num_workers)
+            disease_labels = np.array(disease_idx)[loaded]
+            species_labels = np.array(species_idx)[loaded]
+        else:
+            images = []
+            disease_labels = []
+            species_labels = []
             
-            disease_idx = self.disease_to_idx[disease_dir.name]
+            for img_file, d_idx, s_idx in zip(image_files, disease_idx, species_idx):
+                image = self.load_image(img_file)
+                if image is not None:
+                    images.append(image)
+                    disease_labels.append(d_idx)
+                    species_labels.append(s_idx)
             
-            for species_dir in disease_dir.iterdir():
-                if not species_dir.is_dir():
-                    continue
-                
-                species_idx = self.species_to_idx[species_dir.name]
-                
-                # Get all images in species directory
-                image_files = list(species_dir.glob("*.jpg")) + \
-                             list(species_dir.glob("*.png")) + \
-                             list(species_dir.glob("*.jpeg"))
-                
-                print(f"[DATA] Found {len(image_files)} images for "
-                      f"{disease_dir.name}/{species_dir.name}")
-                
-                for img_file in image_files:
-                    image = self.load_image(str(img_file))
-                    if image is not None:
-                        images.append(image)
-                        disease_labels.append(disease_idx)
-                        species_labels.append(species_idx)
+            images = np.array(images)
+            disease_labels = np.array(disease_labels)
+            species_labels = np.array(species_labels)
         
-        images = np.array(images)
-        disease_labels = np.array(disease_labels)
-        species_labels = np.array(species_labels)
+        if self.load_failures:
+            print(f"[DATA] {len(self.load_failures)} images failed to load "
+                  f"(see load_failures)")
         
         # Convert labels to one-hot encoding
         disease_labels = tf.keras.utils.to_categorical(
@@ -219,10 +577,84 @@ class DataLoader:
         
         return images, disease_labels, species_labels
     
+    def _load_images_parallel(
+        self,
+        image_files: List[str],
+        num_workers: int,
+        chunk_size: int = 64
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Decode images across worker processes into a shared-memory buffer.
+        
+        Workers write pixels straight into the shared buffer, so decoded
+        arrays are never pickled back to the parent. Failed images are
+        appended to self.load_failures.
+        
+        Args:
+            image_files: Paths of the images to decode
+            num_workers: Number of worker processes
+            chunk_size: Images per task sent to a worker
+            
+        Returns:
+            Tuple of (images, boolean mask of successfully loaded files)
+        """
+        shape = (len(image_files), *self.image_size, 3)
+        nbytes = max(int(np.prod(shape)) * np.dtype(np.float32).itemsize, 1)
+        shm = shared_memory.SharedMemory(create=True, size=nbytes)
+        
+        loaded = np.ones(len(image_files), dtype=bool)
+        done = 0
+        next_report = 0
+        start = time.perf_counter()
+        
+        try:
+            with ProcessPoolExecutor(
+                max_workers=num_workers,
+                initializer=_attach_shared_images,
+                initargs=(shm.name, shape)
+            ) as executor:
+                futures = [
+                    executor.submit(
+                        _decode_chunk_into_shared,
+                        offset,
+                        image_files[offset:offset + chunk_size],
+                        self.image_size
+                    )
+                    for offset in range(0, len(image_files), chunk_size)
+                ]
+                
+                for future in as_completed(futures):
+                    count, failures = future.result()
+                    done += count
+                    for index, error in failures:
+                        loaded[index] = False
+                        self.load_failures.append({
+                            "path": image_files[index],
+                            "error": error
+                        })
+                    
+                    if done >= next_report or done == len(image_files):
+                        rate = done / max(time.perf_counter() - start, 1e-9)
+                        print(f"[DATA] Decoded {done}/{len(image_files)} images "
+                              f"({rate:.1f} images/s, {num_workers} workers)")
+                        next_report = done + max(len(image_files) // 10, 1)
+            
+            images = np.ndarray(shape, dtype=np.float32, buffer=shm.buf)
+            images = images[loaded] if not loaded.all() else images.copy()
+        finally:
+            shm.close()
+            shm.unlink()
+        
+        return images, loaded
+    
     def get_augmentation_generator(self) -> ImageDataGenerator:
         """
         Create an image data augmentation generator.
         
+        Augments one image at a time in Python; kept for array-based
+        training. Prefer get_tf_dataset(augment=True), which applies the
+        same ranges batch-wise.
+        
         Returns:
             ImageDataGenerator configured for training
         """
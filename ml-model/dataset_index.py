@@ -0,0 +1,195 @@
+"""
+Persisted filesystem index of the disease_images/ tree.
+
+Walking hundreds of thousands of files on a network mount takes minutes,
+so the index records every image's path, size, mtime and class once and
+keeps it next to the dataset. Adding, removing or renaming a file
+updates its directory's mtime, so a refresh stats each directory and
+only rescans the ones whose mtime changed. Files rewritten in place keep
+their directory's mtime, so their recorded size and mtime can go stale.
+
+Layout of the index file:
+{
+  "version": 1,
+  "directories": {
+    "": {"mtime_ns": ..., "subdirs": ["disease_a", ...], "files": []},
+    "disease_a/species_1": {"mtime_ns": ..., "subdirs": [], "files": [[name, size, mtime_ns], ...]}
+  }
+}
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+
+# Directory timestamps this close to the scan may still change within the
+# same filesystem timestamp tick, so they aren't trusted on the next refresh
+RACY_WINDOW_NS = 2 * 10 ** 9
+
+
+class DatasetIndex:
+    """
+    Cached listing of a <disease>/<species>/<image> directory tree.
+
+    Only the first two directory levels are indexed; images are the files
+    directly inside species directories.
+    """
+
+    VERSION = 1
+
+    def __init__(
+        self,
+        root: str,
+        index_file: str,
+        extensions: Tuple[str, ...] = ('.jpg', '.jpeg', '.png')
+    ):
+        """
+        Initialize the index.
+
+        Args:
+            root: Directory holding the disease class directories
+            index_file: Where the index is persisted
+            extensions: Image file extensions to record (lowercase)
+        """
+        self.root = Path(root)
+        self.index_file = Path(index_file)
+        self.extensions = extensions
+        self.directories = self._load()
+
+    def _load(self) -> Dict:
+        if self.index_file.exists():
+            try:
+                with open(self.index_file, 'r') as f:
+                    index = json.load(f)
+                if index.get("version") == self.VERSION:
+                    return index["directories"]
+            except (OSError, ValueError) as e:
+                print(f"[WARNING] Ignoring unreadable dataset index {self.index_file}: {e}")
+        return {}
+
+    def _save(self):
+        # Every worker refreshes the same index; a temporary file per save
+        # keeps concurrent saves from writing into one file
+        fd, tmp_file = tempfile.mkstemp(dir=self.index_file.parent, prefix=self.index_file.name, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump({"version": self.VERSION, "directories": self.directories}, f)
+            os.replace(tmp_file, self.index_file)
+        except BaseException:
+            os.unlink(tmp_file)
+            raise
+
+    def _scan(self, rel_dir: str, depth: int) -> Dict:
+        """List one directory with scandir"""
+        subdirs = []
+        files = []
+        with os.scandir(self.root / rel_dir) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    subdirs.append(entry.name)
+                elif depth == 2 and os.path.splitext(entry.name)[1].lower() in self.extensions:
+                    stat = entry.stat()
+                    files.append([entry.name, stat.st_size, stat.st_mtime_ns])
+        return {"subdirs": sorted(subdirs), "files": sorted(files)}
+
+    def refresh(self) -> Dict:
+        """
+        Bring the index up to date with the directory tree.
+
+        Returns:
+            Dictionary with the number of directories rescanned and reused
+        """
+        now_ns = time.time_ns()
+        previous = self.directories
+        directories = {}
+        rescanned = 0
+
+        pending = [("", 0)]
+        while pending:
+            rel_dir, depth = pending.pop()
+            try:
+                mtime_ns = os.stat(self.root / rel_dir).st_mtime_ns
+            except FileNotFoundError:
+                continue
+
+            cached = previous.get(rel_dir)
+            if cached is not None and cached["mtime_ns"] == mtime_ns and not cached.get("racy"):
+                entry = cached
+            else:
+                entry = self._scan(rel_dir, depth)
+                entry["mtime_ns"] = mtime_ns
+                if now_ns - mtime_ns <= RACY_WINDOW_NS:
+                    entry["racy"] = True
+                rescanned += 1
+            directories[rel_dir] = entry
+
+            if depth < 2:
+                pending.extend(
+                    (f"{rel_dir}/{name}" if rel_dir else name, depth + 1)
+                    for name in entry["subdirs"]
+                )
+
+        changed = rescanned > 0 or directories.keys() != previous.keys()
+        self.directories = directories
+        if changed:
+            self._save()
+
+        stats = {"rescanned": rescanned, "reused": len(directories) - rescanned}
+        print(f"[DATA] Dataset index: rescanned {stats['rescanned']} of "
+              f"{len(directories)} directories")
+        return stats
+
+    def disease_classes(self) -> List[str]:
+        """Names of the disease directories"""
+        return self.directories.get("", {}).get("subdirs", [])
+
+    def species_classes(self) -> List[str]:
+        """Names of the species directories across all diseases"""
+        species = set()
+        for disease in self.disease_classes():
+            species.update(self.directories.get(disease, {}).get("subdirs", []))
+        return sorted(species)
+
+    def species_dirs(self, disease: str) -> List[str]:
+        """Species directories of one disease"""
+        return self.directories.get(disease, {}).get("subdirs", [])
+
+    def images(self, disease: str, species: str) -> List[Tuple[str, int, int]]:
+        """
+        Images of one disease/species directory.
+
+        Args:
+            disease: Disease directory name
+            species: Species directory name
+
+        Returns:
+            List of (file name, size, mtime_ns), sorted by name
+        """
+        return [tuple(f) for f in self.directories.get(f"{disease}/{species}", {}).get("files", [])]
+
+    def records(self) -> List[Dict]:
+        """Every indexed image with its path, size, mtime and class"""
+        records = []
+        for disease in self.disease_classes():
+            for species in self.species_dirs(disease):
+                for name, size, mtime_ns in self.images(disease, species):
+                    records.append({
+                        "path": str(self.root / disease / species / name),
+                        "size": size,
+                        "mtime_ns": mtime_ns,
+                        "disease": disease,
+                        "species": species
+                    })
+        return records
+
+    def fingerprint(self) -> str:
+        """SHA-1 of every indexed image's path, size and mtime"""
+        digest = hashlib.sha1()
+        for record in self.records():
+            digest.update(f"{record['path']}\0{record['size']}\0{record['mtime_ns']}\n".encode('utf-8'))
+        return digest.hexdigest()
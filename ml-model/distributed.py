@@ -0,0 +1,265 @@
+"""
+Multi-worker data-parallel training across CPU nodes.
+
+Workers run MultiWorkerMirroredStrategy: every worker holds a full model
+replica, trains on its own shard of the input pipeline and gradients are
+all-reduced each step, so all replicas stay identical. The cluster is
+described by the TF_CONFIG environment variable; worker 0 is the chief and
+owns checkpoints, logs and saved models.
+
+Usage:
+    # Train with 2 local worker processes
+    python distributed.py launch --workers 2 -- --dataset_path ./data --output_dir ./trained_models
+
+    # Measure scaling efficiency for 1, 2 and 4 workers
+    python distributed.py scaling --workers 1 2 4
+"""
+
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import tensorflow as tf
+
+
+def get_tf_config() -> Dict:
+    """Read the cluster description from TF_CONFIG"""
+    return json.loads(os.environ.get("TF_CONFIG", "{}"))
+
+
+def num_workers(tf_config: Optional[Dict] = None) -> int:
+    """Number of workers in the cluster (1 without TF_CONFIG)"""
+    tf_config = get_tf_config() if tf_config is None else tf_config
+    return max(len(tf_config.get("cluster", {}).get("worker", [])), 1)
+
+
+def worker_index(tf_config: Optional[Dict] = None) -> int:
+    """Index of this worker (0 without TF_CONFIG)"""
+    tf_config = get_tf_config() if tf_config is None else tf_config
+    return tf_config.get("task", {}).get("index", 0)
+
+
+def is_chief(tf_config: Optional[Dict] = None) -> bool:
+    """Whether this process is the chief (worker 0, or a dedicated chief task)"""
+    tf_config = get_tf_config() if tf_config is None else tf_config
+    task_type = tf_config.get("task", {}).get("type", "worker")
+    return task_type == "chief" or (task_type == "worker" and worker_index(tf_config) == 0)
+
+
+def create_strategy() -> tf.distribute.Strategy:
+    """
+    Create the multi-worker strategy for this process.
+
+    Must be called before any other TensorFlow op runs in the process.
+
+    Returns:
+        MultiWorkerMirroredStrategy using ring all-reduce (suited to CPUs)
+    """
+    communication = tf.distribute.experimental.CommunicationOptions(
+        implementation=tf.distribute.experimental.CommunicationImplementation.RING
+    )
+    strategy = tf.distribute.MultiWorkerMirroredStrategy(communication_options=communication)
+    print(f"[DIST] Worker {worker_index()} of {num_workers()} "
+          f"({'chief' if is_chief() else 'worker'}), "
+          f"{strategy.num_replicas_in_sync} replicas in sync")
+    return strategy
+
+
+def _free_ports(count: int) -> List[int]:
+    """Reserve free localhost ports for a local cluster"""
+    sockets = []
+    for _ in range(count):
+        s = socket.socket()
+        s.bind(("localhost", 0))
+        sockets.append(s)
+    ports = [s.getsockname()[1] for s in sockets]
+    for s in sockets:
+        s.close()
+    return ports
+
+
+def launch_local_workers(
+    num_workers: int,
+    command: List[str],
+    log_dir: Optional[str] = None
+) -> List[int]:
+    """
+    Run a command as a local multi-worker cluster, one process per worker.
+
+    The chief's output goes to this terminal; other workers log to
+    log_dir/worker_<i>.log.
+
+    Args:
+        num_workers: Number of worker processes
+        command: Command each worker runs (e.g. [python, train.py, ...])
+        log_dir: Directory for non-chief worker logs (temp dir if None)
+
+    Returns:
+        Exit codes of the workers, chief first
+    """
+    log_dir = Path(log_dir or tempfile.mkdtemp(prefix="workers_"))
+    log_dir.mkdir(parents=True, exist_ok=True)
+    workers = [f"localhost:{port}" for port in _free_ports(num_workers)]
+
+    processes = []
+    log_files = []
+    for index in range(num_workers):
+        env = dict(os.environ)
+        env["TF_CONFIG"] = json.dumps({
+            "cluster": {"worker": workers},
+            "task": {"type": "worker", "index": index}
+        })
+        if index == 0:
+            output = None
+        else:
+            output = open(log_dir / f"worker_{index}.log", 'w')
+            log_files.append(output)
+        processes.append(subprocess.Popen(
+            command, env=env, stdout=output, stderr=subprocess.STDOUT if output else None
+        ))
+
+    print(f"[DIST] Launched {num_workers} workers (logs: {log_dir})")
+    exit_codes = [process.wait() for process in processes]
+    for f in log_files:
+        f.close()
+    return exit_codes
+
+
+def _run_scaling_worker(per_worker_batch: int, steps: int, image_size: int) -> Optional[Dict]:
+    """Train on synthetic data for a fixed number of steps and time it"""
+    strategy = create_strategy()
+
+    from model import PlantHealthModel
+
+    workers = num_workers()
+    global_batch = per_worker_batch * workers
+
+    def dataset_fn(input_context):
+        batch = input_context.get_per_replica_batch_size(global_batch)
+        images = tf.random.stateless_uniform(
+            (batch * 4, image_size, image_size, 3), seed=(input_context.input_pipeline_id, 0)
+        )
+        labels = {
+            'disease_diagnosis': tf.one_hot(tf.range(batch * 4) % 12, 12),
+            'species_identification': tf.one_hot(tf.range(batch * 4) % 50, 50)
+        }
+        return tf.data.Dataset.from_tensor_slices((images, labels)).repeat().batch(batch)
+
+    with strategy.scope():
+        model = PlantHealthModel(input_shape=(image_size, image_size, 3)).build_model(pretrained=False)
+    dataset = strategy.distribute_datasets_from_function(dataset_fn)
+
+    # Warm-up step traces the graph and sets up the collectives
+    model.fit(dataset, steps_per_epoch=1, epochs=1, verbose=0)
+
+    start = time.perf_counter()
+    model.fit(dataset, steps_per_epoch=steps, epochs=1, verbose=0)
+    seconds = time.perf_counter() - start
+
+    if not is_chief():
+        return None
+    return {
+        "workers": workers,
+        "global_batch": global_batch,
+        "images_per_sec": round(steps * global_batch / seconds, 2)
+    }
+
+
+def benchmark_scaling(
+    worker_counts: List[int],
+    per_worker_batch: int = 8,
+    steps: int = 10,
+    image_size: int = 224
+) -> Dict:
+    """
+    Measure training throughput and scaling efficiency for each worker count.
+
+    Uses weak scaling: the per-worker batch is fixed, so the global batch
+    grows with the worker count. Efficiency is throughput divided by the
+    single-worker throughput times the worker count.
+
+    Args:
+        worker_counts: Worker counts to measure (should include 1)
+        per_worker_batch: Batch size per worker
+        steps: Timed training steps per run
+        image_size: Synthetic image height and width
+
+    Returns:
+        Dictionary with images per second and efficiency per worker count
+    """
+    results = []
+    for count in worker_counts:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            result_file = Path(tmp_dir) / "result.json"
+            exit_codes = launch_local_workers(count, [
+                sys.executable, os.path.abspath(__file__), "run-scaling-worker",
+                "--per_worker_batch", str(per_worker_batch),
+                "--steps", str(steps),
+                "--image_size", str(image_size),
+                "--result_file", str(result_file)
+            ], log_dir=tmp_dir)
+            if any(exit_codes):
+                raise RuntimeError(f"Scaling run with {count} workers failed: {exit_codes}")
+            with open(result_file, 'r') as f:
+                results.append(json.load(f))
+
+    baseline = next((r["images_per_sec"] for r in results if r["workers"] == 1), None)
+    for result in results:
+        result["efficiency"] = (
+            round(result["images_per_sec"] / (baseline * result["workers"]), 3)
+            if baseline else None
+        )
+
+    print(f"[DIST] {'Workers':>7} {'Global batch':>12} {'Images/s':>10} {'Efficiency':>10}")
+    for result in results:
+        efficiency = f"{result['efficiency']:.0%}" if result["efficiency"] is not None else "n/a"
+        print(f"[DIST] {result['workers']:>7} {result['global_batch']:>12} "
+              f"{result['images_per_sec']:>10} {efficiency:>10}")
+
+    return {"cpu_count": os.cpu_count(), "results": results}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Multi-worker CPU training")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    launch = subparsers.add_parser("launch", help="Run train.py as a local multi-worker cluster")
+    launch.add_argument("--workers", type=int, default=2)
+    launch.add_argument("--log_dir", help="Directory for non-chief worker logs")
+    launch.add_argument("train_args", nargs=argparse.REMAINDER, help="Arguments for train.py (after --)")
+
+    scaling = subparsers.add_parser("scaling", help="Measure scaling efficiency")
+    scaling.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    scaling.add_argument("--per_worker_batch", type=int, default=8)
+    scaling.add_argument("--steps", type=int, default=10)
+    scaling.add_argument("--image_size", type=int, default=224)
+
+    worker = subparsers.add_parser("run-scaling-worker", help=argparse.SUPPRESS)
+    worker.add_argument("--per_worker_batch", type=int, default=8)
+    worker.add_argument("--steps", type=int, default=10)
+    worker.add_argument("--image_size", type=int, default=224)
+    worker.add_argument("--result_file", required=True)
+
+    args = parser.parse_args()
+
+    if args.command == "launch":
+        train_args = [a for a in args.train_args if a != "--"]
+        train_script = str(Path(__file__).resolve().parent / "train.py")
+        exit_codes = launch_local_workers(
+            args.workers, [sys.executable, train_script, "--distributed", *train_args], args.log_dir
+        )
+        sys.exit(max(exit_codes))
+    elif args.command == "scaling":
+        benchmark_scaling(args.workers, args.per_worker_batch, args.steps, args.image_size)
+    else:
+        result = _run_scaling_worker(args.per_worker_batch, args.steps, args.image_size)
+        if result is not None:
+            with open(args.result_file, 'w') as f:
+                json.dump(result, f)
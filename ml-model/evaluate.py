@@ -1,22 +1,310 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
-from typing import Tuple, Dict, List
-from sklearn.metrics import (
-    confusion_matrix, classification_report, accuracy_score,
-    precision_score, recall_score, f1_score, roc_auc_score
-)
+import tensorflow as tf
+from typing import Tuple, Dict, List, Iterable, Optional
+from sklearn.metrics import confusion_matrix
 import matplotlib.pyplot as plt
 import seaborn as sns
+from manifest import manifest_images
 from model import PlantHealthModel
 
 
+# Model outputs and the keys their metrics are reported under
+TASKS = {
+    'disease_diagnosis': ('disease', "Disease Diagnosis"),
+    'species_identification': ('species', "Species Identification")
+}
+
+
+def metrics_from_confusion_matrix(cm: np.ndarray) -> Dict:
+    """
+    Derive accuracy and macro/weighted precision, recall and F1 from a confusion matrix.
+    
+    Rows are true classes, columns predicted classes. As in sklearn, only
+    classes that occur in the labels or the predictions are averaged.
+    
+    Args:
+        cm: Confusion matrix (num_classes, num_classes)
+        
+    Returns:
+        Dictionary with accuracy, macro precision/recall/F1 and a
+        classification report in sklearn's output_dict format
+    """
+    cm = np.asarray(cm, dtype=np.float64)
+    tp = np.diag(cm)
+    support = cm.sum(axis=1)
+    predicted = cm.sum(axis=0)
+    total = support.sum()
+    
+    with np.errstate(divide='ignore', invalid='ignore'):
+        precision = np.where(predicted > 0, tp / predicted, 0.0)
+        recall = np.where(support > 0, tp / support, 0.0)
+        f1 = np.where(precision + recall > 0, 2 * precision * recall / (precision + recall), 0.0)
+    
+    present = (support + predicted) > 0
+    accuracy = tp.sum() / total if total else 0.0
+    macro = [float(v[present].mean()) if present.any() else 0.0 for v in (precision, recall, f1)]
+    weighted = [float((v * support).sum() / total) if total else 0.0 for v in (precision, recall, f1)]
+    
+    class_report = {
+        str(label): {
+            'precision': float(precision[label]),
+            'recall': float(recall[label]),
+            'f1-score': float(f1[label]),
+            'support': int(support[label])
+        }
+        for label in np.flatnonzero(present)
+    }
+    class_report['accuracy'] = float(accuracy)
+    class_report['macro avg'] = {
+        'precision': macro[0], 'recall': macro[1], 'f1-score': macro[2], 'support': int(total)
+    }
+    class_report['weighted avg'] = {
+        'precision': weighted[0], 'recall': weighted[1], 'f1-score': weighted[2], 'support': int(total)
+    }
+    
+    return {
+        'accuracy': float(accuracy),
+        'precision': macro[0],
+        'recall': macro[1],
+        'f1_score': macro[2],
+        'classification_report': class_report
+    }
+
+
+def _bootstrap_chunk(
+    cell_probs: np.ndarray,
+    num_samples: int,
+    num_resamples: int,
+    seed: np.random.SeedSequence
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Draw bootstrap confusion matrices and compute their metrics.
+    
+    Resampling test samples with replacement is a multinomial draw over the
+    confusion matrix cells, so no per-sample arrays are needed.
+    
+    Returns:
+        Tuple of (accuracy, macro F1, per-class recall) per resample
+    """
+    k = int(np.sqrt(len(cell_probs)))
+    rng = np.random.default_rng(seed)
+    cms = rng.multinomial(num_samples, cell_probs, size=num_resamples).reshape(-1, k, k)
+    
+    tp = np.diagonal(cms, axis1=1, axis2=2).astype(np.float64)
+    support = cms.sum(axis=2)
+    predicted = cms.sum(axis=1)
+    
+    with np.errstate(divide='ignore', invalid='ignore'):
+        precision = np.where(predicted > 0, tp / predicted, 0.0)
+        recall = np.where(support > 0, tp / support, np.nan)
+        recall_or_zero = np.nan_to_num(recall)
+        f1 = np.where(precision + recall_or_zero > 0,
+                      2 * precision * recall_or_zero / (precision + recall_or_zero), 0.0)
+    present = (support + predicted) > 0
+    
+    accuracy = tp.sum(axis=1) / num_samples
+    macro_f1 = (f1 * present).sum(axis=1) / np.maximum(present.sum(axis=1), 1)
+    return accuracy, macro_f1, recall
+
+
+def bootstrap_confidence_intervals(
+    cm: np.ndarray,
+    num_resamples: int = 1000,
+    confidence: float = 0.95,
+    num_workers: Optional[int] = None,
+    seed: int = 42,
+    chunk_size: int = 500
+) -> Optional[Dict]:
+    """
+    Percentile bootstrap confidence intervals for accuracy, macro F1 and per-class recall.
+    
+    Resamples are drawn in chunks with independent seeds, so the intervals
+    are the same whatever the number of workers.
+    
+    Args:
+        cm: Confusion matrix of the test set
+        num_resamples: Bootstrap resamples
+        confidence: Interval coverage
+        num_workers: Processes to split the resamples across; None uses
+            every core once the work is large enough to outweigh process
+            start-up
+        seed: Random seed
+        chunk_size: Resamples per task
+        
+    Returns:
+        Dictionary with [low, high] intervals (None for an empty matrix)
+    """
+    cm = np.asarray(cm, dtype=np.int64)
+    num_samples = int(cm.sum())
+    if num_samples == 0:
+        return None
+    
+    cell_probs = (cm / num_samples).ravel()
+    sizes = [min(chunk_size, num_resamples - start) for start in range(0, num_resamples, chunk_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    
+    if num_workers is None:
+        num_workers = (os.cpu_count() or 1) if num_resamples * cm.size >= 20_000_000 else 1
+    
+    if num_workers > 1 and len(sizes) > 1:
+        with ProcessPoolExecutor(max_workers=min(num_workers, len(sizes))) as executor:
+            chunks = list(executor.map(
+                _bootstrap_chunk,
+                [cell_probs] * len(sizes), [num_samples] * len(sizes), sizes, seeds
+            ))
+    else:
+        chunks = [_bootstrap_chunk(cell_probs, num_samples, size, chunk_seed)
+                  for size, chunk_seed in zip(sizes, seeds)]
+    
+    accuracy = np.concatenate([c[0] for c in chunks])
+    macro_f1 = np.concatenate([c[1] for c in chunks])
+    recall = np.concatenate([c[2] for c in chunks])
+    
+    tail = 100 * (1 - confidence) / 2
+    bounds = [tail, 100 - tail]
+    
+    def interval(values):
+        return [round(float(v), 4) for v in np.nanpercentile(values, bounds)]
+    
+    return {
+        "confidence": confidence,
+        "resamples": num_resamples,
+        "accuracy": interval(accuracy),
+        "f1_score": interval(macro_f1),
+        "per_class_recall": {
+            str(label): interval(recall[:, label])
+            for label in np.flatnonzero(cm.sum(axis=1))
+        }
+    }
+
+
+class StreamingClassificationMetrics:
+    """
+    Confusion matrix and score histograms accumulated batch by batch.
+    
+    Memory is fixed by the number of classes (and AUC bins), not the number
+    of samples. One-vs-rest ROC-AUC is computed from per-class histograms of
+    the predicted probability for positives and negatives; scores in the
+    same bin count as ties, so with the default 1000 bins it is within about
+    0.001 of the exact value.
+    """
+    
+    def __init__(self, num_classes: int, auc_bins: int = 1000):
+        """
+        Initialize the accumulators.
+        
+        Args:
+            num_classes: Number of classes
+            auc_bins: Probability bins for the ROC-AUC histograms
+        """
+        self.num_classes = num_classes
+        self.auc_bins = auc_bins
+        self.confusion = np.zeros((num_classes, num_classes), dtype=np.int64)
+        self.positive_hist = np.zeros((num_classes, auc_bins), dtype=np.int64)
+        self.negative_hist = np.zeros((num_classes, auc_bins), dtype=np.int64)
+    
+    @property
+    def count(self) -> int:
+        return int(self.confusion.sum())
+    
+    def update(self, y_true: np.ndarray, y_pred_proba: np.ndarray):
+        """
+        Add a batch.
+        
+        Args:
+            y_true: True labels, class indices or one-hot encoded
+            y_pred_proba: Predicted probabilities (batch, num_classes)
+        """
+        y_true = np.asarray(y_true)
+        y_pred_proba = np.asarray(y_pred_proba, dtype=np.float32)
+        if y_true.ndim > 1:
+            y_true = np.argmax(y_true, axis=1)
+        y_true = y_true.astype(np.int64)
+        y_pred = np.argmax(y_pred_proba, axis=1)
+        k = self.num_classes
+        
+        self.confusion += np.bincount(y_true * k + y_pred, minlength=k * k).reshape(k, k)
+        
+        bins = np.clip((y_pred_proba * self.auc_bins).astype(np.int64), 0, self.auc_bins - 1)
+        flat = (np.arange(k) * self.auc_bins + bins).ravel()
+        positive = (y_true[:, None] == np.arange(k)).ravel()
+        size = k * self.auc_bins
+        self.positive_hist += np.bincount(flat[positive], minlength=size).reshape(k, -1)
+        self.negative_hist += np.bincount(flat[~positive], minlength=size).reshape(k, -1)
+    
+    def roc_auc(self) -> Optional[float]:
+        """Macro one-vs-rest ROC-AUC over classes with positives and negatives"""
+        positives = self.positive_hist.sum(axis=1)
+        negatives = self.negative_hist.sum(axis=1)
+        valid = (positives > 0) & (negatives > 0)
+        if valid.sum() < 2:
+            return None
+        
+        # P(positive score > negative score) + 0.5 * P(same bin)
+        negatives_below = np.cumsum(self.negative_hist, axis=1) - self.negative_hist
+        wins = (self.positive_hist * (negatives_below + 0.5 * self.negative_hist)).sum(axis=1)
+        auc = wins[valid] / (positives[valid] * negatives[valid])
+        return float(auc.mean())
+    
+    def result(self) -> Dict:
+        """
+        Compute all metrics from the accumulated state.
+        
+        Returns:
+            Dictionary of metrics, including the confusion matrix
+        """
+        metrics = metrics_from_confusion_matrix(self.confusion)
+        metrics['roc_auc'] = self.roc_auc()
+        metrics['confusion_matrix'] = self.confusion.tolist()
+        return metrics
+
+
+def manifest_dataset(
+    manifest_path: str,
+    image_size: Tuple[int, int] = (224, 224),
+    batch_size: int = 32,
+    split: Optional[str] = "test",
+    output: str = 'disease_diagnosis'
+) -> tf.data.Dataset:
+    """
+    Stream a DatasetManager training manifest as evaluation batches.
+    
+    Args:
+        manifest_path: Manifest .json or .jsonl (DatasetManager.export_training_manifest)
+        image_size: Model input size
+        batch_size: Images per batch
+        split: Only images of this split (all images if None)
+        output: Model output the manifest's class_id labels belong to
+        
+    Returns:
+        Dataset yielding (images, {output: class_id})
+    """
+    _, images = manifest_images(manifest_path, split)
+    
+    def decode(path, label):
+        image = tf.io.decode_image(tf.io.read_file(path), channels=3, expand_animations=False)
+        image = tf.image.resize(image, image_size)
+        return image / 255.0, {output: label}
+    
+    dataset = tf.data.Dataset.from_tensor_slices((
+        tf.constant([i['path'] for i in images], dtype=tf.string),
+        tf.constant([i['class_id'] for i in images], dtype=tf.int32)
+    ))
+    return dataset.map(decode, num_parallel_calls=tf.data.AUTOTUNE).batch(batch_size).prefetch(tf.data.AUTOTUNE)
+
+
 class ModelEvaluator:
     """
     Evaluation metrics and visualization for the plant health model.
     
     Provides:
+    - Streaming evaluation over batches with constant memory
     - Accuracy, precision, recall, F1-score metrics
     - Confusion matrix generation
     - ROC-AUC analysis
+    - Bootstrap confidence intervals
     - Classification reports
     - Visualization tools
     """
@@ -35,7 +323,8 @@ class ModelEvaluator:
         self,
         test_images: np.ndarray,
         test_labels_disease: np.ndarray,
-        test_labels_species: np.ndarray
+        test_labels_species: np.ndarray,
+        bootstrap_resamples: int = 1000
     ) -> Dict:
         """
         Evaluate model on test data.
@@ -44,100 +333,97 @@ class ModelEvaluator:
             test_images: Test images
             test_labels_disease: Ground truth disease labels (one-hot encoded)
             test_labels_species: Ground truth species labels (one-hot encoded)
+            bootstrap_resamples: Resamples for the confidence intervals (0 to skip)
             
         Returns:
             Dictionary of evaluation metrics
         """
-        print("\n[EVAL] Starting model evaluation...")
-        
-        # Get predictions
-        disease_pred, species_pred = self.model_handler.get_model().predict(test_images)
-        
-        # Convert from one-hot to class indices
-        disease_true = np.argmax(test_labels_disease, axis=1)
-        disease_pred_class = np.argmax(disease_pred, axis=1)
-        
-        species_true = np.argmax(test_labels_species, axis=1)
-        species_pred_class = np.argmax(species_pred, axis=1)
-        
-        # Calculate metrics for disease diagnosis
-        disease_metrics = self._calculate_metrics(
-            disease_true,
-            disease_pred_class,
-            disease_pred,
-            task="Disease Diagnosis"
-        )
-        
-        # Calculate metrics for species identification
-        species_metrics = self._calculate_metrics(
-            species_true,
-            species_pred_class,
-            species_pred,
-            task="Species Identification"
-        )
-        
-        self.metrics = {
-            'disease': disease_metrics,
-            'species': species_metrics,
-            'test_samples': len(test_images)
-        }
+        def batches(batch_size=256):
+            for i in range(0, len(test_images), batch_size):
+                yield test_images[i:i + batch_size], {
+                    'disease_diagnosis': test_labels_disease[i:i + batch_size],
+                    'species_identification': test_labels_species[i:i + batch_size]
+                }
         
-        print("\n[EVAL] Evaluation complete!")
-        return self.metrics
+        return self.evaluate_streaming(batches(), bootstrap_resamples=bootstrap_resamples)
     
-    def _calculate_metrics(
+    def evaluate_streaming(
         self,
-        y_true: np.ndarray,
-        y_pred: np.ndarray,
-        y_pred_proba: np.ndarray,
-        task: str = "Task"
+        batches: Iterable,
+        max_batches: Optional[int] = None,
+        bootstrap_resamples: int = 1000
     ) -> Dict:
         """
-        Calculate comprehensive evaluation metrics.
+        Evaluate model on a stream of batches.
+        
+        Each batch updates a confusion matrix and probability histograms per
+        output, so memory stays constant however large the test set is, and
+        all metrics are derived from them at the end.
         
         Args:
-            y_true: True labels
-            y_pred: Predicted labels
-            y_pred_proba: Prediction probabilities
-            task: Task name for printing
+            batches: Iterable of (images, labels) batches, e.g. the 'test'
+                split of DataLoader.get_tf_dataset or manifest_dataset();
+                labels map output names to class indices or one-hot labels.
+                Outputs without labels are not evaluated.
+            max_batches: Stop after this many batches (e.g. for a repeated dataset)
+            bootstrap_resamples: Resamples for the 95% confidence intervals
+                of accuracy, macro F1 and per-class recall (0 to skip)
             
         Returns:
-            Dictionary of metrics
+            Dictionary of evaluation metrics
         """
-        accuracy = accuracy_score(y_true, y_pred)
-        precision_macro = precision_score(y_true, y_pred, average='macro', zero_division=0)
-        recall_macro = recall_score(y_true, y_pred, average='macro', zero_division=0)
-        f1_macro = f1_score(y_true, y_pred, average='macro', zero_division=0)
+        print("\n[EVAL] Starting model evaluation...")
+        
+        model = self.model_handler.get_model()
+        output_names = model.output_names
+        accumulators = {}
+        
+        for batch_num, (images, labels) in enumerate(batches):
+            if max_batches is not None and batch_num >= max_batches:
+                break
+            predictions = model.predict_on_batch(images)
+            if not isinstance(predictions, (list, tuple)):
+                predictions = [predictions]
+            
+            for name, y_pred_proba in zip(output_names, predictions):
+                if name not in labels:
+                    continue
+                if name not in accumulators:
+                    accumulators[name] = StreamingClassificationMetrics(y_pred_proba.shape[-1])
+                accumulators[name].update(np.asarray(labels[name]), y_pred_proba)
+        
+        if not accumulators:
+            raise ValueError(f"No labelled batches for outputs {output_names}")
         
+        self.metrics = {}
+        for name, accumulator in accumulators.items():
+            key, task = TASKS.get(name, (name, name))
+            self.metrics[key] = accumulator.result()
+            if bootstrap_resamples:
+                self.metrics[key]['confidence_intervals'] = bootstrap_confidence_intervals(
+                    accumulator.confusion, bootstrap_resamples
+                )
+            self._print_task_metrics(self.metrics[key], task)
+        self.metrics['test_samples'] = next(iter(accumulators.values())).count
+        
+        print("\n[EVAL] Evaluation complete!")
+        return self.metrics
+    
+    def _print_task_metrics(self, metrics: Dict, task: str):
+        """Print the headline metrics of one output"""
         print(f"\n[{task}] Metrics:")
-        print(f"  Accuracy:  {accuracy:.4f}")
-        print(f"  Precision: {precision_macro:.4f}")
-        print(f"  Recall:    {recall_macro:.4f}")
-        print(f"  F1-Score:  {f1_macro:.4f}")
-        
-        # Try ROC-AUC for multi-class
-        try:
-            roc_auc = roc_auc_score(y_true, y_pred_proba, multi_class='ovr', average='macro')
-            print(f"  ROC-AUC:   {roc_auc:.4f}")
-        except Exception as e:
-            roc_auc = None
-            print(f"  ROC-AUC:   N/A ({str(e)})")
-        
-        # Per-class metrics
-        class_report = classification_report(
-            y_true, y_pred,
-            output_dict=True,
-            zero_division=0
-        )
-        
-        return {
-            'accuracy': float(accuracy),
-            'precision': float(precision_macro),
-            'recall': float(recall_macro),
-            'f1_score': float(f1_macro),
-            'roc_auc': float(roc_auc) if roc_auc else None,
-            'classification_report': class_report
-        }
+        print(f"  Accuracy:  {metrics['accuracy']:.4f}")
+        print(f"  Precision: {metrics['precision']:.4f}")
+        print(f"  Recall:    {metrics['recall']:.4f}")
+        print(f"  F1-Score:  {metrics['f1_score']:.4f}")
+        if metrics['roc_auc'] is not None:
+            print(f"  ROC-AUC:   {metrics['roc_auc']:.4f}")
+        else:
+            print("  ROC-AUC:   N/A (needs at least two classes in the labels)")
+        intervals = metrics.get('confidence_intervals')
+        if intervals:
+            print(f"  {intervals['confidence']:.0%} CI accuracy: {intervals['accuracy']}, "
+                  f"F1: {intervals['f1_score']} ({intervals['resamples']} resamples)")
     
     def get_confusion_matrix(
         self,
@@ -161,7 +447,8 @@ class ModelEvaluator:
         y_true: np.ndarray,
         y_pred: np.ndarray,
         class_names: List[str] = None,
-        save_path: str = None
+        save_path: str = None,
+        cm: np.ndarray = None
     ):
         """
         Plot and optionally save confusion matrix.
@@ -171,8 +458,11 @@ class ModelEvaluator:
             y_pred: Predicted labels
             class_names: Names of classes for axis labels
             save_path: Path to save the figure
+            cm: Precomputed confusion matrix (e.g. from evaluate_streaming
+                metrics); y_true and y_pred are ignored when given
         """
-        cm = self.get_confusion_matrix(y_true, y_pred)
+        if cm is None:
+            cm = self.get_confusion_matrix(y_true, y_pred)
         
         plt.figure(figsize=(10, 8))
         sns.heatmap(cm, annot=True, fmt='d', cmap='Blues',
@@ -204,12 +494,12 @@ class ModelEvaluator:
         
         print("\n--- DISEASE DIAGNOSIS ---")
         for key, value in self.metrics['disease'].items():
-            if key != 'classification_report':
+            if key not in ('classification_report', 'confusion_matrix', 'confidence_intervals'):
                 print(f"{key}: {value}")
         
         print("\n--- SPECIES IDENTIFICATION ---")
         for key, value in self.metrics['species'].items():
-            if key != 'classification_report':
+            if key not in ('classification_report', 'confusion_matrix', 'confidence_intervals'):
                 print(f"{key}: {value}")
         
         print("\n" + "="*60)
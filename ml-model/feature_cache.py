@@ -0,0 +1,299 @@
+"""
+Bottleneck feature cache for frozen-backbone training.
+
+While the backbone is frozen its pooled output never changes, so it is
+computed once per dataset version and architecture and stored as float16.
+Each entry records a fingerprint of the files it was computed from and the
+input image size, and is recomputed when either changes.
+The dense heads then train on the cached features; the full graph only
+runs again for fine-tuning after unfreeze_base().
+"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Tuple
+
+import numpy as np
+import tensorflow as tf
+from tensorflow import keras
+
+
+class BottleneckFeatureCache:
+    """
+    On-disk store of pooled backbone features.
+
+    Layout:
+    cache_dir/<dataset_version>/<architecture>/<split>/
+      features.f16        # raw float16, (num_samples, feature_dim)
+      labels.npz          # integer label arrays, one per output
+      meta.json           # shape, output names, fingerprint and image size
+    """
+
+    def __init__(self, cache_dir: str):
+        """
+        Initialize the feature cache.
+
+        Args:
+            cache_dir: Root directory for cached features
+        """
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def _entry_dir(self, dataset_version: str, architecture: str, split: str) -> Path:
+        return self.cache_dir / dataset_version / architecture.lower() / split
+
+    def exists(
+        self,
+        dataset_version: str,
+        architecture: str,
+        split: str,
+        fingerprint: Optional[str] = None,
+        image_size: Optional[Tuple[int, int]] = None
+    ) -> bool:
+        """
+        Check whether features for a split have been computed.
+
+        Args:
+            dataset_version: Dataset version the features belong to
+            architecture: Backbone architecture name
+            split: Dataset split name
+            fingerprint: Required fingerprint of the source files (not checked if None)
+            image_size: Required input image size (not checked if None)
+
+        Returns:
+            True if a complete, matching entry exists
+        """
+        meta_file = self._entry_dir(dataset_version, architecture, split) / "meta.json"
+        if not meta_file.exists():
+            return False
+
+        with open(meta_file, 'r') as f:
+            meta = json.load(f)
+        if fingerprint is not None and meta.get("fingerprint") != fingerprint:
+            return False
+        if image_size is not None and meta.get("image_size") != list(image_size):
+            return False
+        return True
+
+    def compute(
+        self,
+        feature_extractor: keras.Model,
+        dataset: tf.data.Dataset,
+        dataset_version: str,
+        architecture: str,
+        split: str,
+        fingerprint: Optional[str] = None
+    ) -> Path:
+        """
+        Run the backbone once over a dataset and store the features.
+
+        Features are streamed to disk batch by batch, so memory use does
+        not grow with the dataset.
+
+        Args:
+            feature_extractor: Model mapping images to pooled features
+            dataset: Batched dataset yielding (images, labels)
+            dataset_version: Dataset version the features belong to
+            architecture: Backbone architecture name
+            split: Dataset split name
+            fingerprint: Fingerprint of the source files (see file_fingerprint())
+
+        Returns:
+            Path to the cache entry directory
+        """
+        entry_dir = self._entry_dir(dataset_version, architecture, split)
+        entry_dir.mkdir(parents=True, exist_ok=True)
+        # A stale entry is incomplete from here until the new meta.json is written
+        if (entry_dir / "meta.json").exists():
+            (entry_dir / "meta.json").unlink()
+
+        print(f"[FEATURES] Computing {architecture} features for "
+              f"{dataset_version}/{split}...")
+
+        labels = {}
+        num_samples = 0
+        feature_dim = None
+
+        with open(entry_dir / "features.f16", 'wb') as f:
+            for images, batch_labels in dataset:
+                features = feature_extractor(images, training=False).numpy()
+                feature_dim = features.shape[1]
+                f.write(features.astype(np.float16).tobytes())
+                num_samples += features.shape[0]
+
+                if not isinstance(batch_labels, dict):
+                    batch_labels = {'labels': batch_labels}
+                for name, values in batch_labels.items():
+                    values = values.numpy()
+                    if values.ndim > 1:
+                        values = np.argmax(values, axis=1)
+                    labels.setdefault(name, []).append(values.astype(np.int32))
+
+        np.savez(
+            entry_dir / "labels.npz",
+            **{name: np.concatenate(chunks) for name, chunks in labels.items()}
+        )
+
+        # meta.json is written last so a partial entry is never treated as complete
+        with open(entry_dir / "meta.json", 'w') as f:
+            json.dump({
+                "num_samples": num_samples,
+                "feature_dim": feature_dim,
+                "outputs": sorted(labels),
+                "fingerprint": fingerprint,
+                "image_size": list(feature_extractor.input_shape[1:3])
+            }, f, indent=2)
+
+        size_mb = os.path.getsize(entry_dir / "features.f16") / (1024 * 1024)
+        print(f"[FEATURES] Cached {num_samples} x {feature_dim} features ({size_mb:.1f} MB)")
+
+        return entry_dir
+
+    def load(
+        self,
+        dataset_version: str,
+        architecture: str,
+        split: str,
+        fingerprint: Optional[str] = None,
+        image_size: Optional[Tuple[int, int]] = None
+    ) -> Optional[Tuple[np.ndarray, Dict[str, np.ndarray]]]:
+        """
+        Load cached features for a split.
+
+        Args:
+            dataset_version: Dataset version the features belong to
+            architecture: Backbone architecture name
+            split: Dataset split name
+            fingerprint: Required fingerprint of the source files (not checked if None)
+            image_size: Required input image size (not checked if None)
+
+        Returns:
+            Tuple of (memory-mapped float16 features, labels by output name),
+            or None if the split has not been computed or no longer matches
+        """
+        if not self.exists(dataset_version, architecture, split, fingerprint, image_size):
+            return None
+
+        entry_dir = self._entry_dir(dataset_version, architecture, split)
+        with open(entry_dir / "meta.json", 'r') as f:
+            meta = json.load(f)
+
+        features = np.memmap(
+            entry_dir / "features.f16",
+            dtype=np.float16,
+            mode='r',
+            shape=(meta["num_samples"], meta["feature_dim"])
+        )
+        with np.load(entry_dir / "labels.npz") as data:
+            labels = {name: data[name] for name in meta["outputs"]}
+
+        return features, labels
+
+    def get_or_compute(
+        self,
+        feature_extractor: keras.Model,
+        dataset: tf.data.Dataset,
+        dataset_version: str,
+        architecture: str,
+        split: str,
+        fingerprint: Optional[str] = None
+    ) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+        """
+        Load cached features, computing them first if needed.
+
+        Features computed from other files (by fingerprint) or at another
+        input size than feature_extractor's are recomputed.
+
+        Returns:
+            Tuple of (features, labels by output name)
+        """
+        image_size = tuple(feature_extractor.input_shape[1:3])
+        if not self.exists(dataset_version, architecture, split, fingerprint, image_size):
+            self.compute(feature_extractor, dataset, dataset_version, architecture, split, fingerprint)
+        return self.load(dataset_version, architecture, split)
+
+    @staticmethod
+    def as_dataset(
+        features: np.ndarray,
+        labels: Dict[str, np.ndarray],
+        num_classes: Dict[str, int],
+        batch_size: int = 32,
+        shuffle: bool = True
+    ) -> tf.data.Dataset:
+        """
+        Build a batched dataset of cached features and one-hot labels.
+
+        Args:
+            features: Cached float16 features
+            labels: Integer labels by output name
+            num_classes: Number of classes by output name
+            batch_size: Number of samples per batch
+            shuffle: Whether to shuffle samples every epoch
+
+        Returns:
+            Dataset yielding (features, labels)
+        """
+        dataset = tf.data.Dataset.from_tensor_slices((np.asarray(features), labels))
+        if shuffle:
+            dataset = dataset.shuffle(len(features), reshuffle_each_iteration=True)
+
+        if list(labels) == ['labels']:
+            encode = lambda y: y['labels']
+        else:
+            encode = lambda y: {
+                name: tf.one_hot(values, num_classes[name]) for name, values in y.items()
+            }
+
+        dataset = dataset.map(
+            lambda x, y: (tf.cast(x, tf.float32), encode(y)),
+            num_parallel_calls=tf.data.AUTOTUNE
+        )
+        return dataset.batch(batch_size).prefetch(tf.data.AUTOTUNE)
+
+
+def file_fingerprint(paths: Iterable[str]) -> str:
+    """
+    Fingerprint a set of files by path, size and mtime.
+
+    Args:
+        paths: Files the cached features are computed from
+
+    Returns:
+        Hex SHA-1 digest, independent of the order of paths
+    """
+    digest = hashlib.sha1()
+    for path in sorted(str(p) for p in paths):
+        stat = os.stat(path)
+        digest.update(f"{path}\0{stat.st_size}\0{stat.st_mtime_ns}\n".encode('utf-8'))
+    return digest.hexdigest()
+
+
+def transfer_head_weights(
+    head_model: keras.Model,
+    full_model: keras.Model,
+    into_head: bool = False
+) -> int:
+    """
+    Copy head weights between a head-only model and the full model by layer name.
+
+    Args:
+        head_model: Model trained on cached features
+        full_model: Full image model with identically named head layers
+        into_head: Copy from the full model into the head model instead
+
+    Returns:
+        Number of layers copied
+    """
+    copied = 0
+    for layer in head_model.layers:
+        if not layer.weights:
+            continue
+        full_layer = full_model.get_layer(layer.name)
+        if into_head:
+            layer.set_weights(full_layer.get_weights())
+        else:
+            full_layer.set_weights(layer.get_weights())
+        copied += 1
+    return copied
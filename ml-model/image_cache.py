@@ -0,0 +1,424 @@
+"""
+Persistent preprocessed image cache.
+
+Stores every image's resized uint8 pixels in large memory-mapped shard
+files keyed by the SHA-256 of the source file, so training, evaluation
+and hyperparameter trials read pixels from the page cache instead of
+decoding the same JPEGs again.
+
+Usage:
+    python image_cache.py sync --dataset ./dataset --cache ./cache/images
+    python image_cache.py sync --dataset_path ./data --cache ./cache/images
+    python image_cache.py benchmark --dataset ./dataset --cache ./cache/images
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from data_loader import decode_image_uint8, IMAGE_EXTENSIONS
+from dataset_index import DatasetIndex
+
+
+def hash_file(path: str, chunk_size: int = 1 << 20) -> str:
+    """
+    Calculate the SHA-256 content hash of a file.
+
+    Args:
+        path: Path to the file
+        chunk_size: Bytes to read per chunk
+
+    Returns:
+        Hex digest of the file contents
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ImageCache:
+    """
+    Content-addressed cache of preprocessed images in uint8 shard files.
+
+    Layout:
+    cache_dir/
+      index.json          # hash -> [shard, offset], path -> hash, versions
+      shard_00000.npy     # (shard_size, height, width, 3) uint8
+      shard_00001.npy
+      ...
+
+    The cache has a single writer; any number of readers may map the
+    shards concurrently.
+    """
+
+    INDEX_FILE = "index.json"
+
+    def __init__(
+        self,
+        cache_dir: str,
+        image_size: Tuple[int, int] = (224, 224),
+        shard_size: int = 2048
+    ):
+        """
+        Initialize the image cache.
+
+        Args:
+            cache_dir: Directory holding the shards and index
+            image_size: Size images are resized to (height, width)
+            shard_size: Number of images per shard file
+        """
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.index_file = self.cache_dir / self.INDEX_FILE
+
+        self.index = self._load_index(image_size, shard_size)
+        self.image_size = tuple(self.index["image_size"])
+        self.shard_size = self.index["shard_size"]
+
+        self._readers = {}
+        self._writer = None
+
+    def _load_index(self, image_size: Tuple[int, int], shard_size: int) -> Dict:
+        """Load the cache index from disk"""
+        if self.index_file.exists():
+            with open(self.index_file, 'r') as f:
+                index = json.load(f)
+            if tuple(index["image_size"]) != tuple(image_size):
+                raise ValueError(
+                    f"Cache at {self.cache_dir} holds {index['image_size']} images, "
+                    f"requested {list(image_size)}"
+                )
+            return index
+        return {
+            "image_size": list(image_size),
+            "shard_size": shard_size,
+            "shards": [],
+            "entries": {},
+            "files": {},
+            "versions": []
+        }
+
+    def _save_index(self):
+        """Atomically write the cache index to disk"""
+        tmp_file = self.index_file.with_suffix('.json.tmp')
+        with open(tmp_file, 'w') as f:
+            json.dump(self.index, f)
+        os.replace(tmp_file, self.index_file)
+
+    def _shard_path(self, shard_id: int) -> Path:
+        return self.cache_dir / f"shard_{shard_id:05d}.npy"
+
+    def __len__(self) -> int:
+        return len(self.index["entries"])
+
+    def __contains__(self, image_hash: str) -> bool:
+        return image_hash in self.index["entries"]
+
+    def _reader(self, shard_id: int) -> np.ndarray:
+        """Get a read-only memory map of a shard"""
+        if shard_id not in self._readers:
+            self._readers[shard_id] = np.load(self._shard_path(shard_id), mmap_mode='r')
+        return self._readers[shard_id]
+
+    def _next_slot(self) -> Tuple[int, int, np.ndarray]:
+        """Get the shard id, offset and writable map for the next free slot"""
+        shards = self.index["shards"]
+
+        if not shards or shards[-1]["count"] >= self.shard_size:
+            shard_id = len(shards)
+            shards.append({"file": self._shard_path(shard_id).name, "count": 0})
+            self._writer = (shard_id, np.lib.format.open_memmap(
+                self._shard_path(shard_id),
+                mode='w+',
+                dtype=np.uint8,
+                shape=(self.shard_size, *self.image_size, 3)
+            ))
+        elif self._writer is None or self._writer[0] != len(shards) - 1:
+            shard_id = len(shards) - 1
+            self._writer = (shard_id, np.load(self._shard_path(shard_id), mmap_mode='r+'))
+
+        shard_id, shard = self._writer
+        return shard_id, shards[shard_id]["count"], shard
+
+    def lookup_path(self, image_path: str) -> Optional[str]:
+        """
+        Get the content hash of a previously cached file.
+
+        The file is only trusted while its size and mtime are unchanged.
+
+        Args:
+            image_path: Path to the image file
+
+        Returns:
+            Content hash, or None if the file is unknown or has changed
+        """
+        record = self.index["files"].get(os.path.abspath(image_path))
+        if record is None:
+            return None
+
+        size, mtime_ns, image_hash = record
+        try:
+            stat = os.stat(image_path)
+        except OSError:
+            return None
+
+        if stat.st_size != size or stat.st_mtime_ns != mtime_ns:
+            return None
+        return image_hash
+
+    def add_image(self, image_path: str) -> Optional[str]:
+        """
+        Decode an image and store its pixels unless already cached.
+
+        Call flush() after a batch of additions to persist the index.
+
+        Args:
+            image_path: Path to the image file
+
+        Returns:
+            Content hash of the image, or None if it could not be decoded
+        """
+        image_path = os.path.abspath(image_path)
+        image_hash = self.lookup_path(image_path)
+        if image_hash is not None and image_hash in self.index["entries"]:
+            return image_hash
+
+        stat = os.stat(image_path)
+        image_hash = hash_file(image_path)
+
+        if image_hash not in self.index["entries"]:
+            try:
+                image = decode_image_uint8(image_path, self.image_size)
+            except Exception:
+                return None
+
+            shard_id, offset, shard = self._next_slot()
+            shard[offset] = image
+            self.index["shards"][shard_id]["count"] += 1
+            self.index["entries"][image_hash] = [shard_id, offset]
+
+        self.index["files"][image_path] = [stat.st_size, stat.st_mtime_ns, image_hash]
+        return image_hash
+
+    def add_images(self, image_paths: List[str]) -> Dict:
+        """
+        Add a batch of images to the cache.
+
+        Args:
+            image_paths: Paths to image files
+
+        Returns:
+            Summary of added, already cached and failed images
+        """
+        results = {"added": 0, "cached": 0, "failed": []}
+
+        for image_path in image_paths:
+            before = len(self.index["entries"])
+            image_hash = self.add_image(image_path)
+            if image_hash is None:
+                results["failed"].append(str(image_path))
+            elif len(self.index["entries"]) > before:
+                results["added"] += 1
+            else:
+                results["cached"] += 1
+
+        self.flush()
+        return results
+
+    def flush(self):
+        """Flush written shard data and persist the index"""
+        if self._writer is not None:
+            self._writer[1].flush()
+        self._save_index()
+
+    def get(self, image_hash: str) -> np.ndarray:
+        """
+        Get the cached pixels for a content hash.
+
+        Args:
+            image_hash: Content hash of the image
+
+        Returns:
+            Read-only view of shape (height, width, 3) into the shard
+        """
+        shard_id, offset = self.index["entries"][image_hash]
+        return self._reader(shard_id)[offset]
+
+    def get_for_path(self, image_path: str) -> Optional[np.ndarray]:
+        """
+        Get the cached pixels for an image file.
+
+        Args:
+            image_path: Path to the image file
+
+        Returns:
+            Read-only view into the shard, or None on a cache miss
+        """
+        image_hash = self.lookup_path(str(image_path))
+        if image_hash is None or image_hash not in self.index["entries"]:
+            return None
+        return self.get(image_hash)
+
+    def sync_dataset_versions(self, dataset_base_path: str) -> List[str]:
+        """
+        Cache every DatasetManager version that has not been cached yet.
+
+        Args:
+            dataset_base_path: DatasetManager base path (holds dataset_metadata.db)
+
+        Returns:
+            Names of the newly cached versions
+        """
+        versions = _dataset_versions(dataset_base_path)
+
+        synced = []
+        for version in versions:
+            if version["name"] in self.index["versions"]:
+                continue
+
+            image_paths = []
+            for class_info in version["classes"].values():
+                class_dir = Path(class_info["path"])
+                if class_dir.exists():
+                    image_paths.extend(
+                        str(f) for f in sorted(class_dir.iterdir())
+                        if f.suffix.lower() in IMAGE_EXTENSIONS
+                    )
+
+            results = self.add_images(image_paths)
+            print(f"[CACHE] Version {version['name']}: {results['added']} added, "
+                  f"{results['cached']} already cached, {len(results['failed'])} failed")
+
+            self.index["versions"].append(version["name"])
+            self._save_index()
+            synced.append(version["name"])
+
+        return synced
+
+    def sync_training_dataset(self, dataset_path: str) -> Dict:
+        """
+        Cache every image of a train.py dataset (disease_images/ tree).
+
+        Images are listed through the same dataset index DataLoader reads,
+        so the cached paths are the ones training looks up.
+
+        Args:
+            dataset_path: Dataset directory holding disease_images/
+
+        Returns:
+            Summary of added, already cached and failed images
+        """
+        dataset_path = Path(dataset_path)
+        dataset_index = DatasetIndex(
+            dataset_path / "disease_images",
+            dataset_path / "dataset_index.json",
+            IMAGE_EXTENSIONS
+        )
+        dataset_index.refresh()
+
+        results = self.add_images([record["path"] for record in dataset_index.records()])
+        print(f"[CACHE] {dataset_path}: {results['added']} added, "
+              f"{results['cached']} already cached, {len(results['failed'])} failed")
+        return results
+
+    def benchmark(self, image_paths: List[str]) -> Dict:
+        """
+        Compare one epoch of decoding against one epoch of cache reads.
+
+        Args:
+            image_paths: Paths to images that are already cached
+
+        Returns:
+            Dictionary with per-epoch timings and the speedup
+        """
+        start = time.perf_counter()
+        for image_path in image_paths:
+            decode_image_uint8(image_path, self.image_size).astype(np.float32) / 255.0
+        decode_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        hits = 0
+        for image_path in image_paths:
+            cached = self.get_for_path(image_path)
+            if cached is not None:
+                cached.astype(np.float32) / 255.0
+                hits += 1
+        cache_seconds = time.perf_counter() - start
+
+        report = {
+            "images": len(image_paths),
+            "cache_hits": hits,
+            "decode_epoch_seconds": round(decode_seconds, 4),
+            "cache_epoch_seconds": round(cache_seconds, 4),
+            "speedup": round(decode_seconds / cache_seconds, 2) if cache_seconds > 0 else None
+        }
+
+        print(f"[CACHE] Epoch over {report['images']} images: "
+              f"decode {report['decode_epoch_seconds']}s, "
+              f"cache {report['cache_epoch_seconds']}s "
+              f"({report['speedup']}x speedup)")
+
+        return report
+
+
+def _dataset_versions(dataset_base_path: str) -> List[Dict]:
+    """List DatasetManager versions with each class's committed directory"""
+    db_file = Path(dataset_base_path) / "dataset_metadata.db"
+    metadata_file = Path(dataset_base_path) / "dataset_metadata.json"
+    if db_file.exists():
+        conn = sqlite3.connect(f"file:{db_file}?mode=ro", uri=True)
+        try:
+            versions = {}
+            for name, class_name, path in conn.execute(
+                "SELECT v.name, vc.class_name, vc.path FROM versions v "
+                "JOIN version_classes vc ON vc.version_id = v.id ORDER BY v.id"
+            ):
+                versions.setdefault(name, {"name": name, "classes": {}})["classes"][class_name] = {"path": path}
+            return list(versions.values())
+        finally:
+            conn.close()
+    if metadata_file.exists():
+        with open(metadata_file, 'r') as f:
+            return json.load(f).get("versions", [])
+    return []
+
+
+def _version_image_paths(dataset_base_path: str) -> List[str]:
+    """List the images of every committed dataset version"""
+    versions_dir = Path(dataset_base_path) / "versions"
+    if not versions_dir.exists():
+        return []
+    return [
+        str(f) for f in sorted(versions_dir.rglob("*"))
+        if f.suffix.lower() in IMAGE_EXTENSIONS
+    ]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Preprocessed image cache")
+    parser.add_argument("command", choices=["sync", "benchmark"])
+    parser.add_argument("--dataset", default="./dataset", help="DatasetManager base path")
+    parser.add_argument("--dataset_path", help="Sync a train.py dataset (disease_images/ tree) instead")
+    parser.add_argument("--cache", default="./cache/images", help="Cache directory")
+    parser.add_argument("--image_size", type=int, default=224)
+    args = parser.parse_args()
+
+    cache = ImageCache(args.cache, image_size=(args.image_size, args.image_size))
+
+    if args.command == "sync" and args.dataset_path:
+        cache.sync_training_dataset(args.dataset_path)
+        print(f"[CACHE] {len(cache)} images cached")
+    elif args.command == "sync":
+        synced = cache.sync_dataset_versions(args.dataset)
+        print(f"[CACHE] Synced {len(synced)} new versions, {len(cache)} images cached")
+    else:
+        cache.benchmark(_version_image_paths(args.dataset))
@@ -0,0 +1,158 @@
+"""
+Reader for DatasetManager training manifests.
+
+DatasetManager.export_training_manifest writes either one JSON document
+(.json) or a streaming manifest (.jsonl):
+
+  {"format": "dataset-manifest-jsonl/1", "version": ..., "classes": [...], ...}
+  {"path": ..., "class": ..., "class_id": 0, "split": "train", ...}
+  ...
+  {"end": true, "images": 1234}
+
+The first line is the header, then one line per image and a footer with
+the image count. Diff manifests (mode "diff") mark every image with
+"change": "added" or "removed".
+
+A model's class order is kept next to its file as <model>.classes.json,
+so manifest class ids can be mapped onto its outputs by name.
+
+Usage:
+    header, images = read_manifest("manifest.jsonl")
+    for image in images:
+        ...
+"""
+
+import json
+import os
+from typing import Dict, Iterator, List, Optional, Tuple
+
+
+MANIFEST_FORMAT = "dataset-manifest-jsonl/1"
+
+
+def _iter_jsonl_images(f, path: str) -> Iterator[Dict]:
+    count = 0
+    with f:
+        for line in f:
+            record = json.loads(line)
+            if record.get("end"):
+                if record["images"] != count:
+                    raise ValueError(f"{path}: footer expects {record['images']} images, read {count}")
+                return
+            count += 1
+            yield record
+    raise ValueError(f"{path} is truncated (no footer line)")
+
+
+def read_manifest(path: str) -> Tuple[Dict, Iterator[Dict]]:
+    """
+    Open a manifest without loading its image list.
+
+    Args:
+        path: Manifest written by DatasetManager.export_training_manifest
+
+    Returns:
+        Tuple of (header, iterator over image entries). The header is the
+        manifest without its images
+    """
+    f = open(path, 'r')
+    first = f.readline()
+    try:
+        header = json.loads(first)
+    except ValueError:
+        header = None
+
+    if isinstance(header, dict) and header.get("format") == MANIFEST_FORMAT:
+        return header, _iter_jsonl_images(f, path)
+
+    # Single JSON document
+    f.seek(0)
+    with f:
+        manifest = json.load(f)
+    images = manifest.pop("images")
+    return manifest, iter(images)
+
+
+def manifest_images(
+    path: str,
+    split: Optional[str] = None,
+    include_removed: bool = False
+) -> Tuple[Dict, List[Dict]]:
+    """
+    Read the image entries of one split.
+
+    Args:
+        path: Manifest (.json or .jsonl)
+        split: Only images of this split (all images if None)
+        include_removed: Keep images a diff manifest marks as removed
+
+    Returns:
+        Tuple of (header, image entries)
+    """
+    header, images = read_manifest(path)
+    return header, [
+        image for image in images
+        if (split is None or image.get("split") == split)
+        and (include_removed or image.get("change") != "removed")
+    ]
+
+
+def class_names_path(model_path: str) -> str:
+    """Path of the class list saved next to a model file"""
+    return os.path.splitext(model_path)[0] + ".classes.json"
+
+
+def save_class_names(model_path: str, class_names: List[str]) -> str:
+    """
+    Record a model's class names in output order next to the model file.
+
+    Args:
+        model_path: Saved model file
+        class_names: Class name of each output unit
+
+    Returns:
+        Path to the class list
+    """
+    path = class_names_path(model_path)
+    with open(path, 'w') as f:
+        json.dump({"classes": list(class_names)}, f, indent=2)
+    return path
+
+
+def load_class_names(model_path: str) -> Optional[List[str]]:
+    """
+    Read the class names saved next to a model file.
+
+    Args:
+        model_path: Saved model file
+
+    Returns:
+        Class names in output order, or None if none were saved
+    """
+    path = class_names_path(model_path)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r') as f:
+        return json.load(f)["classes"]
+
+
+def class_id_mapping(header: Dict, model_classes: List[str]) -> List[int]:
+    """
+    Map a manifest's class ids onto a model's output order by class name.
+
+    Args:
+        header: Manifest header with its "classes" list
+        model_classes: Class names of the model outputs
+
+    Returns:
+        Model output index of every manifest class id
+
+    Raises:
+        ValueError: If the manifest has classes the model lacks
+    """
+    model_index = {name: idx for idx, name in enumerate(model_classes)}
+    classes = sorted(header["classes"], key=lambda c: c["id"])
+    unknown = [c["name"] for c in classes if c["name"] not in model_index]
+    if unknown:
+        raise ValueError(f"Model has no outputs for classes {unknown}")
+    return [model_index[c["name"]] for c in classes]
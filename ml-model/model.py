@@ -4,6 +4,107 @@ from tensorflow.keras import layers
 import numpy as np
 from typing import Tuple
 
+from weight_store import resolve_imagenet_weights
+
+
+class GradientAccumulationModel(keras.Model):
+    """
+    Functional model that accumulates gradients over several micro-batches.
+    
+    Each train step computes gradients for one micro-batch and adds them to
+    accumulators; the optimizer only steps once every accumulation_steps
+    micro-batches, giving a large effective batch size while peak memory
+    stays bounded by the micro-batch.
+    
+    The constructor is left as Functional's so saved models keep a
+    functional config; set accumulation_steps after construction. Reloaded
+    models default to one step. Gradients of micro-batches left over at the
+    end of an epoch are discarded, so every optimizer step averages exactly
+    accumulation_steps micro-batches of one epoch.
+    """
+    
+    accumulation_steps = 1
+    
+    def _set_accumulators(self, grads, counter):
+        # Bypass Keras attribute tracking so accumulators are not saved
+        # with the model weights
+        object.__setattr__(self, '_accumulated_grads', grads)
+        object.__setattr__(self, '_accumulation_counter', counter)
+    
+    def compile(self, *args, **kwargs):
+        """Compile and (re)create accumulators for the trainable variables."""
+        super().compile(*args, **kwargs)
+        
+        # Trainable variables change when layers are unfrozen, so the
+        # accumulators are rebuilt on every compile
+        self._set_accumulators(
+            [
+                tf.Variable(tf.zeros_like(v), trainable=False, name='accumulated_grad')
+                for v in self.trainable_variables
+            ],
+            tf.Variable(0, dtype=tf.int64, trainable=False, name='accumulation_counter')
+        )
+    
+    def train_step(self, data):
+        x, y, sample_weight = keras.utils.unpack_x_y_sample_weight(data)
+        
+        with tf.GradientTape() as tape:
+            y_pred = self(x, training=True)
+            loss = self.compute_loss(x, y, y_pred, sample_weight)
+            scaled_loss = loss / self.accumulation_steps
+        
+        # Keras 3 tracks the reported loss in train_step rather than in
+        # compute_loss (tf.keras has no _loss_tracker)
+        if getattr(self, '_loss_tracker', None) is not None:
+            self._loss_tracker.update_state(loss, sample_weight=tf.shape(tf.nest.flatten(x)[0])[0])
+        
+        gradients = tape.gradient(scaled_loss, self.trainable_variables)
+        for accumulator, gradient in zip(self._accumulated_grads, gradients):
+            if gradient is not None:
+                accumulator.assign_add(tf.convert_to_tensor(gradient))
+        self._accumulation_counter.assign_add(1)
+        
+        tf.cond(
+            tf.equal(self._accumulation_counter, self.accumulation_steps),
+            self._apply_accumulated_gradients,
+            lambda: tf.constant(False)
+        )
+        
+        return self.compute_metrics(x, y, y_pred, sample_weight)
+    
+    def fit(self, *args, callbacks=None, **kwargs):
+        """fit() that drops micro-batch gradients left over at each epoch end."""
+        callbacks = list(callbacks or []) + [_ResetAccumulators()]
+        return super().fit(*args, callbacks=callbacks, **kwargs)
+    
+    def reset_accumulators(self):
+        """Discard accumulated gradients not yet applied."""
+        for accumulator in self._accumulated_grads:
+            accumulator.assign(tf.zeros_like(accumulator))
+        self._accumulation_counter.assign(0)
+    
+    def _apply_accumulated_gradients(self):
+        self.optimizer.apply_gradients(zip(
+            [tf.convert_to_tensor(a) for a in self._accumulated_grads],
+            self.trainable_variables
+        ))
+        for accumulator in self._accumulated_grads:
+            accumulator.assign(tf.zeros_like(accumulator))
+        self._accumulation_counter.assign(0)
+        return tf.constant(True)
+
+
+class _ResetAccumulators(keras.callbacks.Callback):
+    """Resets GradientAccumulationModel accumulators at the end of every epoch."""
+    
+    def on_epoch_end(self, epoch, logs=None):
+        self.model.reset_accumulators()
+
+
+# Pass to keras.models.load_model for training checkpoints saved with
+# gradient accumulation
+CUSTOM_OBJECTS = {'GradientAccumulationModel': GradientAccumulationModel}
+
 
 class PlantHealthModel:
     """
@@ -18,14 +119,20 @@ class PlantHealthModel:
       3. Confidence scores for predictions
     """
     
-    def __init__(self, input_shape: Tuple[int, int, int] = (224, 224, 3)):
+    def __init__(
+        self,
+        input_shape: Tuple[int, int, int] = (224, 224, 3),
+        accumulation_steps: int = 1
+    ):
         """
         Initialize the plant health diagnosis model.
         
         Args:
             input_shape: Input image dimensions (height, width, channels)
+            accumulation_steps: Micro-batches to accumulate per optimizer step
         """
         self.input_shape = input_shape
+        self.accumulation_steps = accumulation_steps
         self.disease_classes = 12
         self.species_classes = 50
         self.model = None
@@ -40,9 +147,9 @@ class PlantHealthModel:
         Returns:
             Compiled Keras model
         """
-        # Load base ResNet50 model
+        # Load base ResNet50 model (ImageNet weights from the local weight store when imported)
         base_model = keras.applications.ResNet50(
-            weights='imagenet' if pretrained else None,
+            weights=resolve_imagenet_weights('ResNet50', self.input_shape) if pretrained else None,
             include_top=False,
             input_shape=self.input_shape
         )
@@ -60,18 +167,53 @@ class PlantHealthModel:
         x = base_model(x, training=False)
         
         # Global average pooling
-        x = layers.GlobalAveragePooling2D()(x)
+        x = layers.GlobalAveragePooling2D(name='feature_pooling')(x)
+        
+        disease_output, species_output = self._add_heads(x)
+        
+        # Create model with multiple outputs
+        if self.accumulation_steps > 1:
+            model = GradientAccumulationModel(
+                inputs=inputs,
+                outputs=[disease_output, species_output]
+            )
+            model.accumulation_steps = self.accumulation_steps
+        else:
+            model = keras.Model(
+                inputs=inputs,
+                outputs=[disease_output, species_output]
+            )
+        
+        # Compile model
+        self._compile(model, learning_rate=0.001)
         
+        self.model = model
+        return model
+    
+    def _add_heads(self, x):
+        """
+        Add the shared dense layers and the two classification heads.
+        
+        Layers are named so weights can be copied between the full model
+        and a head-only model trained on cached backbone features.
+        
+        Args:
+            x: Pooled backbone features
+            
+        Returns:
+            Tuple of (disease_output, species_output) tensors
+        """
         # Shared dense layers
-        x = layers.Dense(512, activation='relu')(x)
-        x = layers.Dropout(0.4)(x)
-        x = layers.Dense(256, activation='relu')(x)
-        x = layers.Dropout(0.3)(x)
+        x = layers.Dense(512, activation='relu', name='shared_dense_1')(x)
+        x = layers.Dropout(0.4, name='shared_dropout_1')(x)
+        x = layers.Dense(256, activation='relu', name='shared_dense_2')(x)
+        x = layers.Dropout(0.3, name='shared_dropout_2')(x)
         
-        # Disease diagnosis output
+        # Disease diagnosis output (float32 softmax under mixed precision)
         disease_output = layers.Dense(
             self.disease_classes,
             activation='softmax',
+            dtype='float32',
             name='disease_diagnosis'
         )(x)
         
@@ -79,18 +221,22 @@ class PlantHealthModel:
         species_output = layers.Dense(
             self.species_classes,
             activation='softmax',
+            dtype='float32',
             name='species_identification'
         )(x)
         
-        # Create model with multiple outputs
-        model = keras.Model(
-            inputs=inputs,
-            outputs=[disease_output, species_output]
-        )
+        return disease_output, species_output
+    
+    def _compile(self, model: keras.Model, learning_rate: float):
+        """
+        Compile a model with the dual-output losses.
         
-        # Compile model
+        Args:
+            model: Model to compile
+            learning_rate: Adam learning rate
+        """
         model.compile(
-            optimizer=keras.optimizers.Adam(learning_rate=0.001),
+            optimizer=keras.optimizers.Adam(learning_rate=learning_rate),
             loss={
                 'disease_diagnosis': 'categorical_crossentropy',
                 'species_identification': 'categorical_crossentropy'
@@ -99,11 +245,63 @@ class PlantHealthModel:
                 'disease_diagnosis': 0.7,
                 'species_identification': 0.3
             },
-            metrics=['accuracy']
+            # Per output: Keras 3 rejects a flat list for multi-output models
+            metrics={
+                'disease_diagnosis': ['accuracy'],
+                'species_identification': ['accuracy']
+            }
         )
+    
+    def get_base_model(self) -> keras.Model:
+        """
+        Get the ResNet50 backbone nested inside the model.
         
-        self.model = model
-        return model
+        Returns:
+            Backbone Keras model
+        """
+        if self.model is None:
+            raise ValueError("Model must be built first")
+        
+        return next(
+            layer for layer in self.model.layers
+            if isinstance(layer, keras.Model)
+        )
+    
+    def get_feature_extractor(self) -> keras.Model:
+        """
+        Get a model mapping input images to pooled backbone features.
+        
+        Returns:
+            Keras model sharing the backbone of the full model
+        """
+        if self.model is None:
+            raise ValueError("Model must be built first")
+        
+        return keras.Model(
+            inputs=self.model.input,
+            outputs=self.model.get_layer('feature_pooling').output
+        )
+    
+    def build_head_model(self, feature_dim: int) -> keras.Model:
+        """
+        Build a compiled head-only model that trains on cached features.
+        
+        Args:
+            feature_dim: Size of the pooled backbone feature vector
+            
+        Returns:
+            Compiled Keras model with the same head layer names
+        """
+        inputs = keras.Input(shape=(feature_dim,))
+        disease_output, species_output = self._add_heads(inputs)
+        
+        head_model = keras.Model(
+            inputs=inputs,
+            outputs=[disease_output, species_output]
+        )
+        self._compile(head_model, learning_rate=0.001)
+        
+        return head_model
     
     def get_model(self) -> keras.Model:
         """
@@ -126,25 +324,15 @@ class PlantHealthModel:
         if self.model is None:
             raise ValueError("Model must be built first")
             
-        base_model = self.model.layers[1]
+        base_model = self.get_base_model()
+        base_model.trainable = True
         
-        # Unfreeze the last N layers
-        for layer in base_model.layers[-num_layers:]:
-            layer.trainable = True
+        # Unfreeze only the last N layers
+        for layer in base_model.layers[:-num_layers]:
+            layer.trainable = False
         
         # Recompile with lower learning rate for fine-tuning
-        self.model.compile(
-            optimizer=keras.optimizers.Adam(learning_rate=0.0001),
-            loss={
-                'disease_diagnosis': 'categorical_crossentropy',
-                'species_identification': 'categorical_crossentropy'
-            },
-            loss_weights={
-                'disease_diagnosis': 0.7,
-                'species_identification': 0.3
-            },
-            metrics=['accuracy']
-        )
+        self._compile(self.model, learning_rate=0.0001)
     
     def predict(self, image: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
         """
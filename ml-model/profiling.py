@@ -0,0 +1,205 @@
+"""
+Training throughput profiling.
+
+ThroughputProfiler records, for every epoch, the mean step time, how much
+of it was spent waiting for the input pipeline, images per second and peak
+memory, and flags epochs where the input pipeline is the bottleneck. It can
+also capture a TensorBoard profiler trace for a window of steps.
+"""
+
+import resource
+import time
+from collections import deque
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import tensorflow as tf
+from tensorflow import keras
+
+
+def _reset_peak_rss() -> bool:
+    """Reset the kernel's peak RSS counter (VmHWM); Linux only"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def _peak_rss_mb() -> float:
+    """Peak resident memory since the last reset (or process start)"""
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # ru_maxrss is in KB on Linux and bytes on macOS; never reset
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / (1024 * 1024) if maxrss > 1 << 30 else maxrss / 1024
+
+
+class ThroughputProfiler(keras.callbacks.Callback):
+    """
+    Per-epoch step time, data-wait time, images/s and peak memory.
+
+    Data wait is measured by instrument(), which stamps each batch as the
+    training loop receives it from the last stage of the input pipeline;
+    the wait is the time from step start until the batch arrived. Without
+    instrumentation only step time and throughput are reported. The first
+    step of each epoch includes pipeline start-up (and, in the first epoch,
+    graph tracing), so it is reported separately and left out of the
+    steady-state stats.
+    """
+
+    def __init__(
+        self,
+        batch_size: Optional[int] = None,
+        stall_threshold: float = 0.2,
+        trace_steps: Optional[Tuple[int, int]] = None,
+        trace_dir: Optional[str] = None
+    ):
+        """
+        Initialize the profiler.
+
+        Args:
+            batch_size: Images per step, used when the dataset isn't instrumented
+            stall_threshold: Fraction of step time spent waiting for data
+                above which an epoch is flagged as input-bound
+            trace_steps: (first, last) global step of a profiler trace window
+            trace_dir: TensorBoard log directory for the trace
+        """
+        super().__init__()
+        self.batch_size = batch_size
+        self.stall_threshold = stall_threshold
+        self.trace_steps = trace_steps
+        self.trace_dir = trace_dir
+
+        self.epochs = []
+        self._arrivals = deque()
+        self._global_step = 0
+        self._tracing = False
+
+    def instrument(self, dataset: tf.data.Dataset) -> tf.data.Dataset:
+        """
+        Add a final pipeline stage recording when each batch is handed to training.
+
+        Args:
+            dataset: Batched (images, labels) dataset
+
+        Returns:
+            The same dataset with arrival stamps
+        """
+        def stamp(batch_size):
+            self._arrivals.append((time.perf_counter(), int(batch_size)))
+            return np.int64(batch_size)
+
+        def add_stamp(images, labels):
+            # Synchronous map after any prefetch: runs when the training
+            # loop pulls the batch
+            stamped = tf.numpy_function(stamp, [tf.shape(images, out_type=tf.int64)[0]], tf.int64)
+            with tf.control_dependencies([stamped]):
+                images = tf.identity(images)
+            return images, labels
+
+        return dataset.map(add_stamp)
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self._arrivals.clear()
+        self._step_times = []
+        self._data_waits = []
+        self._images = 0
+        self._first_step = None
+        self._peak_reset = _reset_peak_rss()
+        self._epoch_start = time.perf_counter()
+
+    def on_train_batch_begin(self, batch, logs=None):
+        if self.trace_steps and self._global_step == self.trace_steps[0] and self.trace_dir:
+            tf.profiler.experimental.start(self.trace_dir)
+            self._tracing = True
+        self._step_start = time.perf_counter()
+
+    def on_train_batch_end(self, batch, logs=None):
+        step_end = time.perf_counter()
+        arrival = self._arrivals.popleft() if self._arrivals else None
+
+        if self._first_step is None:
+            self._first_step = step_end - self._step_start
+        else:
+            self._step_times.append(step_end - self._step_start)
+            if arrival is not None:
+                self._data_waits.append(max(arrival[0] - self._step_start, 0.0))
+                self._images += arrival[1]
+            elif self.batch_size:
+                self._images += self.batch_size
+
+        if self._tracing and self._global_step >= self.trace_steps[1]:
+            tf.profiler.experimental.stop()
+            self._tracing = False
+            print(f"[PROFILE] Trace of steps {self.trace_steps[0]}-{self.trace_steps[1]} "
+                  f"saved to {self.trace_dir}")
+        self._global_step += 1
+
+    def on_epoch_end(self, epoch, logs=None):
+        epoch_seconds = time.perf_counter() - self._epoch_start
+        step_seconds = sum(self._step_times)
+
+        stats = {
+            "epoch": epoch + 1,
+            "steps": len(self._step_times) + (self._first_step is not None),
+            "first_step_ms": round(1000 * self._first_step, 2) if self._first_step is not None else None,
+            "epoch_seconds": round(epoch_seconds, 3),
+            "mean_step_ms": round(1000 * step_seconds / max(len(self._step_times), 1), 2),
+            "p95_step_ms": round(1000 * float(np.percentile(self._step_times, 95)), 2) if self._step_times else None,
+            "images_per_sec": round(self._images / step_seconds, 2) if step_seconds else None,
+            "peak_memory_mb": round(_peak_rss_mb(), 1),
+            "peak_memory_scope": "epoch" if self._peak_reset else "process",
+            "data_wait_ms": None,
+            "data_wait_fraction": None,
+            "input_stall": None
+        }
+
+        if self._data_waits:
+            wait_seconds = sum(self._data_waits)
+            stats["data_wait_ms"] = round(1000 * wait_seconds / len(self._data_waits), 2)
+            stats["data_wait_fraction"] = round(wait_seconds / step_seconds, 3) if step_seconds else 0.0
+            stats["input_stall"] = stats["data_wait_fraction"] > self.stall_threshold
+
+        self.epochs.append(stats)
+
+        # Shared logs dict: TensorBoard (later in the callback list) writes
+        # these as scalars
+        if logs is not None:
+            for key in ("mean_step_ms", "images_per_sec", "peak_memory_mb", "data_wait_fraction"):
+                if stats[key] is not None:
+                    logs[key] = stats[key]
+
+        wait = (f", data wait {stats['data_wait_ms']} ms ({stats['data_wait_fraction']:.0%})"
+                if stats["data_wait_ms"] is not None else "")
+        print(f"[PROFILE] Epoch {stats['epoch']}: {stats['mean_step_ms']} ms/step{wait}, "
+              f"{stats['images_per_sec']} images/s, peak {stats['peak_memory_mb']} MB "
+              f"(first step {stats['first_step_ms']} ms)")
+        if stats["input_stall"]:
+            print(f"[PROFILE] Input pipeline stall: {stats['data_wait_fraction']:.0%} of step "
+                  f"time spent waiting for data (threshold {self.stall_threshold:.0%}). "
+                  f"Consider an image cache, more parallel decoding or a larger prefetch.")
+
+    def on_train_end(self, logs=None):
+        if self._tracing:
+            tf.profiler.experimental.stop()
+            self._tracing = False
+
+    def summary(self) -> Dict:
+        """
+        Summarise the profiled epochs.
+
+        Returns:
+            Dictionary with per-epoch stats and the number of stalled epochs
+        """
+        return {
+            "epochs": self.epochs,
+            "stalled_epochs": sum(1 for e in self.epochs if e["input_stall"]),
+            "stall_threshold": self.stall_threshold
+        }
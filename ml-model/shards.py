@@ -0,0 +1,340 @@
+"""
+Packed TFRecord shards of a dataset version.
+
+Reading millions of small JPEGs from network storage is dominated by file
+opens. export_shards() packs the images of a DatasetManager manifest into
+a few large shards per split, each record holding the encoded image bytes,
+class label and SHA-256, and writes shards in parallel. shard_dataset()
+streams them back with a parallel interleave across shards, and
+ShardIndex reads single records by position through per-shard offsets.
+
+Layout:
+shard_dir/
+  index.json                        # classes, shards per split, record counts
+  train-00000-of-00004.tfrecord
+  train-00000-of-00004.idx          # uint64 byte offset of every record
+  ...
+
+Usage:
+    python shards.py export --manifest manifest.json --output shards/v3
+    python shards.py inspect --output shards/v3 --split train --position 0
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import random
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import tensorflow as tf
+
+from manifest import manifest_images
+
+
+INDEX_FILE = "index.json"
+
+# TFRecord framing around each record: length, length CRC, data CRC
+RECORD_OVERHEAD = 16
+
+FEATURES = {
+    'image': tf.io.FixedLenFeature([], tf.string),
+    'label': tf.io.FixedLenFeature([], tf.int64),
+    'class': tf.io.FixedLenFeature([], tf.string),
+    'sha256': tf.io.FixedLenFeature([], tf.string),
+    'filename': tf.io.FixedLenFeature([], tf.string)
+}
+
+
+def _bytes_feature(value: bytes) -> tf.train.Feature:
+    return tf.train.Feature(bytes_list=tf.train.BytesList(value=[value]))
+
+
+def _plan_shards(images: List[Dict], shard_bytes: int) -> List[List[Dict]]:
+    """Split images into consecutive shards of about shard_bytes each"""
+    shards = [[]]
+    size = 0
+    for image in images:
+        if shards[-1] and size >= shard_bytes:
+            shards.append([])
+            size = 0
+        shards[-1].append(image)
+        size += image['bytes']
+    return shards if shards[0] else []
+
+
+def _write_shard(images: List[Dict], shard_path: Path) -> Dict:
+    """
+    Write one shard and its offset index.
+
+    Args:
+        images: Manifest entries (with file sizes) to pack, in order
+        shard_path: Destination .tfrecord path
+
+    Returns:
+        Dictionary with the record count, bytes written and skipped files
+    """
+    tmp_path = shard_path.with_suffix('.tfrecord.tmp')
+    offsets = []
+    offset = 0
+    failures = []
+
+    with tf.io.TFRecordWriter(str(tmp_path)) as writer:
+        for image in images:
+            try:
+                with open(image['path'], 'rb') as f:
+                    data = f.read()
+            except OSError as e:
+                failures.append({"path": image['path'], "error": str(e)})
+                continue
+
+            example = tf.train.Example(features=tf.train.Features(feature={
+                'image': _bytes_feature(data),
+                'label': tf.train.Feature(int64_list=tf.train.Int64List(value=[image['class_id']])),
+                'class': _bytes_feature(image['class'].encode('utf-8')),
+                'sha256': _bytes_feature(hashlib.sha256(data).hexdigest().encode('ascii')),
+                'filename': _bytes_feature(os.path.basename(image['path']).encode('utf-8'))
+            })).SerializeToString()
+            writer.write(example)
+            offsets.append(offset)
+            offset += len(example) + RECORD_OVERHEAD
+
+    os.replace(tmp_path, shard_path)
+    np.array(offsets, dtype='<u8').tofile(shard_path.with_suffix('.idx'))
+    return {"records": len(offsets), "bytes": offset, "failures": failures}
+
+
+def export_shards(
+    manifest_path: str,
+    output_dir: str,
+    shard_size_mb: int = 128,
+    num_workers: Optional[int] = None,
+    seed: int = 42
+) -> Dict:
+    """
+    Pack the images of a manifest into TFRecord shards.
+
+    Images are shuffled once before packing so every shard holds a mix of
+    classes, which interleaved reading relies on.
+
+    Args:
+        manifest_path: DatasetManager manifest, .json or .jsonl (export_training_manifest)
+        output_dir: Directory for the shards and index
+        shard_size_mb: Target shard size
+        num_workers: Shards written concurrently (default: CPU count)
+        seed: Seed for the packing order
+
+    Returns:
+        The written index
+    """
+    header, images = manifest_images(manifest_path)
+
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    by_split = {}
+    missing = []
+    for image in images:
+        try:
+            size = os.path.getsize(image['path'])
+        except OSError as e:
+            missing.append({"path": image['path'], "error": str(e)})
+            continue
+        by_split.setdefault(image.get('split') or 'train', []).append({**image, 'bytes': size})
+
+    rng = random.Random(seed)
+    jobs = []
+    for split, images in sorted(by_split.items()):
+        rng.shuffle(images)
+        planned = _plan_shards(images, shard_size_mb * 1024 * 1024)
+        for i, shard_images in enumerate(planned):
+            name = f"{split}-{i:05d}-of-{len(planned):05d}.tfrecord"
+            jobs.append((split, name, shard_images))
+
+    print(f"[SHARDS] Packing {sum(len(j[2]) for j in jobs)} images into {len(jobs)} shards")
+    with ThreadPoolExecutor(num_workers or os.cpu_count() or 1) as executor:
+        results = list(executor.map(lambda job: _write_shard(job[2], output_dir / job[1]), jobs))
+
+    index = {
+        "version": header.get('version'),
+        "manifest": str(Path(manifest_path).resolve()),
+        "created_at": datetime.now().isoformat(),
+        "classes": sorted(header['classes'], key=lambda c: c['id']),
+        "splits": {},
+        "failures": missing
+    }
+    for (split, name, _), result in zip(jobs, results):
+        split_info = index["splits"].setdefault(split, {"records": 0, "bytes": 0, "shards": []})
+        split_info["records"] += result["records"]
+        split_info["bytes"] += result["bytes"]
+        split_info["shards"].append({
+            "path": name,
+            "index": Path(name).with_suffix('.idx').name,
+            "records": result["records"],
+            "bytes": result["bytes"]
+        })
+        index["failures"].extend(result["failures"])
+
+    # Written last: readers only see complete exports
+    tmp_index = output_dir / (INDEX_FILE + ".tmp")
+    with open(tmp_index, 'w') as f:
+        json.dump(index, f, indent=2)
+    os.replace(tmp_index, output_dir / INDEX_FILE)
+
+    for split, split_info in index["splits"].items():
+        print(f"[SHARDS] {split}: {split_info['records']} records in "
+              f"{len(split_info['shards'])} shards ({split_info['bytes'] / 1e6:.1f} MB)")
+    if index["failures"]:
+        print(f"[WARNING] Skipped {len(index['failures'])} unreadable images")
+    return index
+
+
+def load_index(shard_dir: str) -> Dict:
+    """Load the index of an exported shard directory"""
+    with open(Path(shard_dir) / INDEX_FILE, 'r') as f:
+        return json.load(f)
+
+
+def parse_record(record: tf.Tensor) -> Dict[str, tf.Tensor]:
+    """Parse a serialized shard record"""
+    return tf.io.parse_single_example(record, FEATURES)
+
+
+def shard_dataset(
+    shard_dir: str,
+    split: str,
+    image_size: Tuple[int, int] = (224, 224),
+    batch_size: int = 32,
+    shuffle: bool = True,
+    cycle_length: Optional[int] = None,
+    shuffle_buffer: int = 1024,
+    seed: Optional[int] = None
+) -> tf.data.Dataset:
+    """
+    Stream a split's shards as (images, labels) batches.
+
+    Shards are read concurrently with interleave, so each reader streams
+    one large file sequentially. Pixels are float 0-255, as from
+    image_dataset_from_directory.
+
+    Args:
+        shard_dir: Directory written by export_shards()
+        split: Split to read
+        image_size: Output image size
+        batch_size: Images per batch
+        shuffle: Shuffle shard order and records (training)
+        cycle_length: Shards read at once (default: tf.data autotune)
+        shuffle_buffer: Records in the shuffle buffer
+        seed: Shuffle seed
+
+    Returns:
+        Batched dataset of (images, class ids)
+    """
+    index = load_index(shard_dir)
+    if split not in index["splits"]:
+        raise ValueError(f"No {split} shards in {shard_dir}")
+    files = [str(Path(shard_dir) / shard["path"]) for shard in index["splits"][split]["shards"]]
+
+    def decode(record):
+        features = parse_record(record)
+        image = tf.io.decode_image(features['image'], channels=3, expand_animations=False)
+        image = tf.image.resize(image, image_size)
+        return image, tf.cast(features['label'], tf.int32)
+
+    dataset = tf.data.Dataset.from_tensor_slices(files)
+    if shuffle:
+        dataset = dataset.shuffle(len(files), seed=seed, reshuffle_each_iteration=True)
+    dataset = dataset.interleave(
+        lambda path: tf.data.TFRecordDataset(path, buffer_size=8 * 1024 * 1024),
+        cycle_length=cycle_length or tf.data.AUTOTUNE,
+        num_parallel_calls=tf.data.AUTOTUNE,
+        deterministic=not shuffle
+    )
+    if shuffle:
+        dataset = dataset.shuffle(shuffle_buffer, seed=seed, reshuffle_each_iteration=True)
+    dataset = dataset.map(decode, num_parallel_calls=tf.data.AUTOTUNE)
+    return dataset.batch(batch_size).prefetch(tf.data.AUTOTUNE)
+
+
+class ShardIndex:
+    """
+    Random access to shard records by position within a split.
+    """
+
+    def __init__(self, shard_dir: str):
+        """
+        Initialize the index.
+
+        Args:
+            shard_dir: Directory written by export_shards()
+        """
+        self.shard_dir = Path(shard_dir)
+        self.index = load_index(shard_dir)
+        self._offsets = {}
+
+    def __len__(self) -> int:
+        return sum(split["records"] for split in self.index["splits"].values())
+
+    def _locate(self, split: str, position: int) -> Tuple[Dict, int]:
+        for shard in self.index["splits"][split]["shards"]:
+            if position < shard["records"]:
+                return shard, position
+            position -= shard["records"]
+        raise IndexError(f"{split} has {self.index['splits'][split]['records']} records")
+
+    def record(self, split: str, position: int) -> Dict:
+        """
+        Read one record.
+
+        Args:
+            split: Split the record belongs to
+            position: Record number within the split
+
+        Returns:
+            Dictionary with image bytes, label, class, sha256 and filename
+        """
+        shard, local = self._locate(split, position)
+        if shard["path"] not in self._offsets:
+            self._offsets[shard["path"]] = np.fromfile(self.shard_dir / shard["index"], dtype='<u8')
+        offset = int(self._offsets[shard["path"]][local])
+
+        with open(self.shard_dir / shard["path"], 'rb') as f:
+            f.seek(offset)
+            length = int(np.frombuffer(f.read(8), dtype='<u8')[0])
+            f.seek(4, os.SEEK_CUR)
+            example = tf.train.Example.FromString(f.read(length))
+
+        feature = example.features.feature
+        return {
+            "image": feature['image'].bytes_list.value[0],
+            "label": feature['label'].int64_list.value[0],
+            "class": feature['class'].bytes_list.value[0].decode('utf-8'),
+            "sha256": feature['sha256'].bytes_list.value[0].decode('ascii'),
+            "filename": feature['filename'].bytes_list.value[0].decode('utf-8')
+        }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Packed TFRecord shards of a dataset version")
+    parser.add_argument("command", choices=["export", "inspect"])
+    parser.add_argument("--manifest", help="DatasetManager manifest JSON (export)")
+    parser.add_argument("--output", required=True, help="Shard directory")
+    parser.add_argument("--shard_size_mb", type=int, default=128)
+    parser.add_argument("--workers", type=int, default=None, help="Shards written concurrently")
+    parser.add_argument("--split", default="train", help="Split to inspect")
+    parser.add_argument("--position", type=int, default=0, help="Record to inspect")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        if not args.manifest:
+            parser.error("export requires --manifest")
+        export_shards(args.manifest, args.output, args.shard_size_mb, args.workers)
+    else:
+        record = ShardIndex(args.output).record(args.split, args.position)
+        print(f"[SHARDS] {args.split}[{args.position}]: {record['filename']} "
+              f"class={record['class']} label={record['label']} "
+              f"sha256={record['sha256'][:12]} ({len(record['image'])} bytes)")
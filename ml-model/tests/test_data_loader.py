@@ -0,0 +1,60 @@
+"""
+Unit Tests for the data loader
+
+Run with: pytest tests/test_data_loader.py -v
+"""
+
+import os
+import sys
+
+import numpy as np
+from PIL import Image
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from data_loader import DataLoader
+
+
+def add_images(species_dir, count, seed):
+    """Write random test images into a species directory"""
+    species_dir.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    for i in range(count):
+        pixels = rng.integers(0, 256, (40, 40, 3), dtype=np.uint8)
+        Image.fromarray(pixels).save(species_dir / f"img_{seed}_{i}.png")
+
+
+def count_images(dataset):
+    return sum(int(images.shape[0]) for images, _ in dataset)
+
+
+class TestTfDatasetCache:
+    """Test the on-disk tf.data decode cache"""
+
+    def test_cache_follows_file_list(self, tmp_path):
+        """Adding images doesn't replay the old cache file"""
+        dataset_path = tmp_path / "data"
+        cache_dir = tmp_path / "tfdata"
+        for disease in ("blight", "healthy"):
+            add_images(dataset_path / "disease_images" / disease / "tomato", 10, seed=len(disease))
+
+        def stream():
+            data_loader = DataLoader(str(dataset_path), image_size=(32, 32))
+            data_loader.prepare_data()
+            expected = len(data_loader.list_image_files("train")[0])
+            dataset = data_loader.get_tf_dataset("train", batch_size=4, shuffle=False, cache_dir=str(cache_dir))
+            return expected, count_images(dataset)
+
+        expected, streamed = stream()
+        assert streamed == expected
+        cache_files = set(os.listdir(cache_dir))
+
+        # Same files: the cache is reused
+        assert stream()[1] == expected
+        assert set(os.listdir(cache_dir)) == cache_files
+
+        add_images(dataset_path / "disease_images" / "blight" / "tomato", 10, seed=99)
+        expected_after, streamed_after = stream()
+        assert expected_after > expected
+        assert streamed_after == expected_after
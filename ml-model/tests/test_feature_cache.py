@@ -0,0 +1,67 @@
+"""
+Unit Tests for the bottleneck feature cache
+
+Run with: pytest tests/test_feature_cache.py -v
+"""
+
+import os
+import sys
+
+import numpy as np
+import tensorflow as tf
+from tensorflow import keras
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from feature_cache import BottleneckFeatureCache, file_fingerprint
+
+
+def extractor(image_size):
+    inputs = keras.Input(shape=image_size + (3,))
+    return keras.Model(inputs, keras.layers.GlobalAveragePooling2D()(inputs))
+
+
+def dataset(image_size, count, value):
+    images = np.full((count,) + image_size + (3,), value, dtype=np.float32)
+    return tf.data.Dataset.from_tensor_slices((images, np.zeros(count, dtype=np.int32))).batch(2)
+
+
+class TestFeatureCacheInvalidation:
+    """Test that cached features follow their source files and image size"""
+
+    def test_recomputes_on_fingerprint_change(self, tmp_path):
+        """Changed source files invalidate the entry"""
+        image = tmp_path / "img.jpg"
+        image.write_bytes(b"a")
+        cache = BottleneckFeatureCache(str(tmp_path / "cache"))
+        fingerprint = file_fingerprint([str(image)])
+
+        features, _ = cache.get_or_compute(extractor((8, 8)), dataset((8, 8), 4, 1.0), "default", "test", "train",
+                                           fingerprint)
+        assert features.shape == (4, 3)
+        assert cache.exists("default", "test", "train", fingerprint, (8, 8))
+
+        # Same files: the cached features are served without running the dataset
+        features, _ = cache.get_or_compute(extractor((8, 8)), dataset((8, 8), 6, 2.0), "default", "test", "train",
+                                           fingerprint)
+        assert features.shape == (4, 3)
+
+        image.write_bytes(b"changed")
+        new_fingerprint = file_fingerprint([str(image)])
+        assert new_fingerprint != fingerprint
+        assert not cache.exists("default", "test", "train", new_fingerprint)
+        features, _ = cache.get_or_compute(extractor((8, 8)), dataset((8, 8), 6, 2.0), "default", "test", "train",
+                                           new_fingerprint)
+        assert features.shape == (6, 3)
+        np.testing.assert_allclose(np.asarray(features, dtype=np.float32), 2.0)
+
+    def test_recomputes_on_image_size_change(self, tmp_path):
+        """Features computed at another input size are not reused"""
+        cache = BottleneckFeatureCache(str(tmp_path / "cache"))
+        cache.get_or_compute(extractor((8, 8)), dataset((8, 8), 4, 1.0), "default", "test", "train")
+        assert not cache.exists("default", "test", "train", image_size=(16, 16))
+
+        features, _ = cache.get_or_compute(extractor((16, 16)), dataset((16, 16), 2, 3.0), "default", "test", "train")
+        assert features.shape == (2, 3)
+        assert cache.exists("default", "test", "train", image_size=(16, 16))
@@ -0,0 +1,64 @@
+"""
+Unit Tests for the preprocessed image cache
+
+Run with: pytest tests/test_image_cache.py -v
+"""
+
+import os
+import sys
+
+import numpy as np
+from PIL import Image
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from data_loader import DataLoader
+from image_cache import ImageCache
+
+
+def make_dataset(dataset_path):
+    """Write a small disease_images/<disease>/<species> tree"""
+    rng = np.random.default_rng(0)
+    for disease in ("blight", "healthy"):
+        species_dir = dataset_path / "disease_images" / disease / "tomato"
+        species_dir.mkdir(parents=True)
+        for i in range(3):
+            pixels = rng.integers(0, 256, (40, 40, 3), dtype=np.uint8)
+            Image.fromarray(pixels).save(species_dir / f"{disease}_{i}.png")
+
+
+class TestTrainingDatasetSync:
+    """Test syncing the dataset train.py reads"""
+
+    def test_synced_paths_served_from_cache(self, tmp_path, monkeypatch):
+        """Every path DataLoader lists after a sync is a cache hit"""
+        dataset_path = tmp_path / "data"
+        make_dataset(dataset_path)
+        cache = ImageCache(str(tmp_path / "cache"), image_size=(32, 32))
+
+        results = cache.sync_training_dataset(str(dataset_path))
+        assert results["added"] == 6 and not results["failed"]
+
+        # A relative dataset path, as train.py's default ./data is
+        monkeypatch.chdir(tmp_path)
+        data_loader = DataLoader("data", image_size=(32, 32), image_cache=cache)
+        data_loader.prepare_data()
+        image_paths, _, _ = data_loader.list_image_files()
+
+        assert len(image_paths) == 6
+        for image_path in image_paths:
+            cached = cache.get_for_path(image_path)
+            assert cached is not None
+            expected = cached.astype(np.float32) / 255.0
+            np.testing.assert_array_equal(data_loader.load_image(image_path), expected)
+
+    def test_resync_reuses_entries(self, tmp_path):
+        """Syncing again only stats the files"""
+        dataset_path = tmp_path / "data"
+        make_dataset(dataset_path)
+        cache = ImageCache(str(tmp_path / "cache"), image_size=(32, 32))
+        cache.sync_training_dataset(str(dataset_path))
+
+        results = ImageCache(str(tmp_path / "cache"), image_size=(32, 32)).sync_training_dataset(str(dataset_path))
+        assert results == {"added": 0, "cached": 6, "failed": []}
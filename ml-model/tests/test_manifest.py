@@ -0,0 +1,41 @@
+"""
+Unit Tests for the manifest reader and model class lists
+
+Run with: pytest tests/test_manifest.py -v
+"""
+
+import os
+import sys
+
+import pytest
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from manifest import class_id_mapping, class_names_path, load_class_names, save_class_names
+
+
+HEADER = {"classes": [{"id": 1, "name": "healthy"}, {"id": 0, "name": "blight"}]}
+
+
+class TestModelClassNames:
+    """Test mapping manifest class ids onto a model's outputs"""
+
+    def test_round_trip(self, tmp_path):
+        """The class list is kept next to the model file"""
+        model_path = str(tmp_path / "best_model.h5")
+        assert load_class_names(model_path) is None
+
+        save_class_names(model_path, ["rust", "blight"])
+        assert class_names_path(model_path) == str(tmp_path / "best_model.classes.json")
+        assert load_class_names(model_path) == ["rust", "blight"]
+
+    def test_maps_by_name(self):
+        """Manifest ids map to the model output of the same class"""
+        assert class_id_mapping(HEADER, ["blight", "healthy"]) == [0, 1]
+        assert class_id_mapping(HEADER, ["healthy", "rust", "blight"]) == [2, 0]
+
+    def test_refuses_unknown_classes(self):
+        """Classes the model has no output for are rejected"""
+        with pytest.raises(ValueError, match="healthy"):
+            class_id_mapping(HEADER, ["blight", "rust"])
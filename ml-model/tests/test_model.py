@@ -0,0 +1,64 @@
+"""
+Unit Tests for the plant health model
+
+Run with: pytest tests/test_model.py -v
+"""
+
+import os
+import sys
+
+import numpy as np
+import pytest
+from tensorflow import keras
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from model import GradientAccumulationModel
+
+
+def build(model_class, accumulation_steps=1):
+    inputs = keras.Input(shape=(4,))
+    outputs = keras.layers.Dense(
+        3, activation='softmax', kernel_initializer=keras.initializers.GlorotUniform(seed=1)
+    )(inputs)
+    model = model_class(inputs, outputs)
+    model.accumulation_steps = accumulation_steps
+    return model
+
+
+@pytest.fixture
+def data():
+    rng = np.random.default_rng(0)
+    x = rng.random((40, 4)).astype(np.float32)
+    y = np.eye(3, dtype=np.float32)[np.arange(40) % 3]
+    return x, y
+
+
+class TestGradientAccumulation:
+    """Test training with accumulated micro-batch gradients"""
+
+    def test_reports_loss(self, data):
+        """The reported loss is the plain fit() loss, not 0"""
+        x, y = data
+        histories = []
+        for model in (build(keras.Model), build(GradientAccumulationModel, accumulation_steps=3)):
+            # A zero learning rate keeps the weights, so both see the same loss
+            model.compile(optimizer=keras.optimizers.SGD(0.0), loss='categorical_crossentropy')
+            histories.append(model.fit(x, y, batch_size=8, epochs=2, shuffle=False, verbose=0).history)
+
+        plain, accumulated = histories
+        assert accumulated['loss'][0] > 0
+        np.testing.assert_allclose(accumulated['loss'], plain['loss'], rtol=1e-5)
+
+    def test_leftover_micro_batches_reset(self, data):
+        """Micro-batches left over at an epoch end don't carry into the next"""
+        x, y = data
+        model = build(GradientAccumulationModel, accumulation_steps=3)
+        model.compile(optimizer=keras.optimizers.SGD(0.1), loss='categorical_crossentropy')
+
+        # 5 micro-batches per epoch: one optimizer step and 2 leftovers
+        model.fit(x, y, batch_size=8, epochs=1, shuffle=False, verbose=0)
+        assert int(model._accumulation_counter.numpy()) == 0
+        for accumulator in model._accumulated_grads:
+            assert not np.any(accumulator.numpy())
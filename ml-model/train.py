@@ -1,8 +1,20 @@
+import argparse
+import hashlib
 import os
+import sys
+import tempfile
 import json
 import numpy as np
 from pathlib import Path
-from typing import Tuple, List, Dict
+from typing import Tuple, List, Dict, Optional, Union
+
+from cpu_profile import configure_cpu_training, set_cpu_environment
+
+# oneDNN/OpenMP read their settings when TensorFlow is imported, so the
+# --cpu_profile environment has to be in place before the import below
+if __name__ == "__main__" and "--cpu_profile" in sys.argv:
+    set_cpu_environment()
+
 import tensorflow as tf
 from tensorflow import keras
 from tensorflow.keras.callbacks import (
@@ -16,6 +28,15 @@ from datetime import datetime
 from model import PlantHealthModel
 from data_loader import DataLoader
 from evaluate import ModelEvaluator
+from image_cache import ImageCache
+from feature_cache import BottleneckFeatureCache, transfer_head_weights
+from manifest import save_class_names
+from checkpointing import TrainingCheckpointManager, ResumableCheckpoint
+import distributed as dist
+from profiling import ThroughputProfiler
+
+# Input types trained on with fit(dataset) rather than fit(x, y)
+DATASET_TYPES = (tf.data.Dataset, tf.distribute.DistributedDataset)
 
 
 class TrainingPipeline:
@@ -37,7 +58,22 @@ class TrainingPipeline:
         output_dir: str = "./trained_models",
         batch_size: int = 32,
         epochs: int = 50,
-        validation_split: float = 0.2
+        validation_split: float = 0.2,
+        image_cache_dir: str = None,
+        feature_cache_dir: str = None,
+        cpu_profile: bool = False,
+        mixed_precision: str = "auto",
+        micro_batch_size: int = None,
+        early_stopping_patience: int = 5,
+        checkpoint_every: int = 1,
+        keep_checkpoints: int = 3,
+        resume: bool = True,
+        seed: int = 42,
+        distributed: bool = False,
+        histogram_freq: int = 0,
+        profile: bool = False,
+        profile_trace_steps: Optional[Tuple[int, int]] = None,
+        stall_threshold: float = 0.2
     ):
         """
         Initialize the training pipeline.
@@ -45,9 +81,35 @@ class TrainingPipeline:
         Args:
             dataset_path: Path to the dataset directory
             output_dir: Directory to save trained models
-            batch_size: Batch size for training
+            batch_size: Batch size for training (effective batch size per
+                optimizer step when micro_batch_size is set)
             epochs: Maximum number of training epochs
             validation_split: Fraction of data to use for validation
+            image_cache_dir: Preprocessed image cache to read pixels from (optional)
+            feature_cache_dir: Bottleneck feature cache directory
+                (defaults to <output_dir>/feature_cache)
+            cpu_profile: Tune threading/oneDNN for CPU-only training hosts
+            mixed_precision: With cpu_profile, 'auto' (bf16 if supported),
+                'bfloat16' or 'off'
+            micro_batch_size: Split each batch into micro-batches of this size
+                and accumulate gradients, bounding peak memory
+            early_stopping_patience: Epochs without val_loss improvement
+                before stopping
+            checkpoint_every: Full-state checkpoint interval in epochs
+            keep_checkpoints: Checkpoints retained per training stage
+            resume: Continue train()/fine_tune() from the latest checkpoint
+                in <output_dir>/checkpoints written for the same dataset
+                files and batch settings
+            seed: Run seed, reapplied every epoch so resumed runs match
+            distributed: Synchronous data-parallel training across the
+                workers described by TF_CONFIG (batch_size is the global batch)
+            histogram_freq: Epochs between TensorBoard weight histograms
+                (0 disables them; they are expensive on large models)
+            profile: Record step time, data wait, images/s and peak memory
+                per epoch and flag input-pipeline stalls
+            profile_trace_steps: (first, last) global step to capture a
+                TensorBoard profiler trace for (requires profile)
+            stall_threshold: Data-wait fraction of step time flagged as a stall
         """
         self.dataset_path = dataset_path
         self.output_dir = Path(output_dir)
@@ -55,6 +117,58 @@ class TrainingPipeline:
         self.batch_size = batch_size
         self.epochs = epochs
         self.validation_split = validation_split
+        self.image_cache_dir = image_cache_dir
+        self.feature_cache_dir = feature_cache_dir or str(self.output_dir / "feature_cache")
+        self.cpu_profile = cpu_profile
+        self.mixed_precision = mixed_precision
+        
+        # Gradient accumulation: batch_size stays the effective batch size
+        self.micro_batch_size = micro_batch_size or batch_size
+        if batch_size % self.micro_batch_size != 0:
+            raise ValueError(
+                f"batch_size ({batch_size}) must be a multiple of "
+                f"micro_batch_size ({self.micro_batch_size})"
+            )
+        self.accumulation_steps = batch_size // self.micro_batch_size
+        
+        # Multi-worker training; the strategy itself is created in setup()
+        self.distributed = distributed
+        self.strategy = None
+        self.num_workers = dist.num_workers() if distributed else 1
+        self.worker_index = dist.worker_index() if distributed else 0
+        self.is_chief = dist.is_chief() if distributed else True
+        if distributed and self.accumulation_steps > 1:
+            raise ValueError("micro_batch_size is not supported with distributed training")
+        if distributed and batch_size % self.num_workers != 0:
+            raise ValueError(
+                f"batch_size ({batch_size}) must be a multiple of the "
+                f"number of workers ({self.num_workers})"
+            )
+        
+        self.early_stopping_patience = early_stopping_patience
+        self.checkpoint_every = checkpoint_every
+        self.resume = resume
+        self.seed = seed
+        self.run_fingerprint = None
+        self.checkpoint_manager = TrainingCheckpointManager(
+            self.output_dir / "checkpoints", max_to_keep=keep_checkpoints
+        )
+        
+        # Every worker takes part in saving, but only the chief writes to
+        # output_dir; the others write to a scratch directory
+        self.write_dir = self.output_dir
+        self.checkpoint_writer = self.checkpoint_manager
+        if not self.is_chief:
+            self.write_dir = Path(tempfile.mkdtemp(prefix=f"worker{self.worker_index}_"))
+            self.checkpoint_writer = TrainingCheckpointManager(
+                self.write_dir / "checkpoints", max_to_keep=1
+            )
+        
+        self.histogram_freq = histogram_freq
+        self.profile = profile
+        self.profile_trace_steps = profile_trace_steps
+        self.stall_threshold = stall_threshold
+        self.profiler = None
         
         self.model_handler = None
         self.data_loader = None
@@ -68,35 +182,161 @@ class TrainingPipeline:
         """
         print("[SETUP] Initializing training pipeline components...")
         
+        # Threading and precision must be configured before the model is built
+        if self.cpu_profile:
+            self.log_training_info({
+                'cpu_profile': configure_cpu_training(mixed_precision=self.mixed_precision)
+            })
+        
+        # The strategy must exist before the model is built, and the
+        # model's variables are mirrored across workers
+        if self.distributed:
+            self.strategy = dist.create_strategy()
+        
         # Initialize model
-        self.model_handler = PlantHealthModel()
-        self.model_handler.build_model(pretrained=True)
+        self.model_handler = PlantHealthModel(accumulation_steps=self.accumulation_steps)
+        if self.strategy is not None:
+            with self.strategy.scope():
+                self.model_handler.build_model(pretrained=True)
+        else:
+            self.model_handler.build_model(pretrained=True)
+        if self.accumulation_steps > 1:
+            print(f"[SETUP] Accumulating gradients over {self.accumulation_steps} "
+                  f"micro-batches of {self.micro_batch_size}")
         
-        # Initialize data loader
-        self.data_loader = DataLoader(self.dataset_path)
+        # Initialize data loader, reading from the image cache if configured
+        image_cache = ImageCache(self.image_cache_dir) if self.image_cache_dir else None
+        self.data_loader = DataLoader(self.dataset_path, image_cache=image_cache)
         self.data_loader.prepare_data()
         
+        # Checkpoints are only resumed by a run over the same files and settings
+        self.run_fingerprint = self._run_fingerprint()
+        
         # Initialize evaluator
         self.evaluator = ModelEvaluator(self.model_handler)
         
         print("[SETUP] Pipeline setup complete!")
     
-    def get_callbacks(self) -> List[keras.callbacks.Callback]:
+    def _run_fingerprint(self) -> str:
+        """
+        Hash the dataset files and the settings a checkpoint depends on.
+        
+        Returns:
+            Hex digest stored in every checkpoint of the run
+        """
+        settings = {
+            'dataset': self.data_loader.dataset_index.fingerprint(),
+            'batch_size': self.batch_size,
+            'micro_batch_size': self.micro_batch_size,
+            'num_workers': self.num_workers,
+            'seed': self.seed
+        }
+        return hashlib.sha1(json.dumps(settings, sort_keys=True).encode('utf-8')).hexdigest()
+    
+    def _micro_batched(self, dataset: tf.data.Dataset) -> tf.data.Dataset:
+        """
+        Re-batch a dataset into micro-batches for gradient accumulation.
+        
+        Args:
+            dataset: Batched dataset
+            
+        Returns:
+            Dataset batched at micro_batch_size (unchanged without accumulation)
+        """
+        if not isinstance(dataset, tf.data.Dataset) or self.accumulation_steps == 1:
+            return dataset
+        return dataset.unbatch().batch(self.micro_batch_size).prefetch(tf.data.AUTOTUNE)
+    
+    def _training_input(self, dataset):
+        """Apply micro-batching and, when profiling, data-wait instrumentation"""
+        dataset = self._micro_batched(dataset)
+        if self.profiler is not None and isinstance(dataset, tf.data.Dataset):
+            dataset = self.profiler.instrument(dataset)
+        return dataset
+    
+    def _log_profile(self, stage: str):
+        """Store the profiler summary of a training stage in the training log"""
+        if self.profiler is not None:
+            self.log_training_info({f"profile_{stage}": self.profiler.summary()})
+    
+    def distributed_dataset(
+        self,
+        split: str = "train",
+        shuffle: bool = True,
+        augment: bool = False
+    ) -> Tuple[tf.distribute.DistributedDataset, int]:
+        """
+        Build a per-worker sharded input pipeline for distributed training.
+        
+        Each worker lists and decodes only its own shard of the split and
+        batches at batch_size / num_workers. Shards repeat and every worker
+        runs the same number of steps, so no worker waits on the others at
+        the end of an epoch.
+        
+        Args:
+            split: One of 'train', 'val', 'test'
+            shuffle: Whether to shuffle examples every epoch
+            augment: Apply batched random augmentation in the pipeline
+            
+        Returns:
+            Tuple of (distributed dataset, steps per epoch)
+        """
+        if self.strategy is None:
+            raise ValueError("Distributed training is not enabled; call setup() first")
+        
+        num_images = len(self.data_loader.list_image_files(split)[0])
+        steps = max(num_images // self.batch_size, 1)
+        
+        def dataset_fn(input_context):
+            return self.data_loader.get_tf_dataset(
+                split,
+                batch_size=input_context.get_per_replica_batch_size(self.batch_size),
+                shuffle=shuffle,
+                augment=augment,
+                num_shards=input_context.num_input_pipelines,
+                shard_index=input_context.input_pipeline_id
+            ).repeat()
+        
+        return self.strategy.distribute_datasets_from_function(dataset_fn), steps
+    
+    def get_callbacks(
+        self,
+        stage: str = None,
+        resume_from: Optional[Path] = None
+    ) -> List[keras.callbacks.Callback]:
         """
         Create training callbacks.
         
+        Args:
+            stage: Training stage to write full-state checkpoints for
+                (no resumable checkpoints if None)
+            resume_from: Checkpoint to restore callback state from
+        
         Returns:
             List of Keras callbacks
         """
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        checkpoint_path = self.output_dir / f"model_checkpoint_{timestamp}.h5"
-        log_dir = self.output_dir / f"logs_{timestamp}"
+        checkpoint_path = self.write_dir / f"model_checkpoint_{timestamp}.h5"
+        log_dir = self.write_dir / f"logs_{timestamp}"
+        
+        callbacks = []
+        
+        # Profiling runs first so TensorBoard logs its per-epoch stats
+        self.profiler = None
+        if self.profile:
+            self.profiler = ThroughputProfiler(
+                batch_size=self.micro_batch_size,
+                stall_threshold=self.stall_threshold,
+                trace_steps=self.profile_trace_steps,
+                trace_dir=str(log_dir)
+            )
+            callbacks.append(self.profiler)
         
-        callbacks = [
+        callbacks += [
             # Early stopping to prevent overfitting
             EarlyStopping(
                 monitor='val_loss',
-                patience=5,
+                patience=self.early_stopping_patience,
                 restore_best_weights=True,
                 verbose=1
             ),
@@ -118,38 +358,131 @@ class TrainingPipeline:
             # TensorBoard logging
             TensorBoard(
                 log_dir=str(log_dir),
-                histogram_freq=1,
+                histogram_freq=self.histogram_freq,
                 write_graph=True,
-                update_freq='epoch'
+                update_freq='epoch',
+                # Traces are captured by ThroughputProfiler instead
+                profile_batch=0
             )
         ]
         
+        # Full-state checkpoints; must run last to see the other callbacks'
+        # updated state
+        if stage is not None:
+            callbacks.append(ResumableCheckpoint(
+                self.checkpoint_writer,
+                stage,
+                tracked_callbacks=[c for c in callbacks if c is not self.profiler],
+                every_n_epochs=self.checkpoint_every,
+                # Workers draw different augmentation/dropout randomness
+                seed=self.seed + 10007 * self.worker_index,
+                resume_from=resume_from,
+                fingerprint=self.run_fingerprint
+            ))
+        
         return callbacks
     
+    def _restore_checkpoint(self, stage: str) -> Tuple[Optional[Path], Optional[Dict]]:
+        """
+        Restore the model from the latest checkpoint of a training stage.
+        
+        Args:
+            stage: Training stage name
+            
+        Returns:
+            Tuple of (checkpoint path, training state), or (None, None) when
+            starting from scratch
+        """
+        # All workers resume from the chief's checkpoints
+        checkpoint = self.checkpoint_manager.latest(stage)
+        if checkpoint is not None and not self.resume:
+            checkpoint = None
+        elif checkpoint is not None and (
+            self.checkpoint_manager.load_state(checkpoint).get("fingerprint") != self.run_fingerprint
+        ):
+            print(f"[RESUME] {checkpoint} was written for other data or settings; "
+                  f"starting {stage} from scratch")
+            checkpoint = None
+        
+        if checkpoint is None:
+            # Checkpoints of an earlier run would outrank and prune this run's
+            if self.is_chief:
+                self.checkpoint_manager.clear(stage)
+            keras.utils.set_random_seed(self.seed)
+            return None, None
+        
+        state = self.checkpoint_manager.restore(self.model_handler.get_model(), checkpoint)
+        if state["completed"]:
+            print(f"[RESUME] {stage} already completed ({state['epoch']} epochs), "
+                  f"restored final weights from {checkpoint}")
+        else:
+            print(f"[RESUME] Resuming {stage} from epoch {state['epoch']} ({checkpoint})")
+        return checkpoint, state
+    
     def train(
         self,
-        train_images: np.ndarray,
-        train_labels_disease: np.ndarray,
-        train_labels_species: np.ndarray,
-        val_images: np.ndarray = None,
+        train_images: Union[np.ndarray, tf.data.Dataset],
+        train_labels_disease: np.ndarray = None,
+        train_labels_species: np.ndarray = None,
+        val_images: Union[np.ndarray, tf.data.Dataset] = None,
         val_labels_disease: np.ndarray = None,
-        val_labels_species: np.ndarray = None
+        val_labels_species: np.ndarray = None,
+        steps_per_epoch: int = None,
+        validation_steps: int = None
     ) -> Dict:
         """
         Train the model.
         
+        Accepts either in-memory arrays, a batched tf.data.Dataset from
+        DataLoader.get_tf_dataset() or a dataset from distributed_dataset().
+        When a dataset is passed the label arguments are ignored and
+        validation data must also be a dataset.
+        
         Args:
-            train_images: Training images
+            train_images: Training images or a training dataset
             train_labels_disease: Disease labels
             train_labels_species: Species labels
-            val_images: Validation images (optional)
+            val_images: Validation images or dataset (optional)
             val_labels_disease: Validation disease labels (optional)
             val_labels_species: Validation species labels (optional)
+            steps_per_epoch: Steps per epoch, required for repeating
+                (distributed) datasets
+            validation_steps: Validation steps, required for repeating
+                (distributed) validation datasets
             
         Returns:
             Training history dictionary
         """
         print("\n[TRAINING] Starting model training...")
+        
+        checkpoint, state = self._restore_checkpoint("train")
+        if state is not None and state["completed"]:
+            return state["history"]
+        initial_epoch = state["epoch"] if state is not None else 0
+        
+        callbacks = self.get_callbacks(stage="train", resume_from=checkpoint)
+        
+        if isinstance(train_images, DATASET_TYPES):
+            print("[TRAINING] Streaming training data from tf.data pipeline")
+            if val_images is None:
+                print("[WARNING] No validation dataset provided; validation_split "
+                      "is not supported for streaming input")
+            
+            self.history = self.model_handler.get_model().fit(
+                self._training_input(train_images),
+                epochs=self.epochs,
+                initial_epoch=initial_epoch,
+                steps_per_epoch=steps_per_epoch,
+                validation_data=val_images,
+                validation_steps=validation_steps,
+                callbacks=callbacks,
+                verbose=1
+            )
+            
+            self._log_profile("train")
+            print("[TRAINING] Training complete!")
+            return callbacks[-1].history
+        
         print(f"Training samples: {len(train_images)}")
         
         if val_images is None:
@@ -157,16 +490,15 @@ class TrainingPipeline:
         else:
             print(f"[TRAINING] Using provided validation set ({len(val_images)} samples)")
         
-        callbacks = self.get_callbacks()
-        
         self.history = self.model_handler.get_model().fit(
             train_images,
             {
                 'disease_diagnosis': train_labels_disease,
                 'species_identification': train_labels_species
             },
-            batch_size=self.batch_size,
+            batch_size=self.micro_batch_size,
             epochs=self.epochs,
+            initial_epoch=initial_epoch,
             validation_data=(
                 val_images,
                 {
@@ -179,48 +511,148 @@ class TrainingPipeline:
             verbose=1
         )
         
+        self._log_profile("train")
         print("[TRAINING] Training complete!")
-        return self.history.history
+        return callbacks[-1].history
+    
+    def train_head_on_features(
+        self,
+        train_dataset: tf.data.Dataset,
+        val_dataset: tf.data.Dataset = None,
+        dataset_version: str = "default",
+        epochs: int = None
+    ) -> Dict:
+        """
+        Train the dense heads on cached backbone features.
+        
+        The frozen backbone runs once per dataset version to fill the
+        feature cache, and again whenever the dataset files change; every
+        epoch after that only runs the dense heads.
+        Trained head weights are copied back into the full model, ready
+        for fine_tune().
+        
+        Args:
+            train_dataset: Batched training dataset, without augmentation
+            val_dataset: Batched validation dataset (optional)
+            dataset_version: Dataset version used as the cache key; the
+                cached features are also checked against the files of
+                self.data_loader's dataset
+            epochs: Number of head-training epochs (defaults to self.epochs)
+            
+        Returns:
+            Training history dictionary
+        """
+        print("\n[TRAINING] Training heads on cached backbone features...")
+        
+        feature_cache = BottleneckFeatureCache(self.feature_cache_dir)
+        extractor = self.model_handler.get_feature_extractor()
+        architecture = self.model_handler.get_base_model().name
+        fingerprint = self.data_loader.dataset_index.fingerprint() if self.data_loader else None
+        num_classes = {
+            'disease_diagnosis': self.model_handler.disease_classes,
+            'species_identification': self.model_handler.species_classes
+        }
+        
+        train_features, train_labels = feature_cache.get_or_compute(
+            extractor, train_dataset, dataset_version, architecture, "train", fingerprint
+        )
+        head_train = feature_cache.as_dataset(
+            train_features, train_labels, num_classes, batch_size=self.batch_size
+        )
+        
+        head_val = None
+        if val_dataset is not None:
+            val_features, val_labels = feature_cache.get_or_compute(
+                extractor, val_dataset, dataset_version, architecture, "val", fingerprint
+            )
+            head_val = feature_cache.as_dataset(
+                val_features, val_labels, num_classes,
+                batch_size=self.batch_size, shuffle=False
+            )
+        
+        # Start from the current head weights so repeated calls keep training
+        head_model = self.model_handler.build_head_model(train_features.shape[1])
+        transfer_head_weights(head_model, self.model_handler.get_model(), into_head=True)
+        history = head_model.fit(
+            head_train,
+            epochs=epochs or self.epochs,
+            validation_data=head_val,
+            callbacks=self.get_callbacks(),
+            verbose=1
+        )
+        
+        copied = transfer_head_weights(head_model, self.model_handler.get_model())
+        print(f"[TRAINING] Copied {copied} trained head layers into the full model")
+        
+        self.history = history
+        return history.history
     
     def fine_tune(
         self,
-        train_images: np.ndarray,
-        train_labels_disease: np.ndarray,
-        train_labels_species: np.ndarray,
+        train_images: Union[np.ndarray, tf.data.Dataset],
+        train_labels_disease: np.ndarray = None,
+        train_labels_species: np.ndarray = None,
         num_layers: int = 50,
-        epochs: int = 20
+        epochs: int = 20,
+        val_dataset: tf.data.Dataset = None,
+        steps_per_epoch: int = None,
+        validation_steps: int = None
     ):
         """
         Fine-tune the model by unfreezing base layers.
         
         Args:
-            train_images: Training images
+            train_images: Training images or a training dataset
             train_labels_disease: Disease labels
             train_labels_species: Species labels
             num_layers: Number of layers to unfreeze
             epochs: Number of fine-tuning epochs
+            val_dataset: Validation dataset, used when training from a dataset
+            steps_per_epoch: Steps per epoch for repeating (distributed) datasets
+            validation_steps: Validation steps for repeating (distributed) datasets
         """
         print(f"\n[FINE-TUNING] Unfreezing last {num_layers} layers...")
         self.model_handler.unfreeze_base(num_layers=num_layers)
         
+        # Restore after unfreezing so the optimizer state matches the
+        # fine-tuning variable set
+        checkpoint, state = self._restore_checkpoint("fine_tune")
+        if state is not None and state["completed"]:
+            return state["history"]
+        initial_epoch = state["epoch"] if state is not None else 0
+        
         print("[FINE-TUNING] Starting fine-tuning...")
-        callbacks = self.get_callbacks()
+        callbacks = self.get_callbacks(stage="fine_tune", resume_from=checkpoint)
         
-        history = self.model_handler.get_model().fit(
-            train_images,
-            {
-                'disease_diagnosis': train_labels_disease,
-                'species_identification': train_labels_species
-            },
-            batch_size=self.batch_size,
-            epochs=epochs,
-            validation_split=self.validation_split,
-            callbacks=callbacks,
-            verbose=1
-        )
+        if isinstance(train_images, DATASET_TYPES):
+            self.model_handler.get_model().fit(
+                self._training_input(train_images),
+                epochs=epochs,
+                initial_epoch=initial_epoch,
+                steps_per_epoch=steps_per_epoch,
+                validation_data=val_dataset,
+                validation_steps=validation_steps,
+                callbacks=callbacks,
+                verbose=1
+            )
+        else:
+            self.model_handler.get_model().fit(
+                train_images,
+                {
+                    'disease_diagnosis': train_labels_disease,
+                    'species_identification': train_labels_species
+                },
+                batch_size=self.micro_batch_size,
+                epochs=epochs,
+                initial_epoch=initial_epoch,
+                validation_split=self.validation_split,
+                callbacks=callbacks,
+                verbose=1
+            )
         
+        self._log_profile("fine_tune")
         print("[FINE-TUNING] Fine-tuning complete!")
-        return history.history
+        return callbacks[-1].history
     
     def save_model(self, name: str = "plant_health_model"):
         """
@@ -232,10 +664,18 @@ class TrainingPipeline:
         if self.model_handler is None or self.model_handler.model is None:
             raise ValueError("No model to save. Train the model first.")
         
-        model_path = self.output_dir / f"{name}.h5"
-        self.model_handler.model.save(str(model_path))
+        model_path = self.write_dir / f"{name}.h5"
+        model = self.model_handler.model
+        if self.accumulation_steps > 1:
+            # Export a plain functional model so serving needs no custom objects
+            model = keras.Model(model.inputs, model.outputs, name=model.name)
+        model.save(str(model_path))
         print(f"[SAVE] Model saved to {model_path}")
         
+        # Disease output order, for incremental training on manifests
+        if self.data_loader is not None and self.data_loader.disease_classes:
+            save_class_names(str(model_path), self.data_loader.disease_classes)
+        
         return model_path
     
     def save_weights(self, name: str = "plant_health_weights"):
@@ -248,7 +688,7 @@ class TrainingPipeline:
         if self.model_handler is None or self.model_handler.model is None:
             raise ValueError("No model weights to save. Train the model first.")
         
-        weights_path = self.output_dir / f"{name}.weights.h5"
+        weights_path = self.write_dir / f"{name}.weights.h5"
         self.model_handler.model.save_weights(str(weights_path))
         print(f"[SAVE] Weights saved to {weights_path}")
         
@@ -263,7 +703,7 @@ class TrainingPipeline:
         """
         self.training_log.update(info_dict)
         
-        log_path = self.output_dir / "training_log.json"
+        log_path = self.write_dir / "training_log.json"
         with open(log_path, 'w') as f:
             json.dump(self.training_log, f, indent=2, default=str)
         
@@ -271,27 +711,94 @@ class TrainingPipeline:
 
 
 if __name__ == "__main__":
-    # Example usage
+    parser = argparse.ArgumentParser(description="Plant Health Diagnosis Model - Training Pipeline")
+    parser.add_argument("--config", help="Training config JSON (hyperparameters, dataset_path)")
+    parser.add_argument("--dataset_path", help="Dataset directory (overrides the config)")
+    parser.add_argument("--output_dir", default="./trained_models")
+    parser.add_argument("--max_epochs", type=int, default=50)
+    parser.add_argument("--early_stopping_patience", type=int, default=5)
+    parser.add_argument("--image_cache_dir", help="Preprocessed image cache directory")
+    parser.add_argument("--gpu", default="false", help="Accepted for compatibility; TensorFlow uses a GPU when present")
+    parser.add_argument("--no_resume", action="store_true", help="Ignore existing checkpoints and start from scratch")
+    parser.add_argument("--distributed", action="store_true",
+                        help="Multi-worker training from TF_CONFIG (see distributed.py launch)")
+    parser.add_argument("--bootstrap_resamples", type=int, default=1000,
+                        help="Bootstrap resamples for test metric confidence intervals (0 to skip)")
+    parser.add_argument("--profile", action="store_true",
+                        help="Log step time, data wait, images/s and peak memory per epoch")
+    parser.add_argument("--profile_trace_steps", type=int, nargs=2, metavar=("FIRST", "LAST"),
+                        help="Capture a TensorBoard profiler trace for these global steps")
+    parser.add_argument("--cpu_profile", action="store_true",
+                        help="Tune threading and oneDNN for CPU-only hosts (see cpu_profile.py)")
+    parser.add_argument("--mixed_precision", default="auto", choices=["auto", "bfloat16", "off"],
+                        help="With --cpu_profile: bfloat16 when supported (auto), always, or never")
+    args = parser.parse_args()
+    
+    config = {}
+    if args.config:
+        with open(args.config, 'r') as f:
+            config = json.load(f)
+    hyperparameters = config.get("hyperparameters", {})
+    batch_size = hyperparameters.get("batch_size", 32)
+    
     print("=" * 60)
     print("Plant Health Diagnosis Model - Training Pipeline")
     print("=" * 60)
     
-    # Initialize pipeline
+    # Re-running with the same output_dir and data resumes from its latest checkpoint
     pipeline = TrainingPipeline(
-        dataset_path="./data",
-        output_dir="./trained_models",
-        batch_size=32,
-        epochs=50
+        dataset_path=args.dataset_path or config.get("dataset_path", "./data"),
+        output_dir=args.output_dir,
+        batch_size=batch_size,
+        epochs=args.max_epochs,
+        image_cache_dir=args.image_cache_dir,
+        early_stopping_patience=args.early_stopping_patience,
+        resume=not args.no_resume,
+        distributed=args.distributed,
+        profile=args.profile or args.profile_trace_steps is not None,
+        profile_trace_steps=tuple(args.profile_trace_steps) if args.profile_trace_steps else None,
+        cpu_profile=args.cpu_profile,
+        mixed_precision=args.mixed_precision
     )
-    
-    # Setup pipeline
     pipeline.setup()
     
-    # Load data (this would use actual data in production)
-    print("\n[INFO] Use DataLoader to load your training data")
-    print("[INFO] Then call pipeline.train() with the loaded data")
-    print("[INFO] Finally save the model using pipeline.save_model()")
+    if args.distributed:
+        train_ds, train_steps = pipeline.distributed_dataset("train", augment=True)
+        val_ds, val_steps = pipeline.distributed_dataset("val", shuffle=False)
+        history = pipeline.train(train_ds, val_images=val_ds,
+                                 steps_per_epoch=train_steps, validation_steps=val_steps)
+    else:
+        train_ds = pipeline.data_loader.get_tf_dataset("train", batch_size=batch_size, augment=True)
+        val_ds = pipeline.data_loader.get_tf_dataset("val", batch_size=batch_size, shuffle=False)
+        history = pipeline.train(train_ds, val_images=val_ds)
+    
+    pipeline.save_model("best_model")
+    
+    # Final-epoch metrics for RetrainingOrchestrator
+    metrics = {name: values[-1] for name, values in history.items() if values}
+    if "val_disease_diagnosis_accuracy" in metrics:
+        metrics["val_accuracy"] = metrics["val_disease_diagnosis_accuracy"]
+    
+    # Held-out test metrics with bootstrap confidence intervals, so promotion
+    # decisions can tell a real improvement from test-set noise
+    if not args.distributed and pipeline.data_loader.list_image_files("test")[0]:
+        test_metrics = pipeline.evaluator.evaluate_streaming(
+            pipeline.data_loader.get_tf_dataset("test", batch_size=batch_size, shuffle=False),
+            bootstrap_resamples=args.bootstrap_resamples
+        )
+        disease = test_metrics["disease"]
+        metrics["test_samples"] = test_metrics["test_samples"]
+        metrics["test_accuracy"] = disease["accuracy"]
+        metrics["test_f1_score"] = disease["f1_score"]
+        intervals = disease.get("confidence_intervals")
+        if intervals:
+            metrics["test_accuracy_ci"] = intervals["accuracy"]
+            metrics["test_f1_score_ci"] = intervals["f1_score"]
+            metrics["test_per_class_recall_ci"] = intervals["per_class_recall"]
+    
+    with open(pipeline.write_dir / "metrics.json", 'w') as f:
+        json.dump(metrics, f, indent=2)
     
     print("\n" + "=" * 60)
-    print("Training pipeline ready for use!")
+    print("Training complete!")
     print("=" * 60)
@@ -1,32 +1,40 @@
+import json
 import os
+from pathlib import Path
 import tensorflow as tf
 from tensorflow import keras
 
+from checkpointing import ResumableCheckpoint, TrainingCheckpointManager
+from feature_cache import BottleneckFeatureCache, file_fingerprint, transfer_head_weights
+from manifest import class_id_mapping, load_class_names, manifest_images, save_class_names
+from shards import load_index, shard_dataset
+from weight_store import resolve_imagenet_weights
+
 DATASET_DIR = 'dataset'
 MODEL_TYPE = os.getenv('MODEL_TYPE', 'MobileNetV2')  # or EfficientNetB0, ResNet50
 BATCH_SIZE = 32
 IMG_SIZE = (224, 224)
 EPOCHS = 25
-
-# Dynamically infer classes
-train_ds = keras.preprocessing.image_dataset_from_directory(
-    DATASET_DIR,
-    validation_split=0.2,
-    subset="training",
-    seed=123,
-    image_size=IMG_SIZE,
-    batch_size=BATCH_SIZE
-)
-val_ds = keras.preprocessing.image_dataset_from_directory(
-    DATASET_DIR,
-    validation_split=0.2,
-    subset="validation",
-    seed=123,
-    image_size=IMG_SIZE,
-    batch_size=BATCH_SIZE
-)
-class_names = train_ds.class_names
-NUM_CLASSES = len(class_names)
+# Train the classifier head on cached backbone features instead of full images
+CACHE_FEATURES = os.getenv('CACHE_FEATURES', 'false').lower() == 'true'
+DATASET_VERSION = os.getenv('DATASET_VERSION', 'default')
+FEATURE_CACHE_DIR = os.getenv('FEATURE_CACHE_DIR', 'feature_cache')
+MODEL_OUTPUT_PATH = os.getenv('MODEL_OUTPUT_PATH', f"models/{MODEL_TYPE.lower()}_plant_model.h5")
+# Incremental warm-start: train the active model on a DatasetManager
+# incremental manifest (version delta + replay sample) instead of the full dataset
+INCREMENTAL_MANIFEST = os.getenv('INCREMENTAL_MANIFEST')
+BASE_MODEL_PATH = os.getenv('BASE_MODEL_PATH')  # defaults to the active registered model
+MODEL_REGISTRY_FILE = os.getenv('MODEL_REGISTRY_FILE', 'performance/model_registry.json')
+INCREMENTAL_EPOCHS = int(os.getenv('INCREMENTAL_EPOCHS', '5'))
+INCREMENTAL_LR = float(os.getenv('INCREMENTAL_LR', '1e-4'))
+# Resumable checkpoints and final-epoch metrics of incremental runs
+# (RetrainingOrchestrator points both into the experiment directory)
+CHECKPOINT_DIR = os.getenv('CHECKPOINT_DIR')
+METRICS_OUTPUT_PATH = os.getenv('METRICS_OUTPUT_PATH')
+# Output trained on the manifest labels of a multi-output model (train.py's PlantHealthModel)
+DISEASE_OUTPUT = 'disease_diagnosis'
+# Read a dataset version packed with `python shards.py export` instead of DATASET_DIR
+SHARD_DIR = os.getenv('SHARD_DIR')
 
 # Data augmentation
 data_augmentation = keras.Sequential([
@@ -40,36 +48,253 @@ def get_preprocessing(height=224, width=224):
         keras.layers.Rescaling(1./255)
     ])
 
-def build_model(model_name='MobileNetV2', input_shape=(224,224,3), num_classes=5):
+def add_head(x, num_classes):
+    x = keras.layers.Dropout(0.2, name='head_dropout')(x)
+    return keras.layers.Dense(num_classes, activation='softmax', name='classifier')(x)
+
+ARCHITECTURES = ('MobileNetV2', 'EfficientNetB0', 'ResNet50')
+
+def build_model(model_name='MobileNetV2', input_shape=(224,224,3), num_classes=5, weights='imagenet'):
+    # weights=None builds a randomly initialised backbone (no download);
+    # 'imagenet' resolves to the local weight store before downloading
+    if weights == 'imagenet' and model_name.lower() in (a.lower() for a in ARCHITECTURES):
+        weights = resolve_imagenet_weights(model_name, input_shape)
     if model_name.lower() == 'mobilenetv2':
-        base_model = keras.applications.MobileNetV2(input_shape=input_shape, include_top=False, weights='imagenet')
+        base_model = keras.applications.MobileNetV2(input_shape=input_shape, include_top=False, weights=weights)
     elif model_name.lower() == 'efficientnetb0':
-        base_model = keras.applications.EfficientNetB0(input_shape=input_shape, include_top=False, weights='imagenet')
+        base_model = keras.applications.EfficientNetB0(input_shape=input_shape, include_top=False, weights=weights)
     elif model_name.lower() == 'resnet50':
-        base_model = keras.applications.ResNet50(input_shape=input_shape, include_top=False, weights='imagenet')
+        base_model = keras.applications.ResNet50(input_shape=input_shape, include_top=False, weights=weights)
     else:
         raise ValueError('Unsupported model name')
     base_model.trainable = False
     inputs = keras.Input(shape=input_shape)
-    x = data_augmentation(inputs)
-    x = get_preprocessing()(x)
+    x = get_preprocessing(*input_shape[:2])(inputs)
     x = base_model(x, training=False)
-    x = keras.layers.GlobalAveragePooling2D()(x)
-    x = keras.layers.Dropout(0.2)(x)
-    outputs = keras.layers.Dense(num_classes, activation='softmax')(x)
+    x = keras.layers.GlobalAveragePooling2D(name='feature_pooling')(x)
+    outputs = add_head(x, num_classes)
     model = keras.Model(inputs, outputs)
     return model
 
-model = build_model(MODEL_TYPE, input_shape=IMG_SIZE + (3,), num_classes=NUM_CLASSES)
-model.compile(optimizer='adam', loss='sparse_categorical_crossentropy', metrics=['accuracy'])
+def build_head_model(feature_dim, num_classes=5):
+    inputs = keras.Input(shape=(feature_dim,))
+    return keras.Model(inputs, add_head(inputs, num_classes))
+
+def load_datasets(augment=True):
+    # Dynamically infer classes
+    train_ds = keras.preprocessing.image_dataset_from_directory(
+        DATASET_DIR,
+        validation_split=0.2,
+        subset="training",
+        seed=123,
+        image_size=IMG_SIZE,
+        batch_size=BATCH_SIZE
+    )
+    val_ds = keras.preprocessing.image_dataset_from_directory(
+        DATASET_DIR,
+        validation_split=0.2,
+        subset="validation",
+        seed=123,
+        image_size=IMG_SIZE,
+        batch_size=BATCH_SIZE
+    )
+    # Augment in the input pipeline so it overlaps with training and stays
+    # out of the saved model used for inference
+    if augment:
+        train_ds = train_ds.map(
+            lambda x, y: (data_augmentation(x, training=True), y),
+            num_parallel_calls=tf.data.AUTOTUNE
+        ).prefetch(tf.data.AUTOTUNE)
+    return train_ds, val_ds
+
+def load_shard_datasets(augment=True):
+    # Each shard is one large sequential read; interleave keeps several open at once
+    index = load_index(SHARD_DIR)
+    class_names = [c['name'] for c in index['classes']]
+    train_ds = shard_dataset(SHARD_DIR, 'train', IMG_SIZE, BATCH_SIZE, shuffle=True, seed=123)
+    val_ds = shard_dataset(SHARD_DIR, 'val', IMG_SIZE, BATCH_SIZE, shuffle=False)
+    if augment:
+        train_ds = train_ds.map(
+            lambda x, y: (data_augmentation(x, training=True), y),
+            num_parallel_calls=tf.data.AUTOTUNE
+        ).prefetch(tf.data.AUTOTUNE)
+    return train_ds, val_ds, class_names
+
+def get_active_model_path(registry_file=MODEL_REGISTRY_FILE):
+    # Written by ModelPerformanceTracker
+    with open(registry_file, 'r') as f:
+        registry = json.load(f)
+    active_id = registry.get('active_model_id')
+    active = next((m for m in registry['models'] if m['model_id'] == active_id), None)
+    if active is None:
+        raise ValueError(f"No active model in {registry_file}")
+    return active['path']
+
+def load_manifest_datasets(manifest_path):
+    # .json or streaming .jsonl; images a diff manifest removed are skipped
+    header, images = manifest_images(manifest_path)
+
+    def decode(path, label):
+        image = tf.io.decode_image(tf.io.read_file(path), channels=3, expand_animations=False)
+        # Same float 0-255 pixels as image_dataset_from_directory
+        return tf.image.resize(image, IMG_SIZE), label
+
+    def make_dataset(images, shuffle):
+        if not images:
+            return None
+        ds = tf.data.Dataset.from_tensor_slices((
+            tf.constant([i['path'] for i in images], dtype=tf.string),
+            tf.constant([i['class_id'] for i in images], dtype=tf.int32)
+        ))
+        if shuffle:
+            ds = ds.shuffle(len(images), seed=123, reshuffle_each_iteration=True)
+        ds = ds.map(decode, num_parallel_calls=tf.data.AUTOTUNE).batch(BATCH_SIZE)
+        return ds.prefetch(tf.data.AUTOTUNE)
+
+    train_images = [i for i in images if i['split'] == 'train']
+    val_images = [i for i in images if i['split'] == 'val']
+    manifest = {**header, 'images': train_images + val_images}
+    return make_dataset(train_images, True), make_dataset(val_images, False), manifest
+
+def train_incremental():
+    # Warm-start from the serving model; epochs cover only the delta and
+    # its replay sample, so wall time follows the size of the change
+    train_ds, val_ds, manifest = load_manifest_datasets(INCREMENTAL_MANIFEST)
+    if train_ds is None:
+        raise ValueError(f"No training images in {INCREMENTAL_MANIFEST}")
+    # Diff manifests hold only the delta
+    sources = [i.get('source', 'delta') for i in manifest['images'] if i['split'] == 'train']
+    print(f"Incremental {manifest['base_version']} -> {manifest['version']}: "
+          f"{sources.count('delta')} new + {sources.count('replay')} replay training images")
 
-history = model.fit(
-    train_ds,
-    validation_data=val_ds,
-    epochs=EPOCHS
-)
+    base_model_path = BASE_MODEL_PATH or get_active_model_path()
+    model = keras.models.load_model(base_model_path, compile=False)
+    trained = model
+    if len(model.outputs) > 1:
+        # Dual-output models from train.py: train the disease head (and the
+        # layers it shares) on the manifest labels; the species head is kept
+        if DISEASE_OUTPUT not in model.output_names:
+            raise ValueError(
+                f"Base model outputs {model.output_names}; incremental training "
+                f"needs a single output or a '{DISEASE_OUTPUT}' output"
+            )
+        trained = keras.Model(model.inputs, model.get_layer(DISEASE_OUTPUT).output)
+        # train.py feeds pixels in [0, 1]
+        train_ds = train_ds.map(lambda x, y: (x / 255.0, y))
+        val_ds = val_ds.map(lambda x, y: (x / 255.0, y)) if val_ds is not None else None
+    # Manifest class ids are sorted names of the version; the model's outputs
+    # follow the class order it was trained with, recorded next to it
+    base_classes = load_class_names(base_model_path)
+    if base_classes is None:
+        raise ValueError(
+            f"Class order of {base_model_path} is unknown; save it with "
+            f"manifest.save_class_names() before incremental training"
+        )
+    if len(base_classes) != trained.output_shape[-1]:
+        raise ValueError(
+            f"{base_model_path} has {trained.output_shape[-1]} outputs but "
+            f"{len(base_classes)} recorded classes"
+        )
+    try:
+        class_ids = class_id_mapping(manifest, base_classes)
+    except ValueError as e:
+        raise ValueError(f"{e} (new: {manifest['new_classes']}); run a full retrain") from e
+    if class_ids != list(range(len(class_ids))):
+        print(f"Remapping manifest class ids to the base model's output order: {class_ids}")
+        remap = tf.constant(class_ids, dtype=tf.int32)
+        train_ds = train_ds.map(lambda x, y: (x, tf.gather(remap, y)))
+        val_ds = val_ds.map(lambda x, y: (x, tf.gather(remap, y))) if val_ds is not None else None
+    print(f"Warm-starting from {base_model_path}")
+
+    trained.compile(
+        optimizer=keras.optimizers.Adam(INCREMENTAL_LR),
+        loss='sparse_categorical_crossentropy',
+        metrics=['accuracy']
+    )
+    train_ds = train_ds.map(
+        lambda x, y: (data_augmentation(x, training=True), y),
+        num_parallel_calls=tf.data.AUTOTUNE
+    )
+
+    callbacks = []
+    initial_epoch = 0
+    if CHECKPOINT_DIR:
+        manager = TrainingCheckpointManager(CHECKPOINT_DIR)
+        checkpoint = manager.latest('incremental')
+        if checkpoint is not None:
+            initial_epoch = manager.restore(trained, checkpoint)['epoch']
+            print(f"Resuming incremental training from epoch {initial_epoch} ({checkpoint})")
+        callbacks.append(ResumableCheckpoint(manager, 'incremental', [], resume_from=checkpoint))
+
+    history = trained.fit(
+        train_ds,
+        validation_data=val_ds,
+        epochs=INCREMENTAL_EPOCHS,
+        initial_epoch=min(initial_epoch, INCREMENTAL_EPOCHS),
+        callbacks=callbacks
+    )
+    # The trained view shares its layers, so the full model is saved
+    model.save(MODEL_OUTPUT_PATH)
+    save_class_names(MODEL_OUTPUT_PATH, base_classes)
+
+    if METRICS_OUTPUT_PATH:
+        # Same final-epoch layout as train.py's metrics.json
+        epochs = callbacks[-1].history if callbacks else history.history
+        metrics = {name: values[-1] for name, values in epochs.items() if values}
+        with open(METRICS_OUTPUT_PATH, 'w') as f:
+            json.dump(metrics, f, indent=2)
+    return history
+
+def train_head_on_cached_features(model, train_ds, val_ds, num_classes):
+    # The backbone is frozen, so its pooled output is computed once per
+    # dataset version and architecture and only the head trains per epoch;
+    # it is recomputed when any file under the dataset directory changes
+    cache = BottleneckFeatureCache(FEATURE_CACHE_DIR)
+    extractor = keras.Model(model.input, model.get_layer('feature_pooling').output)
+    fingerprint = file_fingerprint(p for p in Path(SHARD_DIR or DATASET_DIR).rglob('*') if p.is_file())
+    train_x, train_y = cache.get_or_compute(extractor, train_ds, DATASET_VERSION, MODEL_TYPE, 'train', fingerprint)
+    val_x, val_y = cache.get_or_compute(extractor, val_ds, DATASET_VERSION, MODEL_TYPE, 'val', fingerprint)
+
+    head = build_head_model(train_x.shape[1], num_classes)
+    transfer_head_weights(head, model, into_head=True)
+    head.compile(optimizer='adam', loss='sparse_categorical_crossentropy', metrics=['accuracy'])
+    history = head.fit(
+        cache.as_dataset(train_x, train_y, {}, batch_size=BATCH_SIZE),
+        validation_data=cache.as_dataset(val_x, val_y, {}, batch_size=BATCH_SIZE, shuffle=False),
+        epochs=EPOCHS
+    )
+    transfer_head_weights(head, model)
+    return history
+
+def main():
+    if INCREMENTAL_MANIFEST:
+        train_incremental()
+        return
+
+    # Cached features are computed once, so they must come from unaugmented images
+    if SHARD_DIR:
+        train_ds, val_ds, class_names = load_shard_datasets(augment=not CACHE_FEATURES)
+    else:
+        train_ds, val_ds = load_datasets(augment=not CACHE_FEATURES)
+        class_names = val_ds.class_names
+    num_classes = len(class_names)
+
+    model = build_model(MODEL_TYPE, input_shape=IMG_SIZE + (3,), num_classes=num_classes)
+    model.compile(optimizer='adam', loss='sparse_categorical_crossentropy', metrics=['accuracy'])
+
+    if CACHE_FEATURES:
+        train_head_on_cached_features(model, train_ds, val_ds, num_classes)
+    else:
+        model.fit(
+            train_ds,
+            validation_data=val_ds,
+            epochs=EPOCHS
+        )
 
-model.save(f"models/{MODEL_TYPE.lower()}_plant_model.h5")
+    model.save(MODEL_OUTPUT_PATH)
+    save_class_names(MODEL_OUTPUT_PATH, class_names)
 
-print(f"\nClasses learned: {class_names}")
+    print(f"\nClasses learned: {class_names}")
 
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+"""
+Offline store of pretrained ImageNet backbone weights.
+
+Keras application constructors download ImageNet weights on first use,
+which fails on air-gapped training nodes and slows fresh containers. The
+store keeps the weight files locally with their SHA-256 checksums, and
+resolve_imagenet_weights() hands the verified local file to the
+constructor instead of 'imagenet'. Set WEIGHT_STORE_OFFLINE=true to fail
+rather than download when a file is missing.
+
+Usage:
+    # One-time import from downloaded files or an existing Keras cache
+    python weight_store.py import resnet50_weights_tf_dim_ordering_tf_kernels_notop.h5
+    python weight_store.py import-keras-cache
+
+    python weight_store.py list
+    python weight_store.py verify
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import shutil
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+
+STORE_DIR = os.getenv('WEIGHT_STORE_DIR', str(Path(__file__).resolve().parent / "weights"))
+OFFLINE = os.getenv('WEIGHT_STORE_OFFLINE', 'false').lower() == 'true'
+
+# Input sizes with their own MobileNetV2 weights; Keras uses the 224
+# weights for any other size
+MOBILENET_V2_ROWS = (96, 128, 160, 192, 224)
+
+# MD5 digests Keras verifies its own downloads against (no-top files)
+KERAS_MD5 = {
+    "resnet50_weights_tf_dim_ordering_tf_kernels_notop.h5": "4d473c1dd8becc155b73f8504c6f6626",
+    "efficientnetb0_notop.h5": "50bc09e76180e00e4465e1a485ddc09d"
+}
+
+
+def weight_filename(architecture: str, input_shape: Tuple[int, ...] = (224, 224, 3)) -> str:
+    """
+    Keras file name of an architecture's no-top ImageNet weights.
+
+    Args:
+        architecture: ResNet50, MobileNetV2 or EfficientNetB0
+        input_shape: Model input shape (selects the MobileNetV2 variant)
+
+    Returns:
+        File name as used by the Keras download cache
+    """
+    name = architecture.lower()
+    if name == 'resnet50':
+        return "resnet50_weights_tf_dim_ordering_tf_kernels_notop.h5"
+    if name == 'mobilenetv2':
+        rows = input_shape[0] if input_shape[0] == input_shape[1] and input_shape[0] in MOBILENET_V2_ROWS else 224
+        return f"mobilenet_v2_weights_tf_dim_ordering_tf_kernels_1.0_{rows}_no_top.h5"
+    if name == 'efficientnetb0':
+        return "efficientnetb0_notop.h5"
+    raise ValueError(f"No ImageNet weights known for {architecture}")
+
+
+def _architecture_of(filename: str) -> Optional[str]:
+    """Architecture a Keras weight file name belongs to"""
+    if filename == weight_filename('ResNet50'):
+        return 'ResNet50'
+    if filename == weight_filename('EfficientNetB0'):
+        return 'EfficientNetB0'
+    if re.fullmatch(r"mobilenet_v2_weights_tf_dim_ordering_tf_kernels_1\.0_\d+_no_top\.h5", filename):
+        return 'MobileNetV2'
+    return None
+
+
+def _digests(path: Path, chunk_size: int = 1 << 20) -> Tuple[str, str]:
+    """SHA-256 and MD5 of a file in one pass"""
+    sha256 = hashlib.sha256()
+    md5 = hashlib.md5()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha256.update(chunk)
+            md5.update(chunk)
+    return sha256.hexdigest(), md5.hexdigest()
+
+
+class WeightStore:
+    """
+    Local, checksummed store of pretrained weight files.
+
+    Layout:
+    store_dir/
+      index.json          # file name -> architecture, sha256, size, source
+      resnet50_weights_tf_dim_ordering_tf_kernels_notop.h5
+      ...
+    """
+
+    INDEX_FILE = "index.json"
+
+    def __init__(self, store_dir: str = STORE_DIR):
+        """
+        Initialize the store.
+
+        Args:
+            store_dir: Directory holding the weight files
+        """
+        self.store_dir = Path(store_dir)
+        self.index_file = self.store_dir / self.INDEX_FILE
+        self.index = self._load_index()
+        # Files already verified by this process: name -> (size, mtime)
+        self._verified = {}
+
+    def _load_index(self) -> Dict:
+        if self.index_file.exists():
+            with open(self.index_file, 'r') as f:
+                return json.load(f)
+        return {"files": {}}
+
+    def _save_index(self):
+        tmp_file = self.index_file.with_suffix(".json.tmp")
+        with open(tmp_file, 'w') as f:
+            json.dump(self.index, f, indent=2)
+        os.replace(tmp_file, self.index_file)
+
+    def import_file(
+        self,
+        path: str,
+        architecture: Optional[str] = None,
+        input_shape: Tuple[int, ...] = (224, 224, 3)
+    ) -> Dict:
+        """
+        Copy a weight file into the store and record its checksum.
+
+        Args:
+            path: Weight file to import
+            architecture: Architecture, if the file name isn't a Keras weight name
+            input_shape: Input shape the weights are for (MobileNetV2 only)
+
+        Returns:
+            Index entry of the imported file
+        """
+        path = Path(path)
+        detected = _architecture_of(path.name)
+        if detected:
+            filename = path.name
+            architecture = detected
+        elif architecture:
+            filename = weight_filename(architecture, input_shape)
+        else:
+            raise ValueError(f"Can't tell the architecture of {path.name}; pass architecture")
+
+        sha256, md5 = _digests(path)
+        expected_md5 = KERAS_MD5.get(filename)
+        if expected_md5 and md5 != expected_md5:
+            raise ValueError(f"{path} does not match the published {filename} (md5 {md5})")
+
+        self.store_dir.mkdir(parents=True, exist_ok=True)
+        tmp_file = self.store_dir / f".{filename}.tmp"
+        shutil.copyfile(path, tmp_file)
+        os.replace(tmp_file, self.store_dir / filename)
+
+        entry = {
+            "architecture": architecture,
+            "sha256": sha256,
+            "size": path.stat().st_size,
+            "source": str(path.resolve()),
+            "imported_at": datetime.now().isoformat()
+        }
+        self.index["files"][filename] = entry
+        self._save_index()
+        self._verified.pop(filename, None)
+        print(f"[WEIGHTS] Imported {filename} ({architecture}, {entry['size'] / 1e6:.1f} MB)")
+        return entry
+
+    def import_keras_cache(self, cache_dir: Optional[str] = None) -> List[str]:
+        """
+        Import every known weight file from a Keras download cache.
+
+        Args:
+            cache_dir: Keras models cache (default ~/.keras/models)
+
+        Returns:
+            Imported file names
+        """
+        cache_dir = Path(cache_dir or Path(os.getenv('KERAS_HOME', Path.home() / ".keras")) / "models")
+        imported = []
+        for path in sorted(cache_dir.glob("*.h5")):
+            if _architecture_of(path.name):
+                self.import_file(str(path))
+                imported.append(path.name)
+        return imported
+
+    def path(self, filename: str) -> Optional[Path]:
+        """
+        Get the verified local path of a weight file.
+
+        The checksum is checked once per process (and again if the file
+        changes).
+
+        Args:
+            filename: Keras weight file name
+
+        Returns:
+            Path to the file, or None if it isn't in the store
+        """
+        entry = self.index["files"].get(filename)
+        file_path = self.store_dir / filename
+        if entry is None or not file_path.exists():
+            return None
+
+        stat = file_path.stat()
+        if self._verified.get(filename) != (stat.st_size, stat.st_mtime_ns):
+            sha256, _ = _digests(file_path)
+            if sha256 != entry["sha256"]:
+                raise ValueError(f"Checksum mismatch for {file_path}; re-import it")
+            self._verified[filename] = (stat.st_size, stat.st_mtime_ns)
+        return file_path
+
+    def verify(self) -> Dict[str, bool]:
+        """Check every stored file against its checksum"""
+        results = {}
+        for filename, entry in self.index["files"].items():
+            file_path = self.store_dir / filename
+            results[filename] = file_path.exists() and _digests(file_path)[0] == entry["sha256"]
+        return results
+
+
+_store = None
+
+
+def get_weight_store() -> WeightStore:
+    """Get or create the default store (WEIGHT_STORE_DIR)"""
+    global _store
+    if _store is None:
+        _store = WeightStore()
+    return _store
+
+
+def resolve_imagenet_weights(
+    architecture: str,
+    input_shape: Tuple[int, ...] = (224, 224, 3),
+    offline: Optional[bool] = None
+) -> str:
+    """
+    Resolve the weights argument for a Keras application constructor.
+
+    Args:
+        architecture: ResNet50, MobileNetV2 or EfficientNetB0
+        input_shape: Model input shape
+        offline: Fail instead of downloading when the store lacks the file
+            (defaults to WEIGHT_STORE_OFFLINE)
+
+    Returns:
+        Local weight file path, or 'imagenet' to let Keras download
+    """
+    filename = weight_filename(architecture, input_shape)
+    local_path = get_weight_store().path(filename)
+    if local_path is not None:
+        return str(local_path)
+
+    if OFFLINE if offline is None else offline:
+        raise FileNotFoundError(
+            f"{filename} is not in the weight store {get_weight_store().store_dir}; "
+            f"import it with: python weight_store.py import <path>/{filename}"
+        )
+    print(f"[WEIGHTS] {filename} not in the weight store; downloading (import it to stay offline)")
+    return 'imagenet'
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline pretrained weight store")
+    parser.add_argument("command", choices=["import", "import-keras-cache", "list", "verify"])
+    parser.add_argument("paths", nargs="*", help="Weight files to import")
+    parser.add_argument("--architecture", help="Architecture for files without a Keras weight name")
+    parser.add_argument("--image_size", type=int, default=224, help="Input size (MobileNetV2 variant)")
+    parser.add_argument("--store", default=STORE_DIR, help="Weight store directory")
+    parser.add_argument("--keras_cache", help="Keras models cache (default ~/.keras/models)")
+    args = parser.parse_args()
+
+    store = WeightStore(args.store)
+
+    if args.command == "import":
+        for path in args.paths:
+            store.import_file(path, args.architecture, (args.image_size, args.image_size, 3))
+    elif args.command == "import-keras-cache":
+        imported = store.import_keras_cache(args.keras_cache)
+        print(f"[WEIGHTS] Imported {len(imported)} files from the Keras cache")
+    elif args.command == "list":
+        for filename, entry in store.index["files"].items():
+            print(f"[WEIGHTS] {entry['architecture']:<15} {filename} "
+                  f"({entry['size'] / 1e6:.1f} MB, sha256 {entry['sha256'][:12]})")
+    else:
+        results = store.verify()
+        for filename, ok in results.items():
+            print(f"[WEIGHTS] {'OK  ' if ok else 'FAIL'} {filename}")
+        if not all(results.values()):
+            raise SystemExit(1)